@@ -3,13 +3,17 @@ import numpy as np
 import plotly.graph_objects as go
 from datetime import datetime, timedelta, date
 from sip_utils import *  
+from hdf_reader import SITE_INDEX_SUFFIX, close_hdf, is_hdf_open, iter_sat_products, open_hdf, site_index, timestamps_to_datetime64
+from hdf_parallel import HDF_WORKERS, extract_series
+from series_store import SeriesStore, SeriesView, read_store_meta
+from downloader import DOWNLOAD_SEGMENTS, DownloadError, download_file, is_hdf5_file
+from prefetch import DayPrefetcher, get_prefetcher
+from ephemeris import BroadcastEphemeris, parse_nav
 import pandas as pd
 import json
 from math import radians, sin, cos, sqrt, atan2
-import re
 from streamlit_plotly_events import plotly_events  # Добавляем импорт библиотеки для обработки кликов
 import h5py  # Для работы с HDF файлами
-import requests  # Для загрузки данных
 import sys  # Для прогресс бара
 from pathlib import Path as PathLib  # Для работы с путями
 from dataclasses import dataclass
@@ -22,31 +26,10 @@ import os  # Для работы с файловой системой
 from typing import Union
 from plotly.subplots import make_subplots
 import tempfile
+import shutil
 
 st.set_page_config(page_title="Локализация SIP", layout="wide")
 
-# ==================== PICKLE COMPATIBILITY FIX ====================
-
-# Регистрируем классы в глобальном пространстве имен для pickle совместимости
-def register_classes_for_pickle():
-    """Регистрирует классы в sys.modules['__main__'] для pickle совместимости"""
-    try:
-        import sys
-        current_module = sys.modules[__name__]
-        main_module = sys.modules.get('__main__')
-        
-        if main_module and hasattr(current_module, 'GnssSite'):
-            # Копируем классы в модуль __main__
-            main_module.GnssSite = current_module.GnssSite
-            main_module.GnssSat = current_module.GnssSat
-            main_module.DataProduct = current_module.DataProduct
-            main_module.ColorLimits = current_module.ColorLimits
-            main_module.DataProducts = current_module.DataProducts
-    except Exception as e:
-        print(f"Ошибка регистрации классов: {e}")
-
-# ==================== END PICKLE COMPATIBILITY FIX ====================
-
 # ==================== PERSISTENT DATA STORAGE ====================
 
 # Папка для сохранения данных
@@ -57,6 +40,9 @@ DATA_DIR.mkdir(exist_ok=True)
 HDF_DIR = DATA_DIR / "hdf_files"
 HDF_DIR.mkdir(exist_ok=True)
 
+# Колоночное хранилище извлеченных site-sat данных
+SERIES_DIR = DATA_DIR / "series"
+
 def save_session_data():
     """Сохраняет важные данные сессии в файл"""
     try:
@@ -71,7 +57,6 @@ def save_session_data():
             'hdf_date': st.session_state.get('hdf_date', None),
             'site_sat_data_available': 'site_sat_data' in st.session_state and st.session_state['site_sat_data'] is not None,
             'selected_sites_count': len(st.session_state.get('selected_sites', [])),
-            'nav_file_stations': st.session_state.get('nav_file_stations', None),
             'nav_date_loaded': st.session_state.get('nav_date_loaded', False),
             'nav_date_stations': st.session_state.get('nav_date_stations', None),
             'last_selected_date': st.session_state.get('last_selected_date', None)
@@ -131,67 +116,37 @@ def load_session_data():
     return False
 
 def save_hdf_data():
-    """Сохраняет HDF данные отдельно (они большие)"""
+    """Сохраняет HDF данные отдельно (они большие) в колоночном виде"""
     try:
-        if 'site_sat_data' in st.session_state and st.session_state['site_sat_data']:
-            # Сохраняем site_sat_data
-            with open(DATA_DIR / "site_sat_data.pkl", "wb") as f:
-                pickle.dump(st.session_state['site_sat_data'], f)
-        
-        if 'sat_data' in st.session_state and st.session_state['sat_data']:
-            # Сохраняем sat_data
-            with open(DATA_DIR / "sat_data.pkl", "wb") as f:
-                pickle.dump(st.session_state['sat_data'], f)
-                
-        if 'selected_sites' in st.session_state and st.session_state['selected_sites']:
-            # Сохраняем selected_sites
-            with open(DATA_DIR / "selected_sites.pkl", "wb") as f:
-                pickle.dump(st.session_state['selected_sites'], f)
-                
+        site_sat_data = st.session_state.get('site_sat_data')
+        if isinstance(site_sat_data, SeriesView):
+            # sat_data - другое представление того же хранилища, отдельно не сохраняется
+            selected_sites = [[site.name, float(site.lat), float(site.lon)]
+                              for site in st.session_state.get('selected_sites', [])]
+            site_sat_data.store.save(SERIES_DIR, metadata={'selected_sites': selected_sites})
+        elif site_sat_data:
+            # Ленивые словари продуктов не сохраняются: данные для сохранения извлекаются с columnar=True
+            print("⚠️ site_sat_data не в колоночном хранилище, данные не сохранены")
     except Exception as e:
         # Не показываем ошибку пользователю, просто логируем
         print(f"Ошибка при сохранении HDF данных: {e}")
 
 def load_hdf_data():
-    """Загружает HDF данные"""
+    """Открывает сохраненные HDF данные через memory map (массивы не читаются целиком)"""
     try:
         # Проверяем, существует ли директория для данных
         if not DATA_DIR.exists():
             DATA_DIR.mkdir(exist_ok=True)
             return False
-            
-        # Загружаем site_sat_data
-        site_sat_file = DATA_DIR / "site_sat_data.pkl"
-        if site_sat_file.exists():
-            with open(site_sat_file, "rb") as f:
-                st.session_state['site_sat_data'] = pickle.load(f)
-        
-        # Загружаем sat_data
-        sat_data_file = DATA_DIR / "sat_data.pkl"
-        if sat_data_file.exists():
-            with open(sat_data_file, "rb") as f:
-                st.session_state['sat_data'] = pickle.load(f)
-                
-        # Загружаем selected_sites
-        selected_sites_file = DATA_DIR / "selected_sites.pkl"
-        if selected_sites_file.exists():
-            with open(selected_sites_file, "rb") as f:
-                st.session_state['selected_sites'] = pickle.load(f)
-                
+
+        if (SERIES_DIR / "meta.json").exists():
+            st.session_state['series_store'] = SeriesStore.load(SERIES_DIR)
+            st.session_state['series_metadata'] = read_store_meta(SERIES_DIR)['metadata']
         return True
-    except (pickle.PickleError, ImportError, AttributeError, ModuleNotFoundError) as e:
-        st.warning(f"⚠️ Не удалось загрузить HDF данные: {e}")
-        # Удаляем проблемные файлы
-        try:
-            for file_name in ["site_sat_data.pkl", "sat_data.pkl", "selected_sites.pkl"]:
-                file_path = DATA_DIR / file_name
-                if file_path.exists():
-                    file_path.unlink()
-        except:
-            pass
-        return False
     except Exception as e:
         st.warning(f"⚠️ Не удалось загрузить HDF данные: {e}")
+        # Удаляем поврежденное хранилище
+        shutil.rmtree(SERIES_DIR, ignore_errors=True)
         return False
 
 def clear_all_data():
@@ -200,7 +155,7 @@ def clear_all_data():
         # Создаем папку если её нет
         DATA_DIR.mkdir(exist_ok=True)
         
-        # Удаляем файлы
+        # Удаляем файлы (pkl site-sat данных остались от прежнего формата хранения)
         files_to_clear = ["session_data.pkl", "site_sat_data.pkl", "sat_data.pkl", "selected_sites.pkl"]
         cleared_files = []
         
@@ -210,12 +165,20 @@ def clear_all_data():
                 file_path.unlink()
                 cleared_files.append(file_name)
         
-        # Очищаем HDF файлы
+        if SERIES_DIR.exists():
+            shutil.rmtree(SERIES_DIR)
+            cleared_files.append(SERIES_DIR.name)
+        
+        # Очищаем HDF файлы (открытые дескрипторы закрываются до удаления)
+        close_hdf()
         if HDF_DIR.exists() and HDF_DIR.is_dir():
             hdf_files_count = 0
             for hdf_file in HDF_DIR.glob("*.h5"):
                 hdf_file.unlink()
                 hdf_files_count += 1
+            # Индексы станций рядом с HDF файлами
+            for index_file in HDF_DIR.glob("*.h5" + SITE_INDEX_SUFFIX):
+                index_file.unlink()
             if hdf_files_count > 0:
                 cleared_files.append(f"{hdf_files_count} HDF файлов")
         
@@ -223,7 +186,7 @@ def clear_all_data():
         keys_to_clear = [
             'polygon_points', 'polygon_completed', 'polygon_mode', 'last_selected_structure',
             'ionosphere_data', 'hdf_file_path', 'hdf_date', 'site_sat_data', 'sat_data', 
-            'selected_sites', 'nav_file_stations', 'nav_date_loaded', 'nav_date_stations'
+            'selected_sites', 'uploaded_nav', 'nav_date_loaded', 'nav_date_stations'
         ]
         
         for key in keys_to_clear:
@@ -249,7 +212,6 @@ def init_session_state():
         'map_loaded': False,
         'coords_from_map': False,
         'auto_add_points': True,
-        'nav_file_stations': None,
         'nav_date_loaded': False,
         'nav_date_stations': None,
         'last_selected_date': None
@@ -378,8 +340,42 @@ class DataProducts(Enum):
     timestamp = DataProduct("Timestamp", "timestamp", None)
     time = DataProduct("Time", None, None)
 
-# Регистрируем классы для pickle совместимости после их определения
-register_classes_for_pickle()
+# Столбец SeriesStore для DataProducts.time
+TIME_COLUMN = 'time'
+
+def series_site_view(store: SeriesStore, sites: list[GnssSite] = ()) -> SeriesView:
+    """Представление site -> sat -> DataProducts поверх колоночного хранилища"""
+    sites_by_name = {site.name: site for site in sites}
+    product_keys = {
+        product: product.value.hdf_name
+        for product in DataProducts
+        if product.value.hdf_name in store.columns
+    }
+    if TIME_COLUMN in store.columns:
+        product_keys[DataProducts.time.value] = TIME_COLUMN
+    return store.by_site(
+        site_keys=[
+            sites_by_name.get(name) or GnssSite(name, lat, lon)
+            for name, lat, lon in zip(store.site_names.tolist(), store.site_lat.tolist(), store.site_lon.tolist())
+        ],
+        sat_keys=[GnssSat(name, name[0]) for name in store.sat_names.tolist()],
+        product_keys=product_keys
+    )
+
+def restore_series_data():
+    """Создает представления site_sat_data/sat_data для хранилища, открытого при старте"""
+    store = st.session_state.pop('series_store', None)
+    metadata = st.session_state.pop('series_metadata', {})
+    if store is None:
+        return
+    selected_sites = [GnssSite(name, lat, lon) for name, lat, lon in metadata.get('selected_sites', [])]
+    site_sat_data = series_site_view(store, selected_sites)
+    st.session_state['site_sat_data'] = site_sat_data
+    st.session_state['sat_data'] = site_sat_data.transposed()
+    st.session_state['selected_sites'] = selected_sites
+
+# Хранилище открывается при старте до определения классов, представления создаются здесь
+restore_series_data()
 
 def load_hdf_data(url: str, local_file: PathLib, override: bool = False) -> None:
     """Загружает HDF файл с SIMuRG"""
@@ -393,42 +389,68 @@ def load_hdf_data(url: str, local_file: PathLib, override: bool = False) -> None
         return
 
     with st.spinner(f"📥 Загрузка {local_file.name} с {url}..."):
-        try:
-            # Создаем родительскую директорию, если она не существует
-            local_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(local_file, "wb") as f:
-                response = requests.get(url, stream=True)
-                
-                # Проверяем успешность запроса
-                if response.status_code != 200:
-                    st.error(f"❌ Ошибка при загрузке файла: HTTP {response.status_code}")
-                    return
-                    
-                total_length = response.headers.get('content-length')
+        progress_bar = st.progress(0)
 
-                if total_length is None:
-                    f.write(response.content)
-                else:
-                    dl = 0
-                    total_length = int(total_length)
-                    progress_bar = st.progress(0)
-                    for chunk in response.iter_content(chunk_size=4096):
-                        dl += len(chunk)
-                        f.write(chunk)
-                        done = int(100 * dl / total_length)
-                        progress_bar.progress(done)
-                    progress_bar.empty()
-            
+        def show_progress(downloaded, total):
+            if total:
+                progress_bar.progress(min(100, int(100 * downloaded / total)))
+
+        try:
+            # Докачка через .part файл, проверка HDF5 и атомарное переименование
+            download_file(url, local_file, segments=DOWNLOAD_SEGMENTS,
+                          validate=is_hdf5_file, progress=show_progress)
             st.success(f"✅ Файл {local_file.name} успешно загружен в директорию приложения")
-        except Exception as e:
+        except DownloadError as e:
+            # Частично загруженный .part файл остается для докачки при следующей попытке
             st.error(f"❌ Ошибка при загрузке файла: {e}")
-            # Удаляем частично загруженный файл при ошибке
-            if local_file.exists():
-                try:
-                    local_file.unlink()
-                except:
-                    pass
+        finally:
+            progress_bar.empty()
+
+def release_uploaded_hdf(path: Union[str, PathLib, None]) -> None:
+    """Закрывает дескриптор и удаляет временный файл загруженного пользователем HDF"""
+    if not path:
+        return
+    close_hdf(path)
+    PathLib(path).unlink(missing_ok=True)
+    PathLib(str(path) + SITE_INDEX_SUFFIX).unlink(missing_ok=True)
+
+def hdf_url(day: date) -> str:
+    """Адрес HDF файла SIMuRG за день"""
+    return f"https://simurg.space/gen_file?data=obs&date={day.strftime('%Y-%m-%d')}"
+
+def hdf_local_path(day: date) -> PathLib:
+    """Путь к HDF файлу дня в директории приложения"""
+    return HDF_DIR / day.strftime("%Y-%m-%d.h5")
+
+def fetch_hdf_for_date(day: date) -> PathLib:
+    """Загрузка HDF файла дня без вывода в интерфейс (для фоновой предзагрузки)"""
+    local_file = hdf_local_path(day)
+    if local_file.exists():
+        return local_file
+    return download_file(hdf_url(day), local_file, validate=is_hdf5_file)
+
+def hdf_day_files(day: date) -> list[PathLib]:
+    """Файлы дня, которые учитываются в дисковом лимите предзагрузки"""
+    local_file = hdf_local_path(day)
+    return [local_file, local_file.with_name(local_file.name + SITE_INDEX_SUFFIX)]
+
+def day_prefetcher() -> DayPrefetcher:
+    """Фоновая предзагрузка HDF и nav файлов соседних дней"""
+    return get_prefetcher({'hdf': fetch_hdf_for_date, 'nav': get_nav_file_for_date}, hdf_day_files,
+                          views_file=DATA_DIR / "prefetch_views.json", on_evict=close_hdf, in_use=is_hdf_open)
+
+def view_hdf_date(day: date | None) -> None:
+    """
+    Отмечает просмотр дня, файл которого уже скачан или открыт, и ставит соседние дни в очередь предзагрузки.
+
+    Вызывается при каждом перезапуске скрипта, но срабатывает только при смене дня.
+    """
+    if day is None or st.session_state.get('prefetch_viewed_date') == day:
+        return
+    st.session_state['prefetch_viewed_date'] = day
+    prefetcher = day_prefetcher()
+    prefetcher.viewed(day)
+    prefetcher.prefetch(day)
 
 def get_sites_from_hdf(local_file: Union[str, PathLib], min_lat: float = -90, max_lat: float = 90, 
                       min_lon: float = -180, max_lon: float = 180) -> list[GnssSite]:
@@ -440,72 +462,86 @@ def get_sites_from_hdf(local_file: Union[str, PathLib], min_lat: float = -90, ma
             st.error(f"❌ Ошибка: {path} не является файлом или не существует")
             return []
             
-        with h5py.File(local_file, 'r') as f:
-            sites_names = list(f.keys())
-            sites = []
-            for site_name in sites_names:
-                if site_name in f:
-                    site_info = f[site_name].attrs
-                    site_lat = np.degrees(site_info['lat'])
-                    site_lon = np.degrees(site_info['lon'])
-                    if min_lat < site_lat < max_lat and min_lon < site_lon < max_lon:
-                        sites.append(GnssSite(site_name, site_lat, site_lon))
-            return sites
+        # Координаты станций берутся из индекса рядом с файлом, а не из атрибутов каждой группы
+        index = site_index(path)
+        selected = np.nonzero(index.region_mask(min_lat, max_lat, min_lon, max_lon))[0]
+        return [GnssSite(str(index.names[i]), float(index.lat[i]), float(index.lon[i])) for i in selected]
     except Exception as e:
         st.error(f"❌ Ошибка при чтении HDF файла: {e}")
         return []
 
-def retrieve_visible_sats_data(local_file: Union[str, PathLib], sites: list[GnssSite]) -> dict[GnssSite, dict[GnssSat, dict[DataProduct, NDArray]]]:
-    """Извлекает данные спутников для заданных станций"""
-    from datetime import datetime
-    from dateutil import tz
-    
-    _UTC = tz.gettz('UTC')
-    
+# Продукты, которые читаются, если вызывающий код не указал свой набор
+ALL_PRODUCTS = tuple(DataProducts)
+
+def retrieve_visible_sats_data(local_file: Union[str, PathLib], sites: list[GnssSite],
+                               products=ALL_PRODUCTS, time_window=None, workers: int = 1,
+                               columnar: bool = False) -> dict[GnssSite, dict[GnssSat, dict[DataProduct, NDArray]]]:
+    """
+    Извлекает данные спутников для заданных станций.
+
+    Файл остаётся открытым, а данные пары (станция, спутник) читаются лениво:
+    массив продукта загружается из файла при первом обращении к нему.
+    При columnar=True (данные будут сохраняться на диск) или workers > 1 продукты
+    читаются сразу в SeriesStore; при workers > 1 станции делятся между процессами.
+
+    Args:
+        local_file: путь к HDF файлу
+        sites: станции
+        products: нужные продукты DataProducts; остальные не читаются
+        time_window: окно времени (start, end) - читаются только отсчёты окна, спутники без них пропускаются
+        workers: число процессов для чтения; 1 - чтение в текущем процессе
+        columnar: читать в SeriesStore и при одном процессе (его сохраняет save_hdf_data)
+
+    Returns:
+        dict: data[site][sat] - словарь продуктов (LazyProducts); при columnar=True или
+            workers > 1 - представление SeriesView поверх колоночного хранилища SeriesStore
+    """
     try:
         # Проверяем, что путь указывает на файл, а не директорию
         path = local_file if isinstance(local_file, PathLib) else PathLib(local_file)
         if not path.is_file():
             st.error(f"❌ Ошибка: {path} не является файлом или не существует")
             return {}
-            
-        with h5py.File(local_file, 'r') as f:
-            data = {}
-            for site in sites:
-                if site.name not in f:
-                    continue
-                data[site] = {}
-                sats = f[site.name].keys()
-                for sat_name in sats:
-                    sat = GnssSat(sat_name, sat_name[0])
-                    try:
-                        # Проверяем наличие данных timestamp
-                        if DataProducts.timestamp.value.hdf_name not in f[site.name][sat.name]:
-                            continue
-                            
-                        timestamps = f[site.name][sat.name][DataProducts.timestamp.value.hdf_name][:]
-                        times = [datetime.fromtimestamp(t).replace(tzinfo=_UTC) for t in timestamps]
-                        
-                        # Создаем словарь данных для спутника
-                        data[site][sat] = {DataProducts.time.value: np.array(times)}
-                        
-                        # Загружаем все остальные продукты данных
-                        for data_product in DataProducts:
-                            if data_product.value.hdf_name is None:
-                                continue
-                            if data_product.value.hdf_name in f[site.name][sat.name]:
-                                data[site][sat][data_product] = f[site.name][sat.name][data_product.value.hdf_name][:]
-                                
-                    except Exception as e:
-                        st.warning(f"⚠️ Ошибка при обработке спутника {sat_name} для станции {site.name}: {e}")
-                        continue
-            return data
+
+        datasets = {
+            product: product.value.hdf_name
+            for product in products
+            if product.value.hdf_name is not None
+        }
+        # time нет в HDF, он вычисляется из timestamp: datetime64[s], UTC
+        timestamp_name = DataProducts.timestamp.value.hdf_name
+        derived = {}
+        if DataProducts.time in products:
+            derived[DataProducts.time.value] = (timestamp_name, timestamps_to_datetime64)
+
+        sites_by_name = {site.name: site for site in sites}
+        if columnar or workers > 1:
+            store = extract_series(path, list(sites_by_name), list(datasets.values()),
+                                   window=time_window, workers=workers)
+            if DataProducts.time in products:
+                # Время считается сразу по всему столбцу
+                store.add_column(TIME_COLUMN, timestamps_to_datetime64(store.columns[timestamp_name]),
+                                 store.present[timestamp_name])
+            # Станции без спутников в хранилище не попадают
+            return series_site_view(store, sites)
+
+        f = open_hdf(path)
+        data = {site: {} for site in sites if site.name in f}
+        for site_name, sat_name, sat_products in iter_sat_products(
+            path, list(sites_by_name), datasets, derived,
+            required=timestamp_name, window=time_window
+        ):
+            data[sites_by_name[site_name]][GnssSat(sat_name, sat_name[0])] = sat_products
+        return data
     except Exception as e:
         st.error(f"❌ Ошибка при извлечении данных: {e}")
         return {}
 
 def reorder_data_by_sat(data: dict[GnssSite, dict[GnssSat, dict[DataProduct, NDArray]]]) -> dict[GnssSat, dict[GnssSite, dict[DataProduct, NDArray]]]:
     """Переупорядочивает данные по спутникам"""
+    if isinstance(data, SeriesView):
+        # Для колоночного хранилища это другое представление тех же данных, без копирования
+        return data.transposed()
     _data = defaultdict(dict)
     for site in data:
         for sat in data[site]:
@@ -582,93 +618,22 @@ def calculate_polygon_bounds(polygon_points):
         'lon_span': max(lons) - min(lons)
     }
 
-def parse_nav_file(nav_file_content):
-    """Парсинг NAV файла для извлечения станций и их координат"""
+def parse_nav_file(nav_file_content) -> BroadcastEphemeris | None:
+    """
+    Разбор загруженного NAV файла (RINEX 3, можно .gz) в эфемериды.
+    
+    Один и тот же разобранный объект используется для отображения спутников
+    и для расчета SIP за дату файла (через preloaded_nav_info).
+    """
     try:
-        lines = nav_file_content.decode('utf-8').split('\n')
-        stations = []
-        
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-                
-            # Поиск строк с координатами станций (различные форматы RINEX)
-            # Формат 1: SITE LAT LON HEIGHT
-            if re.match(r'^[A-Z0-9]{4}\s+[-+]?\d+\.\d+\s+[-+]?\d+\.\d+', line):
-                parts = line.split()
-                if len(parts) >= 3:
-                    try:
-                        site_name = parts[0]
-                        lat = float(parts[1])
-                        lon = float(parts[2])
-                        
-                        # Проверяем валидность координат
-                        if -90 <= lat <= 90 and -180 <= lon <= 180:
-                            stations.append({
-                                'name': site_name,
-                                'lat': lat,
-                                'lon': lon,
-                                'color': 'red'  # Цвет для станций из NAV файла
-                            })
-                    except (ValueError, IndexError):
-                        continue
-            
-            # Формат 2: Поиск заголовков RINEX с APPROX POSITION XYZ
-            elif 'APPROX POSITION XYZ' in line and len(line.split()) >= 4:
-                try:
-                    # Извлекаем XYZ координаты и конвертируем в lat/lon
-                    parts = line.split()
-                    x = float(parts[0])
-                    y = float(parts[1])
-                    z = float(parts[2])
-                    
-                    # Простая конверсия XYZ в lat/lon (приблизительная)
-                    r = sqrt(x*x + y*y + z*z)
-                    if r > 0:
-                        lat = np.degrees(np.arcsin(z/r))
-                        lon = np.degrees(np.arctan2(y, x))
-                        
-                        if -90 <= lat <= 90 and -180 <= lon <= 180:
-                            stations.append({
-                                'name': f'STA_{len(stations)+1:03d}',
-                                'lat': lat,
-                                'lon': lon,
-                                'color': 'red'
-                            })
-                except (ValueError, IndexError, ZeroDivisionError):
-                    continue
-            
-            # Формат 3: Поиск строк с MARKER NAME
-            elif 'MARKER NAME' in line:
-                try:
-                    # Извлекаем имя станции из заголовка RINEX
-                    site_name = line.split()[0][:4]  # Первые 4 символа как имя станции
-                    if site_name and len(site_name) == 4 and site_name.isalnum():
-                        # Ищем координаты в следующих строках (это заглушка)
-                        # В реальном RINEX файле координаты идут отдельно
-                        pass
-                except (ValueError, IndexError):
-                    continue
-                
-        if stations:
-            st.info(f"🔍 Обработано {len(lines)} строк, найдено {len(stations)} станций")
-        
-        return stations
-        
-    except UnicodeDecodeError:
-        # Попробуем другую кодировку
-        try:
-            lines = nav_file_content.decode('latin-1').split('\n')
-            st.warning("⚠️ Файл декодирован с кодировкой latin-1")
-            # Повторяем логику парсинга...
-            return []
-        except Exception as e:
-            st.error(f"Ошибка декодирования файла: {str(e)}")
-            return []
-    except Exception as e:
+        ephemeris = parse_nav(nav_file_content)
+    except (ValueError, OSError, EOFError) as e:
         st.error(f"Ошибка при парсинге NAV файла: {str(e)}")
-        return []
+        return None
+    if not ephemeris.elements:
+        st.warning("⚠️ В NAV файле не найдено записей эфемерид")
+        return None
+    return ephemeris
 
 # Инициализация состояния
 if 'polygon_points' not in st.session_state:
@@ -681,8 +646,6 @@ if 'ionosphere_data' not in st.session_state:
     st.session_state['ionosphere_data'] = None
 if 'last_click_coords' not in st.session_state:
     st.session_state['last_click_coords'] = None
-if 'nav_file_stations' not in st.session_state:
-    st.session_state['nav_file_stations'] = None
 if 'nav_date_stations' not in st.session_state:
     st.session_state['nav_date_stations'] = None
 if 'nav_date_loaded' not in st.session_state:
@@ -1029,12 +992,46 @@ if mode == "Анализ ионосферы":
         if 'ionosphere_data' in st.session_state and st.session_state['ionosphere_data']:
             data = st.session_state['ionosphere_data']
             points = data.get('points', [])
-            
-            if points:
+            sip = data.get('sip')
+
+            if sip is not None and len(sip) > 0:
+                # Колоночный результат SIP: столбцы передаются на карту без перебора точек
+                fig.add_trace(go.Scattergeo(
+                    lon=sip.longitude,
+                    lat=sip.latitude,
+                    mode='markers',
+                    marker=dict(
+                        size=6,
+                        color=np.degrees(sip.elevation),
+                        colorscale='Viridis',
+                        showscale=True,
+                        colorbar=dict(title="Угол места, °", x=1.02),
+                        opacity=0.8,
+                        line=dict(width=0.5, color='white')
+                    ),
+                    customdata=np.stack([
+                        sip.station_column(),
+                        sip.satellite_column(),
+                        np.datetime_as_string(sip.time, unit='s')
+                    ], axis=-1),
+                    hovertemplate='%{customdata[0]} / %{customdata[1]}<br>%{customdata[2]}<extra></extra>',
+                    name='SIP траектории'
+                ))
+            elif points:
                 # Добавляем точки данных на основную карту
-                lats = [p['latitude'] for p in points]
-                lons = [p['longitude'] for p in points]
-                tec_values = [p.get('tec', 0) for p in points]
+                tec_points = data.get('tec_points')
+                if tec_points is not None:
+                    # Точки текстового файла уже в массиве (N, 3), словари не строятся
+                    lats, lons, tec_values = tec_points[:, 0], tec_points[:, 1], tec_points[:, 2]
+                    hover = dict(hovertemplate='TEC: %{marker.color}<br>Index: 0.0<extra></extra>')
+                else:
+                    lats = [p['latitude'] for p in points]
+                    lons = [p['longitude'] for p in points]
+                    tec_values = [p.get('tec', 0) for p in points]
+                    hover = dict(
+                        text=[f"TEC: {tec}<br>Index: {p.get('index', 'N/A')}" for tec, p in zip(tec_values, points)],
+                        hovertemplate='%{text}<extra></extra>'
+                    )
                 
                 fig.add_trace(go.Scattergeo(
                     lon=lons, 
@@ -1049,8 +1046,7 @@ if mode == "Анализ ионосферы":
                         opacity=0.8,
                         line=dict(width=0.5, color='white')
                     ),
-                    text=[f"TEC: {tec}<br>Index: {p.get('index', 'N/A')}" for tec, p in zip(tec_values, points)],
-                    hovertemplate='%{text}<extra></extra>',
+                    **hover,
                     name='Ионосферные данные'
                 ))
 
@@ -1320,8 +1316,8 @@ if mode == "Анализ ионосферы":
                                 elevation_data = sat_data.get(DataProducts.elevation, [])
                                 
                                 if len(tec_data) > 0 and len(roti_data) > 0 and len(time_data) > 0:
-                                    # Преобразуем временные метки в datetime объекты
-                                    time_objects = [datetime.fromtimestamp(t) for t in time_data]
+                                    # Преобразуем временные метки в datetime64
+                                    time_objects = timestamps_to_datetime64(time_data)
                                     
                                     # Создаем фигуру для графика
                                     fig = make_subplots(rows=2, cols=1, 
@@ -1385,9 +1381,9 @@ if mode == "Анализ ионосферы":
                                             type="rect",
                                             xref="x",
                                             yref="paper",
-                                            x0=time_objects[start],
+                                            x0=time_objects[start].item(),
                                             y0=0,
-                                            x1=time_objects[end],
+                                            x1=time_objects[end].item(),
                                             y1=0.45,
                                             line=dict(width=0),
                                             fillcolor="rgba(0,0,0,0.1)",
@@ -1400,9 +1396,9 @@ if mode == "Анализ ионосферы":
                                             type="rect",
                                             xref="x2",
                                             yref="paper",
-                                            x0=time_objects[start],
+                                            x0=time_objects[start].item(),
                                             y0=0.55,
-                                            x1=time_objects[end],
+                                            x1=time_objects[end].item(),
                                             y1=1,
                                             line=dict(width=0),
                                             fillcolor="rgba(0,0,0,0.1)",
@@ -1740,7 +1736,8 @@ if mode == "Анализ ионосферы":
                     
                     try:
                         # Передаем код станции ARTU
-                        data = request_ionosphere_data(selected_date, selected_structure, polygon_coords, station_code)
+                        data = request_ionosphere_data(selected_date, selected_structure, polygon_coords, station_code,
+                                                      preloaded_nav_info=st.session_state.get('uploaded_nav'))
                         
                         if data and 'points' in data and len(data['points']) > 0:
                             st.session_state['ionosphere_data'] = data
@@ -1762,6 +1759,17 @@ if mode == "Анализ ионосферы":
                         st.success(f"✅ Загружено {len(test_data['points'])} тестовых точек")
                         st.rerun()  # Перезагружаем страницу для отображения данных
 
+    # Экспорт SIP траекторий из колоночного результата
+    sip_result = (st.session_state.get('ionosphere_data') or {}).get('sip')
+    if sip_result is not None and len(sip_result) > 0:
+        st.download_button(
+            label=f"📥 Скачать SIP точки в CSV ({len(sip_result)} точек)",
+            data=sip_result.to_csv(),
+            file_name=f"sip_points_{selected_date}.csv",
+            mime="text/csv",
+            key="download_sip_csv"
+        )
+
     # HDF DATA ANALYSIS SECTION
     st.markdown("---")
     st.markdown("### 📊 Анализ HDF данных SIMuRG")
@@ -1785,13 +1793,17 @@ if mode == "Анализ ионосферы":
         if st.button("📥 Загрузить HDF", key="download_hdf_btn"):
             # Формируем URL для загрузки HDF файла
             filename = hdf_date.strftime("%Y-%m-%d.h5")
-            url = f"https://simurg.space/gen_file?data=obs&date={hdf_date.strftime('%Y-%m-%d')}"
+            url = hdf_url(hdf_date)
             
             # Используем путь внутри директории приложения
-            local_path = HDF_DIR / filename
+            local_path = hdf_local_path(hdf_date)
             
             try:
+                # Если день уже качается в фоне, дожидаемся этой загрузки
+                day_prefetcher().wait('hdf', hdf_date)
                 load_hdf_data(url, local_path, override=False)
+                # Скачанный явно день не удаляется при вытеснении предзагруженных дней
+                day_prefetcher().downloaded(hdf_date)
                 st.session_state['hdf_file_path'] = local_path
                 st.session_state['hdf_date'] = hdf_date
                 save_session_data()  # Сохраняем данные
@@ -1815,6 +1827,8 @@ if mode == "Анализ ионосферы":
         
         # Проверяем, что файл существует и не является директорией
         if hdf_path is not None:
+            # День открыт: соседние дни загружаются в фоне (только при смене дня)
+            view_hdf_date(st.session_state.get('hdf_date'))
             st.markdown("### 📋 Site-Sat данные и геометрия")
             
             # Получаем данные из HDF файла
@@ -1854,7 +1868,14 @@ if mode == "Анализ ионосферы":
                             if filtered_sites:
                                 with st.spinner("🛰️ Извлечение site-sat данных..."):
                                     # Получаем данные спутников для выбранных станций
-                                    site_sat_data = retrieve_visible_sats_data(hdf_path, filtered_sites)
+                                    # Данные сразу сохраняются на диск целиком (все продукты, как прежде в pickle),
+                                    # поэтому читаются в колоночное хранилище, при нескольких CPU - параллельно
+                                    site_sat_data = retrieve_visible_sats_data(
+                                        hdf_path, filtered_sites,
+                                        products=ALL_PRODUCTS,
+                                        workers=HDF_WORKERS,
+                                        columnar=True
+                                    )
                                     
                                     if site_sat_data:
                                         # Сохраняем данные в session_state
@@ -1913,8 +1934,8 @@ if mode == "Анализ ионосферы":
                                                         azimuths = sat_data[DataProducts.azimuth]
                                                         timestamps = sat_data[DataProducts.timestamp]
                                                         
-                                                        # Преобразуем временные метки в datetime
-                                                        times = [datetime.fromtimestamp(ts) for ts in timestamps]
+                                                        # Преобразуем временные метки в datetime64
+                                                        times = timestamps_to_datetime64(timestamps)
                                                         
                                                         # Создаем график
                                                         fig = go.Figure()
@@ -2199,8 +2220,8 @@ if mode == "Анализ ионосферы":
                             azimuths = sat_data[DataProducts.azimuth]
                             timestamps = sat_data[DataProducts.timestamp]
                             
-                            # Преобразуем временные метки в datetime
-                            times = [datetime.fromtimestamp(ts) for ts in timestamps]
+                            # Преобразуем временные метки в datetime64
+                            times = timestamps_to_datetime64(timestamps)
                             
                             # Создаем график
                             fig = go.Figure()
@@ -2345,42 +2366,48 @@ if mode == "Анализ ионосферы":
     col_nav, col_data = st.columns(2)
     
     with col_nav:
-        nav_file = st.file_uploader("Навигационный файл (RINEX NAV)", type=["rnx", "nav", "txt"])
+        # Ключ меняется при очистке, чтобы сбросить и сам загрузчик
+        nav_file = st.file_uploader("Навигационный файл (RINEX NAV)", type=["rnx", "nav", "txt", "gz"],
+                                    key=f"nav_file_upload_{st.session_state.get('nav_upload_generation', 0)}")
     
     with col_data:
         data_file = st.file_uploader("Файл временных рядов (ROTI/TEC)", type=["txt", "csv"])
 
-    # Обработка загруженного NAV файла
+    # Обработка загруженного NAV файла: разбирается один раз, а не при каждом перезапуске скрипта
     if nav_file is not None:
-        with st.spinner("📡 Обработка NAV файла..."):
-            nav_stations = parse_nav_file(nav_file.read())
-            
-            if nav_stations:
-                st.session_state['nav_file_stations'] = nav_stations
-                st.success(f"✅ Загружено {len(nav_stations)} станций из NAV файла")
-                
-                # Показываем первые несколько станций
-                if len(nav_stations) > 0:
-                    st.info(f"📍 Примеры станций: {', '.join([s['name'] for s in nav_stations[:5]])}")
-            else:
-                st.warning("⚠️ Не удалось извлечь станции из NAV файла")
-                st.session_state['nav_file_stations'] = None
-
-    # Проверяем, есть ли загруженные станции из NAV файла
-    if st.session_state['nav_file_stations'] is not None:
-        # Используем станции из NAV файла, загруженного пользователем
-        current_stations = st.session_state['nav_file_stations']
+        nav_key = (nav_file.name, nav_file.size)
+        uploaded_nav = st.session_state.get('uploaded_nav')
+        if not uploaded_nav or uploaded_nav.get('key') != nav_key:
+            with st.spinner("📡 Обработка NAV файла..."):
+                ephemeris = parse_nav_file(nav_file.getvalue())
+            # Неудачный разбор тоже запоминается, чтобы не повторять его при каждом перезапуске
+            st.session_state['uploaded_nav'] = {
+                'loaded': ephemeris is not None,
+                'key': nav_key,
+                'name': nav_file.name,
+                'date': ephemeris.day() if ephemeris is not None else None,
+                'ephemeris': ephemeris
+            }
         
-        col_nav_info, col_nav_clear = st.columns([3, 1])
-        with col_nav_info:
-            st.success(f"✅ Используются реальные данные из загруженного NAV файла ({len(current_stations)} станций)")
+        uploaded_nav = st.session_state.get('uploaded_nav')
+        if uploaded_nav['loaded']:
+            ephemeris = uploaded_nav['ephemeris']
+            systems = ", ".join(f"{system}: {info['satellites']}" for system, info in sorted(ephemeris.summary().items()))
+            st.success(f"✅ NAV файл {uploaded_nav['name']} за {uploaded_nav['date']}: {len(ephemeris.satellites)} спутников ({systems})")
+            st.info(f"🛰️ Примеры спутников: {', '.join(ephemeris.satellites[:5])}. Эфемериды используются для расчета SIP за {uploaded_nav['date']}")
+        else:
+            st.warning("⚠️ Не удалось извлечь эфемериды из NAV файла")
         
-        with col_nav_clear:
-            if st.button("🗑️ Очистить NAV", help="Вернуться к стандартным станциям"):
-                st.session_state['nav_file_stations'] = None
-                st.rerun()
-                
-    elif st.session_state.get('nav_date_loaded') and st.session_state.get('nav_date_stations'):
+        if st.button("🗑️ Очистить NAV", help="Не использовать эфемериды загруженного файла для расчета SIP"):
+            st.session_state.pop('uploaded_nav', None)
+            st.session_state['nav_upload_generation'] = st.session_state.get('nav_upload_generation', 0) + 1
+            st.rerun()
+    else:
+        # Файл убран из загрузчика - его эфемериды больше не используются
+        st.session_state.pop('uploaded_nav', None)
+
+    # Станций в NAV файле нет: станции берутся из NAV файла выбранной даты или стандартные
+    if st.session_state.get('nav_date_loaded') and st.session_state.get('nav_date_stations'):
         # Используем станции из автоматически загруженного NAV файла для выбранной даты
         nav_date_stations = st.session_state['nav_date_stations']
         current_stations = [
@@ -2441,13 +2468,20 @@ if mode == "Анализ ионосферы":
         
         # Если файл загружен, сохраняем его
         if uploaded_file is not None:
-            # Сохраняем файл во временный каталог
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.h5') as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_path = tmp_file.name
-            
-            # Сохраняем путь к файлу в состоянии сессии
-            st.session_state['hdf_file'] = tmp_path
+            upload_key = (uploaded_file.name, uploaded_file.size)
+            tmp_path = st.session_state.get('hdf_file')
+            # Временный файл создается один раз на загрузку, а не при каждом перезапуске скрипта
+            if st.session_state.get('hdf_file_key') != upload_key or not tmp_path or not os.path.exists(tmp_path):
+                # Прежний временный файл закрывается и удаляется вместе с извлеченными из него данными
+                release_uploaded_hdf(tmp_path)
+                st.session_state.pop('hdf_data', None)
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.h5') as tmp_file:
+                    tmp_file.write(uploaded_file.getvalue())
+                    tmp_path = tmp_file.name
+                
+                # Сохраняем путь к файлу в состоянии сессии
+                st.session_state['hdf_file'] = tmp_path
+                st.session_state['hdf_file_key'] = upload_key
             st.success(f"✅ Файл загружен: {uploaded_file.name}")
             
             # Кнопка для извлечения данных
@@ -2459,7 +2493,11 @@ if mode == "Анализ ионосферы":
                         
                         if sites:
                             # Извлекаем данные для всех видимых спутников
-                            data = retrieve_visible_sats_data(tmp_path, sites)
+                            data = retrieve_visible_sats_data(
+                                tmp_path, sites,
+                                products=(DataProducts.timestamp, DataProducts.atec,
+                                          DataProducts.roti, DataProducts.elevation)
+                            )
                             
                             if data:
                                 # Сохраняем данные в состоянии сессии
@@ -2506,7 +2544,8 @@ if mode == "Анализ ионосферы":
                 # Кнопка для очистки данных
                 if st.button("🗑️ Очистить данные", use_container_width=True):
                     st.session_state.pop('hdf_data', None)
-                    st.session_state.pop('hdf_file', None)
+                    st.session_state.pop('hdf_file_key', None)
+                    release_uploaded_hdf(st.session_state.pop('hdf_file', None))
                     clear_all_data()
                     st.rerun()
             else:
@@ -2545,15 +2584,18 @@ if mode == "Разметка (Tinder)":
         
         with col_upload1:
             # Формируем URL для загрузки HDF файла
-            filename = selected_date.strftime("simurg_data_%Y-%m-%d.h5")
-            url = f"https://simurg.space/gen_file?data=obs&date={selected_date.strftime('%Y-%m-%d')}"
+            # Общее имя с разделом HDF анализа: файл, предзагруженный в фоне, не качается повторно
+            filename = selected_date.strftime("%Y-%m-%d.h5")
+            url = hdf_url(selected_date)
             
             # Используем путь внутри директории приложения
-            local_path = HDF_DIR / filename
+            local_path = hdf_local_path(selected_date)
             
             if st.button("📥 Загрузить HDF файл", key="download_hdf_tinder"):
                 try:
+                    day_prefetcher().wait('hdf', selected_date)
                     load_hdf_data(url, local_path, override=False)
+                    day_prefetcher().downloaded(selected_date)
                     st.session_state['hdf_file_path'] = local_path
                     st.session_state['hdf_date'] = selected_date
                     save_session_data()  # Сохраняем данные
@@ -2582,6 +2624,7 @@ if mode == "Разметка (Tinder)":
         # Отображаем информацию о загруженном файле
         hdf_path = st.session_state['hdf_file_path']
         st.success(f"✅ HDF файл загружен: {hdf_path.name}")
+        view_hdf_date(st.session_state.get('hdf_date'))
         
         # Создаем две колонки для отображения станций и спутников
         col_stations, col_satellites = st.columns(2)
@@ -2608,7 +2651,11 @@ if mode == "Разметка (Tinder)":
             with col_satellites:
                 # Извлекаем данные для выбранной станции
                 with st.spinner("🛰️ Извлечение данных спутников..."):
-                    site_data = retrieve_visible_sats_data(hdf_path, [selected_site_obj])
+                    site_data = retrieve_visible_sats_data(
+                        hdf_path, [selected_site_obj],
+                        products=(DataProducts.time, DataProducts.atec, DataProducts.roti,
+                                  DataProducts.elevation, DataProducts.azimuth)
+                    )
                     
                     if site_data and selected_site_obj in site_data:
                         # Получаем список спутников
@@ -0,0 +1,357 @@
+"""
+Загрузка больших файлов (SIMuRG gen_file) с докачкой и проверкой целостности.
+
+Данные пишутся во временный файл <файл>.part крупными блоками, состояние
+загрузки (размер, ETag, границы и прогресс сегментов) периодически
+сохраняется рядом в <файл>.part.json. После обрыва загрузка продолжается
+запросом HTTP Range с места остановки. Размер файла для деления на сегменты
+узнаётся запросом HEAD; при загрузке одним сегментом отдельного запроса нет,
+размер берётся из ответа на сам запрос данных (gen_file формирует файл на
+каждый GET). Если сервер поддерживает Range и файл большой, он скачивается
+несколькими сегментами параллельно. Готовый файл проверяется
+(размер, контрольная сумма, пользовательская проверка) и только после этого
+атомарно переименовывается в целевой.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# (подключение, чтение) - gen_file может долго готовить файл перед первым байтом
+DOWNLOAD_TIMEOUT = (10, 300)
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_SEGMENTS = 4
+# Файлы меньше не делятся на сегменты
+MIN_SEGMENT_SIZE = 16 * 1024 * 1024
+PART_SUFFIX = '.part'
+STATE_SUFFIX = '.part.json'
+# Частота вызова progress при параллельной загрузке, секунды
+PROGRESS_INTERVAL = 0.2
+# Прогресс в .part.json сохраняется не чаще, чем раз в столько байт или секунд
+STATE_SAVE_BYTES = 16 * 1024 * 1024
+STATE_SAVE_INTERVAL = 2.0
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+
+class DownloadError(Exception):
+    """Файл не удалось скачать или он не прошёл проверку."""
+
+
+def make_download_session(segments: int = DOWNLOAD_SEGMENTS) -> requests.Session:
+    """Сессия с пулом соединений на segments параллельных запросов."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, segments))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def is_hdf5_file(path: str | Path) -> bool:
+    """Проверка сигнатуры HDF5: сервер при ошибке может вернуть HTML страницу с кодом 200."""
+    with open(path, 'rb') as f:
+        return f.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE
+
+
+def file_checksum(path: str | Path, algorithm: str = 'sha256') -> str:
+    """Контрольная сумма файла (hex), файл читается блоками."""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE * 4), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _response_info(response: requests.Response) -> tuple[int | None, str | None]:
+    """Полный размер ресурса (из Content-Range или Content-Length) и валидатор (ETag или Last-Modified)."""
+    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+    if response.status_code == 206:
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        return (int(total) if total.isdigit() else None), validator
+    length = response.headers.get('Content-Length')
+    return (int(length) if length and length.isdigit() else None), validator
+
+
+def _probe(session: requests.Session, url: str, timeout) -> tuple[int | None, bool, str | None]:
+    """
+    Размер ресурса, поддержка Range и валидатор по запросу HEAD.
+
+    Если сервер не отвечает на HEAD, размер считается неизвестным и файл качается одним сегментом.
+    """
+    response = session.head(url, allow_redirects=True, timeout=timeout)
+    if response.status_code in (405, 501):
+        return None, False, None
+    response.raise_for_status()
+    size, validator = _response_info(response)
+    return size, response.headers.get('Accept-Ranges', '').lower() == 'bytes', validator
+
+
+def _load_state(state_file: Path, url: str, size: int | None, validator: str | None) -> dict | None:
+    """
+    Состояние прерванной загрузки, если оно относится к той же версии файла.
+
+    Неизвестные (None) размер и валидатор не сравниваются: версию файла тогда проверяет If-Range.
+    """
+    if not state_file.exists():
+        return None
+    try:
+        with open(state_file, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('url') != url:
+        return None
+    if size is not None and state.get('size') != size:
+        return None
+    if validator is not None and state.get('validator') != validator:
+        return None
+    return state
+
+
+class _Transfer:
+    """Запись сегментов в .part файл и сохранение прогресса в .part.json."""
+
+    def __init__(self, part_file: Path, state_file: Path, state: dict):
+        self.part_file = part_file
+        self.state_file = state_file
+        self.state = state
+        self.lock = threading.Lock()
+        self.fd = os.open(part_file, os.O_RDWR | os.O_CREAT)
+        self.unsaved = 0
+        self.saved_at = time.monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            self._save_state()
+        os.close(self.fd)
+
+    def downloaded(self) -> int:
+        with self.lock:
+            return sum(next_byte - start for start, _, next_byte in self.state['segments'])
+
+    def write(self, segment: int, data: bytes) -> None:
+        with self.lock:
+            start, end, next_byte = self.state['segments'][segment]
+            os.pwrite(self.fd, data, next_byte)
+            self.state['segments'][segment][2] = next_byte + len(data)
+            # Прогресс пишется после данных: после сбоя он не опережает содержимое файла.
+            # Сохраняется не на каждый блок - после сбоя докачка начнётся чуть раньше
+            self.unsaved += len(data)
+            if self.unsaved >= STATE_SAVE_BYTES or time.monotonic() - self.saved_at >= STATE_SAVE_INTERVAL:
+                self._save_state()
+
+    def restart(self, segment: int, size: int | None = None, validator: str | None = None) -> None:
+        """Сервер проигнорировал Range или файл изменился: сегмент (единственный) качается заново."""
+        with self.lock:
+            self.state['segments'][segment][2] = self.state['segments'][segment][0]
+            self.state['segments'][segment][1] = None if size is None else size - 1
+            self.state['size'], self.state['validator'] = size, validator
+            os.ftruncate(self.fd, 0)
+            self._save_state()
+
+    def learn(self, size: int | None, validator: str | None) -> None:
+        """Размер и валидатор из ответа единственного сегмента, если они не были известны заранее (без HEAD)."""
+        with self.lock:
+            if self.state.get('size') is None and size is not None:
+                self.state['size'] = size
+                self.state['segments'][0][1] = size - 1
+            if self.state.get('validator') is None:
+                self.state['validator'] = validator
+            self._save_state()
+
+    def _save_state(self) -> None:
+        self.unsaved = 0
+        self.saved_at = time.monotonic()
+        tmp = self.state_file.with_name(self.state_file.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_file)
+
+
+def _download_segment(session: requests.Session, url: str, transfer: _Transfer, segment: int,
+                      ranges: bool, chunk_size: int, timeout, retries: int,
+                      cancel: threading.Event | None = None) -> None:
+    """
+    Качает сегмент с повторами; каждая попытка продолжает с места остановки.
+
+    cancel выставляется при ошибке другого сегмента: загрузка и повторы прерываются,
+    скачанное сохраняется для докачки.
+    """
+    for attempt in range(retries + 1):
+        if cancel is not None and cancel.is_set():
+            raise DownloadError("Загрузка прервана ошибкой другого сегмента")
+        start, end, next_byte = transfer.state['segments'][segment]
+        if end is not None and next_byte > end:
+            return
+        if not ranges and next_byte > start:
+            # Без поддержки Range сервер отдаст файл с начала
+            transfer.restart(segment)
+            next_byte = start
+        headers = {}
+        if ranges and (next_byte > 0 or end is not None):
+            headers['Range'] = f"bytes={next_byte}-{'' if end is None else end}"
+            if transfer.state.get('validator'):
+                headers['If-Range'] = transfer.state['validator']
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                size, validator = _response_info(response)
+                if headers.get('Range') and response.status_code != 206:
+                    # Range не принят (или файл изменился - If-Range): только единственный сегмент можно начать заново
+                    if len(transfer.state['segments']) > 1:
+                        raise DownloadError("Сервер перестал поддерживать докачку по сегментам")
+                    transfer.restart(segment, size, validator)
+                elif len(transfer.state['segments']) == 1:
+                    transfer.learn(size, validator)
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if cancel is not None and cancel.is_set():
+                        raise DownloadError("Загрузка прервана ошибкой другого сегмента")
+                    if chunk:
+                        transfer.write(segment, chunk)
+            start, end, next_byte = transfer.state['segments'][segment]
+            if end is None or next_byte > end:
+                return
+            raise requests.exceptions.ChunkedEncodingError("Соединение закрыто до конца сегмента")
+        except requests.exceptions.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            # Ошибки клиента (кроме таймаута и лимита запросов) повтором не исправить
+            if attempt == retries or (status is not None and 400 <= status < 500 and status not in (408, 429)):
+                raise DownloadError(f"Не удалось скачать {url}: {e}") from e
+            if cancel is not None:
+                cancel.wait(min(2 ** attempt, 30))
+            else:
+                time.sleep(min(2 ** attempt, 30))
+
+
+def download_file(url: str, local_file: str | Path, session: requests.Session | None = None,
+                  segments: int = 1, expected_size: int | None = None, checksum: str | None = None,
+                  validate: Callable[[Path], bool] | None = None,
+                  progress: Callable[[int, int | None], None] | None = None,
+                  chunk_size: int = DOWNLOAD_CHUNK_SIZE, timeout=DOWNLOAD_TIMEOUT,
+                  retries: int = DOWNLOAD_RETRIES) -> Path:
+    """
+    Скачивает url в local_file с докачкой, проверкой и атомарным переименованием.
+
+    Args:
+        url: адрес файла
+        local_file: путь к итоговому файлу
+        session: HTTP сессия; по умолчанию создаётся на число сегментов
+        segments: число параллельных сегментов (при поддержке Range и известном размере)
+        expected_size: ожидаемый размер в байтах
+        checksum: ожидаемая контрольная сумма "алгоритм:hex", например "sha256:..."
+        validate: дополнительная проверка готового файла (например, is_hdf5_file)
+        progress: вызывается в текущем потоке как progress(скачано байт, всего байт или None)
+        chunk_size: размер блока чтения и записи
+        timeout: таймауты requests (подключение, чтение)
+        retries: число повторов запроса сегмента после ошибки
+
+    Returns:
+        Path: путь к скачанному файлу
+
+    Raises:
+        DownloadError: ошибка загрузки или проверки; .part файл остаётся для докачки,
+            кроме случая, когда не прошла проверка готового файла
+    """
+    local_file = Path(local_file)
+    local_file.parent.mkdir(parents=True, exist_ok=True)
+    part_file = local_file.with_name(local_file.name + PART_SUFFIX)
+    state_file = local_file.with_name(local_file.name + STATE_SUFFIX)
+    session = session or make_download_session(segments)
+
+    if segments > 1:
+        # Для деления на сегменты размер нужен заранее
+        try:
+            size, ranges, validator = _probe(session, url, timeout)
+        except requests.exceptions.RequestException as e:
+            raise DownloadError(f"Не удалось получить информацию о {url}: {e}") from e
+        if expected_size is not None and size is not None and size != expected_size:
+            raise DownloadError(f"Размер {url} на сервере {size} байт, ожидается {expected_size}")
+    else:
+        # Один сегмент: размер и валидатор придут в ответе на запрос данных, докачка - через Range/If-Range
+        size, ranges, validator = None, True, None
+
+    state = _load_state(state_file, url, size, validator) if part_file.exists() else None
+    if state is None:
+        # Новая загрузка: границы сегментов [start, end (включительно или None), следующий байт]
+        n_segments = max(1, segments) if ranges and size else 1
+        n_segments = min(n_segments, max(1, (size or 0) // MIN_SEGMENT_SIZE))
+        if size:
+            bounds = [size * i // n_segments for i in range(n_segments + 1)]
+            spans = [[bounds[i], bounds[i + 1] - 1, bounds[i]] for i in range(n_segments)]
+        else:
+            spans = [[0, None, 0]]
+        state = {'url': url, 'size': size, 'validator': validator, 'segments': spans}
+        with open(part_file, 'wb'):
+            pass
+
+    transfer = _Transfer(part_file, state_file, state)
+    try:
+        transfer._save_state()
+        jobs = range(len(state['segments']))
+        if len(state['segments']) == 1:
+            # Один сегмент качается в текущем потоке, прогресс - через обёртку записи
+            if progress is not None:
+                write = transfer.write
+
+                def write_with_progress(segment, data):
+                    write(segment, data)
+                    progress(transfer.downloaded(), transfer.state.get('size'))
+                transfer.write = write_with_progress
+            _download_segment(session, url, transfer, 0, ranges, chunk_size, timeout, retries)
+        else:
+            cancel = threading.Event()
+            with ThreadPoolExecutor(max_workers=len(state['segments'])) as executor:
+                futures = [
+                    executor.submit(_download_segment, session, url, transfer, segment,
+                                    ranges, chunk_size, timeout, retries, cancel)
+                    for segment in jobs
+                ]
+                pending = futures
+                while pending:
+                    done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                    if progress is not None:
+                        progress(transfer.downloaded(), size)
+                    for future in done:
+                        if future.exception() is not None:
+                            # Ошибка сегмента прерывает загрузку: остальные сегменты останавливаются,
+                            # не дожидаясь конца своих диапазонов; прогресс сохранён для докачки
+                            cancel.set()
+                            future.result()
+    finally:
+        transfer.close()
+
+    size = state.get('size')
+    # Проверка готового файла до переименования
+    if size is not None and part_file.stat().st_size > size:
+        # Хвост от прежней попытки за пределами файла
+        os.truncate(part_file, size)
+    actual_size = part_file.stat().st_size
+    reasons = []
+    if size is not None and actual_size != size:
+        reasons.append(f"размер {actual_size} байт вместо {size}")
+    if expected_size is not None and actual_size != expected_size:
+        reasons.append(f"размер {actual_size} байт вместо ожидаемых {expected_size}")
+    if checksum is not None:
+        algorithm, _, expected = checksum.partition(':')
+        actual = file_checksum(part_file, algorithm)
+        if actual.lower() != expected.lower():
+            reasons.append(f"контрольная сумма {algorithm} {actual} не совпадает")
+    if not reasons and validate is not None and not validate(part_file):
+        reasons.append("файл не прошёл проверку формата")
+    if reasons:
+        # Повреждённые данные не докачиваются, следующая попытка начнётся заново
+        part_file.unlink(missing_ok=True)
+        state_file.unlink(missing_ok=True)
+        raise DownloadError(f"Файл {local_file.name} не прошёл проверку: {'; '.join(reasons)}")
+
+    os.replace(part_file, local_file)
+    state_file.unlink(missing_ok=True)
+    return local_file
@@ -0,0 +1,456 @@
+"""
+Векторизованный расчёт координат спутников по бортовым эфемеридам RINEX 3 NAV.
+
+Навигационный файл разбирается один раз в массивы записей по каждому спутнику,
+после чего координаты считаются сразу для всего вектора времени средствами NumPy:
+кеплеровская модель для GPS/Galileo/BeiDou/QZSS и численное интегрирование
+(Рунге-Кутта 4 порядка) для ГЛОНАСС.
+"""
+import gzip
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+# --- Константы ---
+GPS_EPOCH = np.datetime64('1980-01-06T00:00:00', 's')
+SECONDS_IN_WEEK = 604800
+BDT_WEEK_OFFSET = 1356          # неделя BDT 0 = неделя GPS 1356
+BDT_GPS_OFFSET = 14             # BDT = GPST - 14 с
+DEFAULT_LEAP_SECONDS = 18       # GPST - UTC, если в заголовке нет LEAP SECONDS
+
+KEPLER_SYSTEMS = {'G', 'E', 'C', 'J'}
+GLONASS_SYSTEM = 'R'
+
+# Гравитационный параметр и угловая скорость вращения Земли по системам
+KEPLER_CONSTANTS = {
+    'G': (3.986005e14, 7.2921151467e-5),
+    'J': (3.986005e14, 7.2921151467e-5),
+    'E': (3.986004418e14, 7.2921151467e-5),
+    'C': (3.986004418e14, 7.2921150e-5),
+}
+
+# Максимальный возраст эфемерид (с) относительно эпохи их привязки
+MAX_EPHEMERIS_AGE = {
+    'G': 4 * 3600,
+    'J': 4 * 3600,
+    'E': 4 * 3600,
+    'C': 2 * 3600,
+    'R': 1 * 3600,
+}
+
+# Параметры ПЗ-90 для интегрирования орбит ГЛОНАСС
+GLO_MU = 398600.4418e9
+GLO_AE = 6378136.0
+GLO_J2 = 1.08262575e-3
+GLO_OMEGA = 7.292115e-5
+GLO_MAX_STEP = 60.0
+
+# Индексы полей кеплеровской записи (строка часов + 7 строк орбиты)
+K_IODE, K_CRS, K_DN, K_M0 = 3, 4, 5, 6
+K_CUC, K_E, K_CUS, K_SQRTA = 7, 8, 9, 10
+K_TOE, K_CIC, K_OMEGA0, K_CIS = 11, 12, 13, 14
+K_I0, K_CRC, K_OMEGA, K_OMEGADOT = 15, 16, 17, 18
+K_IDOT, K_WEEK = 19, 21
+K_HEALTH = 24
+KEPLER_FIELDS = 29
+
+# Индексы полей записи ГЛОНАСС (строка часов + 3 строки орбиты)
+R_X, R_VX, R_AX, R_HEALTH = 3, 4, 5, 6
+R_Y, R_VY, R_AY, R_FREQ = 7, 8, 9, 10
+R_Z, R_VZ, R_AZ = 11, 12, 13
+GLONASS_FIELDS = 15
+
+# Записи: первая строка 'G01 yyyy mm dd hh mm ss' и поля D19.12 (3 в первой строке, по 4 в строках продолжения)
+NAV_EPOCH_WIDTH = 23
+NAV_FIRST_FIELD = 23
+NAV_FIELD_WIDTH = 19
+
+
+@dataclass
+class BroadcastEphemeris:
+    """Разобранный навигационный файл: массивы записей по спутникам.
+
+    elements[sat] - матрица (R, n_fields) параметров записей, отсортированных по toe;
+    toe[sat] - время привязки записей в секундах шкалы GPS от эпохи GPS.
+    iono_corrections - параметры IONOSPHERIC CORR заголовка ({'GPSA': [...], ...}).
+    """
+    version: float
+    leap_seconds: int
+    elements: dict = field(default_factory=dict)
+    toe: dict = field(default_factory=dict)
+    iono_corrections: dict = field(default_factory=dict)
+
+    @property
+    def satellites(self) -> list[str]:
+        return sorted(self.elements.keys())
+
+    def positions(self, sats: list[str], times) -> NDArray:
+        """Координаты ECEF (м) спутников sats на моменты times, форма (n_sats, n_epochs, 3)."""
+        return satellite_positions(self, sats, times)
+
+    def time_span(self) -> tuple[np.datetime64, np.datetime64] | None:
+        """Первое и последнее время привязки записей (шкала GPS)."""
+        if not self.toe:
+            return None
+        first = min(float(toe[0]) for toe in self.toe.values())
+        last = max(float(toe[-1]) for toe in self.toe.values())
+        return (GPS_EPOCH + np.timedelta64(int(first), 's'), GPS_EPOCH + np.timedelta64(int(last), 's'))
+
+    def day(self):
+        """Сутки, к которым относится файл: дата медианного времени привязки записей."""
+        if not self.toe:
+            return None
+        toe = np.concatenate(list(self.toe.values()))
+        return (GPS_EPOCH + np.timedelta64(int(np.median(toe)), 's')).astype('datetime64[D]').item()
+
+    def summary(self) -> dict[str, dict]:
+        """Число спутников и записей по системам."""
+        systems = {}
+        for sat, elements in self.elements.items():
+            info = systems.setdefault(sat[0], {'satellites': 0, 'records': 0})
+            info['satellites'] += 1
+            info['records'] += len(elements)
+        return systems
+
+
+def to_gps_seconds(times) -> NDArray:
+    """Переводит datetime/datetime64 (шкала GPS) в секунды от эпохи GPS."""
+    t = np.asarray(times, dtype='datetime64[ms]')
+    return (t - GPS_EPOCH) / np.timedelta64(1, 's')
+
+
+def _normalize_sat(token: str) -> str | None:
+    """Приводит идентификатор спутника вида 'G01'/'G 1' к форме 'G01'."""
+    system = token[0]
+    number = token[1:3].strip()
+    if not system.isalpha() or not number.isdigit():
+        return None
+    return f"{system}{int(number):02d}"
+
+
+def _iter_lines(source):
+    """Строки навигационного файла (байты) из пути (.rnx или .gz) либо из байтов."""
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+        if data[:2] == b'\x1f\x8b':
+            data = gzip.decompress(data)
+        yield from data.splitlines()
+        return
+    path = Path(source)
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rb') as f:
+        for line in f:
+            yield line.rstrip(b'\r\n')
+
+
+def _to_float(fields: NDArray) -> NDArray:
+    """Поля D19.12 (массив S19) в числа; пустое поле - 0."""
+    fields = fields.copy()
+    fields[fields == b' ' * NAV_FIELD_WIDTH] = b'0'
+    return fields.astype(np.float64)
+
+
+def _epochs_seconds(headers: NDArray) -> NDArray:
+    """Эпохи первых строк записей ('G01 yyyy mm dd hh mm ss', массив S23) в секундах от эпохи GPS."""
+    layout = np.dtype({
+        'names': ['year', 'month', 'day', 'hour', 'minute', 'second'],
+        'formats': ['S4', 'S2', 'S2', 'S2', 'S2', 'S2'],
+        'offsets': [4, 9, 12, 15, 18, 21],
+        'itemsize': NAV_EPOCH_WIDTH,
+    })
+    parts = {name: headers.view(layout)[name].astype(np.int64) for name in layout.names}
+    if np.any((parts['month'] < 1) | (parts['month'] > 12)):
+        raise ValueError("Некорректный месяц эпохи")
+    months = ((parts['year'] - 1970) * 12 + parts['month'] - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (parts['day'] - 1)
+    seconds = (days.astype('datetime64[s]') - GPS_EPOCH).astype(np.int64)
+    return (seconds + parts['hour'] * 3600 + parts['minute'] * 60 + parts['second']).astype(np.float64)
+
+
+def _continuation_lines(system: str) -> int:
+    """Число строк продолжения записи системы (по 4 поля в строке)."""
+    n_fields = GLONASS_FIELDS if system == GLONASS_SYSTEM else KEPLER_FIELDS
+    return -(-(n_fields - 3) // 4)
+
+
+def _parse_records(headers: list[bytes], rows: list[bytes], n_values: int) -> tuple[NDArray, NDArray, NDArray]:
+    """
+    Разбор записей одной системы срезами фиксированной ширины.
+
+    Все записи преобразуются одним вызовом NumPy; если среди них есть
+    некорректные, записи разбираются по одной и некорректные отбрасываются.
+
+    Returns:
+        tuple: (эпохи (R,), значения (R, n_values), маска корректных записей (R,))
+    """
+    table = bytes.maketrans(b'Dd', b'Ee')
+    header_array = np.array(headers, dtype=f'S{NAV_EPOCH_WIDTH}')
+    try:
+        fields = np.frombuffer(b''.join(rows).translate(table), dtype=f'S{NAV_FIELD_WIDTH}')
+        values = _to_float(fields).reshape(len(rows), n_values)
+        epochs = _epochs_seconds(header_array)
+        return epochs, values, np.ones(len(rows), dtype=bool)
+    except ValueError:
+        pass
+    epochs = np.zeros(len(rows), dtype=np.float64)
+    values = np.zeros((len(rows), n_values), dtype=np.float64)
+    valid = np.zeros(len(rows), dtype=bool)
+    for i, row in enumerate(rows):
+        try:
+            values[i] = _to_float(np.frombuffer(row.translate(table), dtype=f'S{NAV_FIELD_WIDTH}'))
+            epochs[i] = _epochs_seconds(header_array[i:i + 1])[0]
+            valid[i] = True
+        except ValueError:
+            continue
+    return epochs, values, valid
+
+
+def _records_toe(system: str, values: NDArray, epochs: NDArray, leap_seconds: int) -> NDArray:
+    """Абсолютное время привязки записей в секундах шкалы GPS."""
+    if system == GLONASS_SYSTEM:
+        # Эпоха записей ГЛОНАСС задана в UTC
+        return epochs + leap_seconds
+    week = values[:, K_WEEK]
+    toe = values[:, K_TOE]
+    if system == 'C':
+        absolute = (week + BDT_WEEK_OFFSET) * SECONDS_IN_WEEK + toe + BDT_GPS_OFFSET
+    else:
+        absolute = week * SECONDS_IN_WEEK + toe
+    return np.where(week <= 0, epochs, absolute)
+
+
+def parse_nav(source) -> BroadcastEphemeris:
+    """
+    Однопроходный разбор навигационного файла RINEX 3 в массивы записей.
+
+    Заголовок читается один раз (версия, LEAP SECONDS, IONOSPHERIC CORR). Строки
+    записи склеиваются в строку фиксированной ширины, а все записи системы
+    преобразуются в числа срезами полей D19.12 одним вызовом NumPy.
+
+    Args:
+        source: путь к nav-файлу (допускается .gz) или его содержимое в байтах
+
+    Returns:
+        BroadcastEphemeris: записи эфемерид, сгруппированные по спутникам
+    """
+    lines = _iter_lines(source)
+    version = 3.0
+    leap_seconds = DEFAULT_LEAP_SECONDS
+    iono_corrections = {}
+
+    for line in lines:
+        label = line[60:80].strip()
+        if label == b'RINEX VERSION / TYPE':
+            try:
+                version = float(line[0:9])
+            except ValueError:
+                pass
+        elif label == b'LEAP SECONDS':
+            try:
+                leap_seconds = int(line[0:6])
+            except ValueError:
+                pass
+        elif label == b'IONOSPHERIC CORR':
+            try:
+                iono_corrections[line[0:4].decode('ascii').strip()] = [
+                    float(line[i:i + 12].replace(b'D', b'E')) for i in (5, 17, 29, 41) if line[i:i + 12].strip()
+                ]
+            except ValueError:
+                pass
+        elif label == b'END OF HEADER':
+            break
+
+    if version >= 4 or version < 3:
+        raise ValueError(f"Поддерживаются только nav-файлы RINEX 3.x, получена версия {version}")
+
+    # По системам: спутники, первые строки записей и поля записей фиксированной ширины
+    collected: dict[str, tuple[list, list, list]] = {}
+
+    def flush(record):
+        if not record:
+            return
+        header = record[0]
+        sat = _normalize_sat(header[0:3].decode('ascii', errors='replace').ljust(3))
+        if sat is None:
+            return
+        system = sat[0]
+        if system not in KEPLER_SYSTEMS and system != GLONASS_SYSTEM:
+            return
+        n_cont = _continuation_lines(system)
+        row = [header[NAV_FIRST_FIELD:80].ljust(NAV_FIELD_WIDTH * 3)]
+        for k in range(1, n_cont + 1):
+            cont = record[k] if k < len(record) else b''
+            row.append(cont[4:80].ljust(NAV_FIELD_WIDTH * 4))
+        sats, headers, rows = collected.setdefault(system, ([], [], []))
+        sats.append(sat)
+        headers.append(header[:NAV_EPOCH_WIDTH].ljust(NAV_EPOCH_WIDTH))
+        rows.append(b''.join(row))
+
+    # Запись начинается со строки с идентификатором спутника в первой колонке,
+    # строки продолжения начинаются с пробелов
+    record: list[bytes] = []
+    for line in lines:
+        if not line.strip():
+            continue
+        if line[:1] != b' ':
+            flush(record)
+            record = [line]
+        elif record:
+            record.append(line)
+    flush(record)
+
+    ephemeris = BroadcastEphemeris(version=version, leap_seconds=leap_seconds, iono_corrections=iono_corrections)
+    for system, (sats, headers, rows) in collected.items():
+        n_fields = GLONASS_FIELDS if system == GLONASS_SYSTEM else KEPLER_FIELDS
+        n_values = 3 + 4 * _continuation_lines(system)
+        epochs, values, valid = _parse_records(headers, rows, n_values)
+        values = values[:, :n_fields]
+        health = values[:, R_HEALTH] if system == GLONASS_SYSTEM else values[:, K_HEALTH]
+        keep = valid & (health == 0)
+        sats = np.array(sats)[keep]
+        values = values[keep]
+        toe = _records_toe(system, values, epochs[keep], leap_seconds)
+        # Группировка по спутнику, внутри - по toe (при равенстве - в порядке файла)
+        order = np.lexsort((toe, sats))
+        sats, toe, values = sats[order], toe[order], values[order]
+        names, starts = np.unique(sats, return_index=True)
+        bounds = np.append(starts, len(sats))
+        for sat, lo, hi in zip(names.tolist(), bounds[:-1], bounds[1:]):
+            ephemeris.toe[sat] = toe[lo:hi]
+            ephemeris.elements[sat] = values[lo:hi]
+    return ephemeris
+
+
+def _select_records(toe: NDArray, t: NDArray, max_age: float) -> tuple[NDArray, NDArray]:
+    """Для каждой эпохи выбирает запись с ближайшим toe; возвращает индексы и маску пригодности."""
+    idx = np.searchsorted(toe, t)
+    idx = np.clip(idx, 1, len(toe)) - 1
+    nxt = np.minimum(idx + 1, len(toe) - 1)
+    take_next = np.abs(toe[nxt] - t) < np.abs(toe[idx] - t)
+    idx = np.where(take_next, nxt, idx)
+    valid = np.abs(t - toe[idx]) <= max_age
+    return idx, valid
+
+
+def _kepler_positions(system: str, sat: str, el: NDArray, toe: NDArray, t: NDArray) -> NDArray:
+    """Координаты по кеплеровским элементам (IS-GPS-200), векторно по эпохам."""
+    mu, omega_e = KEPLER_CONSTANTS[system]
+    tk = t - toe
+    a = el[:, K_SQRTA] ** 2
+    e = el[:, K_E]
+    n = np.sqrt(mu / a ** 3) + el[:, K_DN]
+    m = el[:, K_M0] + n * tk
+
+    ecc_anomaly = m.copy()
+    for _ in range(10):
+        ecc_anomaly = m + e * np.sin(ecc_anomaly)
+
+    nu = np.arctan2(np.sqrt(1 - e ** 2) * np.sin(ecc_anomaly), np.cos(ecc_anomaly) - e)
+    phi = nu + el[:, K_OMEGA]
+    sin2, cos2 = np.sin(2 * phi), np.cos(2 * phi)
+    u = phi + el[:, K_CUS] * sin2 + el[:, K_CUC] * cos2
+    r = a * (1 - e * np.cos(ecc_anomaly)) + el[:, K_CRS] * sin2 + el[:, K_CRC] * cos2
+    inc = el[:, K_I0] + el[:, K_IDOT] * tk + el[:, K_CIS] * sin2 + el[:, K_CIC] * cos2
+
+    x_orb = r * np.cos(u)
+    y_orb = r * np.sin(u)
+    # Время привязки внутри недели для поправки за вращение Земли
+    toe_week = el[:, K_TOE]
+
+    is_geo = system == 'C' and (int(sat[1:]) <= 5 or int(sat[1:]) >= 59)
+    if is_geo:
+        # Геостационарные спутники BeiDou: расчёт в инерциальной системе и поворот
+        node = el[:, K_OMEGA0] + el[:, K_OMEGADOT] * tk - omega_e * toe_week
+        xg = x_orb * np.cos(node) - y_orb * np.cos(inc) * np.sin(node)
+        yg = x_orb * np.sin(node) + y_orb * np.cos(inc) * np.cos(node)
+        zg = y_orb * np.sin(inc)
+        tilt = np.radians(-5.0)
+        y_tilt = yg * np.cos(tilt) + zg * np.sin(tilt)
+        z_tilt = -yg * np.sin(tilt) + zg * np.cos(tilt)
+        rot = omega_e * tk
+        x = xg * np.cos(rot) + y_tilt * np.sin(rot)
+        y = -xg * np.sin(rot) + y_tilt * np.cos(rot)
+        return np.stack([x, y, z_tilt], axis=-1)
+
+    node = el[:, K_OMEGA0] + (el[:, K_OMEGADOT] - omega_e) * tk - omega_e * toe_week
+    x = x_orb * np.cos(node) - y_orb * np.cos(inc) * np.sin(node)
+    y = x_orb * np.sin(node) + y_orb * np.cos(inc) * np.cos(node)
+    z = y_orb * np.sin(inc)
+    return np.stack([x, y, z], axis=-1)
+
+
+def _glonass_derivatives(state: NDArray, acc: NDArray) -> NDArray:
+    """Правая часть уравнений движения ГЛОНАСС в ПЗ-90 (с учётом J2)."""
+    x, y, z = state[:, 0], state[:, 1], state[:, 2]
+    vx, vy, vz = state[:, 3], state[:, 4], state[:, 5]
+    r2 = x ** 2 + y ** 2 + z ** 2
+    r = np.sqrt(r2)
+    mu_r3 = GLO_MU / (r2 * r)
+    j2_term = 1.5 * GLO_J2 * GLO_MU * GLO_AE ** 2 / r2 ** 2 / r
+    z2_r2 = 5 * z ** 2 / r2
+    ax = -mu_r3 * x - j2_term * x * (1 - z2_r2) + GLO_OMEGA ** 2 * x + 2 * GLO_OMEGA * vy + acc[:, 0]
+    ay = -mu_r3 * y - j2_term * y * (1 - z2_r2) + GLO_OMEGA ** 2 * y - 2 * GLO_OMEGA * vx + acc[:, 1]
+    az = -mu_r3 * z - j2_term * z * (3 - z2_r2) + acc[:, 2]
+    return np.stack([vx, vy, vz, ax, ay, az], axis=-1)
+
+
+def _glonass_positions(el: NDArray, toe: NDArray, t: NDArray) -> NDArray:
+    """Интегрирует состояние ГЛОНАСС от toe до t сразу для всех эпох (РК4, шаг <= 60 с)."""
+    state = np.stack([
+        el[:, R_X], el[:, R_Y], el[:, R_Z],
+        el[:, R_VX], el[:, R_VY], el[:, R_VZ],
+    ], axis=-1) * 1000.0
+    acc = np.stack([el[:, R_AX], el[:, R_AY], el[:, R_AZ]], axis=-1) * 1000.0
+    dt = t - toe
+    if len(dt) == 0:
+        return state[:, :3]
+    n_steps = max(1, int(np.ceil(np.max(np.abs(dt)) / GLO_MAX_STEP)))
+    h = (dt / n_steps)[:, None]
+    for _ in range(n_steps):
+        k1 = _glonass_derivatives(state, acc)
+        k2 = _glonass_derivatives(state + 0.5 * h * k1, acc)
+        k3 = _glonass_derivatives(state + 0.5 * h * k2, acc)
+        k4 = _glonass_derivatives(state + h * k3, acc)
+        state = state + h / 6.0 * (k1 + 2 * k2 + 2 * k3 + k4)
+    return state[:, :3]
+
+
+def satellite_positions(ephemeris: BroadcastEphemeris, sats: list[str], times) -> NDArray:
+    """
+    Координаты спутников на заданные моменты времени.
+
+    Args:
+        ephemeris: разобранный навигационный файл
+        sats: список спутников ('G01', 'R05', ...)
+        times: моменты времени (datetime/datetime64 в шкале GPS) или секунды GPS
+
+    Returns:
+        NDArray: массив (n_sats, n_epochs, 3) координат ECEF в метрах;
+            NaN там, где нет пригодных эфемерид
+    """
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.number):
+        t = times.astype(np.float64)
+    else:
+        t = to_gps_seconds(times)
+
+    result = np.full((len(sats), len(t), 3), np.nan)
+    for k, sat in enumerate(sats):
+        if sat not in ephemeris.elements:
+            continue
+        system = sat[0]
+        toe_all = ephemeris.toe[sat]
+        idx, valid = _select_records(toe_all, t, MAX_EPHEMERIS_AGE.get(system, 4 * 3600))
+        if not np.any(valid):
+            continue
+        el = ephemeris.elements[sat][idx[valid]]
+        toe = toe_all[idx[valid]]
+        if system == GLONASS_SYSTEM:
+            xyz = _glonass_positions(el, toe, t[valid])
+        else:
+            # toe уже приведено к шкале GPS, поэтому tk = t - toe одинаково для всех систем
+            xyz = _kepler_positions(system, sat, el, toe, t[valid])
+        result[k, valid] = xyz
+    return result
@@ -0,0 +1,254 @@
+"""
+Постоянный кэш nav-файлов и рассчитанных координат спутников.
+
+Nav-файлы хранятся по хэшу содержимого, координаты спутников - в виде .npy,
+которые открываются через memory map. Ключ массива координат строится из
+временной сетки, списка спутников и хэша nav-файла. При превышении
+лимита по объёму удаляются давно не использовавшиеся записи (LRU).
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+CACHE_DIR = Path("app_data") / "cache"
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+def _temp_path(directory: Path, name: str, suffix: str) -> tuple[int, Path]:
+    """
+    Уникальный временный файл рядом с целевым: параллельные записи одного
+    ключа не делят временный путь, а os.replace остаётся атомарным.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=f"{name}.", suffix=suffix, dir=directory)
+    return fd, Path(tmp)
+
+
+def _is_temp(path: Path) -> bool:
+    """Незавершённая запись (.part, .tmp*), которую нельзя вытеснять."""
+    return path.suffix == '.part' or '.tmp' in path.suffixes
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EphemerisCache:
+    """Каталог кэша с nav-файлами (nav/) и массивами координат (xyz/)."""
+
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.nav_dir = self.root / "nav"
+        self.xyz_dir = self.root / "xyz"
+        self.index_file = self.root / "nav_index.json"
+        self._lock = threading.Lock()
+        # Блокировки загрузки nav-файла по дням: предзагрузка и запрос пользователя не качают один день дважды
+        self._day_locks: dict[str, threading.Lock] = {}
+        self.nav_dir.mkdir(parents=True, exist_ok=True)
+        self.xyz_dir.mkdir(parents=True, exist_ok=True)
+
+    # --- nav-файлы ---
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: dict) -> None:
+        tmp = self.index_file.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.index_file)
+
+    def cached_nav_file(self, epoch: datetime) -> Path | None:
+        """Nav-файл за дату epoch, если он уже есть в кэше."""
+        day = epoch.strftime('%Y-%m-%d')
+        entry = self._read_index().get(day)
+        if not entry:
+            return None
+        path = self.nav_dir / entry['file']
+        if not path.exists():
+            return None
+        self._touch(path)
+        return path
+
+    def add_nav_file(self, epoch: datetime, source: Path, move: bool = False) -> Path:
+        """
+        Кладёт nav-файл в кэш под именем <sha256>.rnx и привязывает его к дате.
+
+        При move=True файл переносится (например, только что загруженный во
+        временный каталог кэша) вместо копирования.
+        """
+        digest = file_sha256(source)
+        target = self.nav_dir / f"{digest}.rnx"
+        if not target.exists():
+            fd, tmp = _temp_path(self.nav_dir, digest, '.part')
+            os.close(fd)
+            try:
+                if move:
+                    shutil.move(source, tmp)
+                else:
+                    shutil.copyfile(source, tmp)
+                os.replace(tmp, target)
+            finally:
+                tmp.unlink(missing_ok=True)
+        with self._lock:
+            index = self._read_index()
+            index[epoch.strftime('%Y-%m-%d')] = {'file': target.name, 'sha256': digest, 'name': Path(source).name}
+            self._write_index(index)
+        self.evict()
+        return target
+
+    def get_nav_file(self, epoch: datetime, loader) -> Path:
+        """
+        Возвращает nav-файл за дату из кэша, при промахе загружает его через loader.
+
+        Args:
+            epoch: дата nav-файла
+            loader: функция loader(epoch, tempdir) -> Path, например load_nav_file
+
+        Returns:
+            Path: путь к nav-файлу внутри кэша
+        """
+        day = epoch.strftime('%Y-%m-%d')
+        with self._lock:
+            day_lock = self._day_locks.setdefault(day, threading.Lock())
+        # Второй поток ждёт идущую загрузку того же дня и берёт её результат из кэша
+        with day_lock:
+            cached = self.cached_nav_file(epoch)
+            if cached is not None:
+                print(f"💾 Nav-файл за {day} взят из кэша: {cached.name}")
+                return cached
+            # Временный каталог внутри кэша: загруженный файл переносится в nav/ переименованием
+            with tempfile.TemporaryDirectory(dir=self.root) as temp_dir:
+                downloaded = loader(epoch, temp_dir)
+                return self.add_nav_file(epoch, downloaded, move=True)
+
+    def nav_hash(self, nav_file: Path) -> str:
+        """Хэш nav-файла; для файлов из кэша берётся из имени."""
+        nav_file = Path(nav_file)
+        if nav_file.parent == self.nav_dir and len(nav_file.stem) == 64:
+            return nav_file.stem
+        return file_sha256(nav_file)
+
+    # --- массивы координат ---
+    @staticmethod
+    def xyz_key(start: datetime, end: datetime, timestep: int, sats: list, nav_hash: str) -> str:
+        """Ключ массива координат: временная сетка, спутники и хэш nav-файла."""
+        payload = json.dumps({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'timestep': int(timestep),
+            'sats': list(sats),
+            'nav': nav_hash,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def load_xyz(self, key: str) -> tuple[list, NDArray] | None:
+        """Загружает (спутники, массив координат) по ключу; массив открывается через memory map."""
+        meta_path = self.xyz_dir / f"{key}.json"
+        data_path = self.xyz_dir / f"{key}.npy"
+        if not meta_path.exists() or not data_path.exists():
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            xyz = np.load(data_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        self._touch(meta_path)
+        self._touch(data_path)
+        return meta['sats'], xyz
+
+    def save_xyz(self, key: str, sats: list, xyz: NDArray) -> None:
+        """Сохраняет массив координат и список спутников под ключом key."""
+        data_path = self.xyz_dir / f"{key}.npy"
+        meta_path = self.xyz_dir / f"{key}.json"
+        fd, tmp_data = _temp_path(self.xyz_dir, key, '.tmp.npy')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(xyz, dtype=np.float64))
+            os.replace(tmp_data, data_path)
+        finally:
+            tmp_data.unlink(missing_ok=True)
+        fd, tmp_meta = _temp_path(self.xyz_dir, key, '.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'sats': list(sats), 'shape': list(xyz.shape)}, f)
+            os.replace(tmp_meta, meta_path)
+        finally:
+            tmp_meta.unlink(missing_ok=True)
+        self.evict()
+
+    # --- вытеснение ---
+    @staticmethod
+    def _touch(path: Path) -> None:
+        try:
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+
+    def total_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.root.rglob('*') if p.is_file())
+
+    def evict(self) -> None:
+        """Удаляет давно не использовавшиеся файлы, пока объём кэша превышает max_bytes."""
+        with self._lock:
+            # Незавершённые записи других потоков не учитываются и не удаляются;
+            # файлы могут исчезнуть между листингом и stat - их пропускаем
+            stats: dict[Path, os.stat_result] = {}
+            for d in (self.nav_dir, self.xyz_dir):
+                for p in d.iterdir():
+                    if _is_temp(p):
+                        continue
+                    try:
+                        stats[p] = p.stat()
+                    except FileNotFoundError:
+                        continue
+            total = sum(st.st_size for st in stats.values())
+            if total <= self.max_bytes:
+                return
+            # Группируем файлы записи (.npy + .json) по имени, чтобы удалять их вместе
+            groups: dict[Path, list[Path]] = {}
+            for p in stats:
+                groups.setdefault(p.parent / p.name.split('.')[0], []).append(p)
+            ordered = sorted(groups.values(), key=lambda group: max(stats[p].st_mtime for p in group))
+            removed_nav = set()
+            for group in ordered:
+                if total <= self.max_bytes:
+                    break
+                for p in group:
+                    p.unlink(missing_ok=True)
+                    total -= stats[p].st_size
+                    if p.parent == self.nav_dir:
+                        removed_nav.add(p.name)
+            if removed_nav:
+                index = {day: entry for day, entry in self._read_index().items() if entry['file'] not in removed_nav}
+                self._write_index(index)
+
+
+_default_cache: EphemerisCache | None = None
+
+
+def get_default_cache() -> EphemerisCache:
+    """Общий экземпляр кэша для процесса."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EphemerisCache()
+    return _default_cache
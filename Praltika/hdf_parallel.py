@@ -0,0 +1,169 @@
+"""
+Параллельное извлечение продуктов HDF по станциям в пуле процессов.
+
+h5py держит GIL на всё время чтения, поэтому потоки не ускоряют обход
+сотен станций. Станции делятся на непрерывные блоки, каждый процесс
+открывает файл на чтение сам и складывает продукты блока в один массив на
+продукт. Массивы передаются родителю не сериализацией, а через .npy файлы
+во временном каталоге в /dev/shm (разделяемая память); родитель склеивает
+блоки в столбцы SeriesStore.
+"""
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+
+from hdf_reader import TIMESTAMP_DATASET, site_index, window_bounds
+from series_store import SeriesStore
+
+HDF_WORKERS = os.cpu_count() or 1
+# Меньше станций читаются в текущем процессе: запуск пула дороже чтения
+PARALLEL_MIN_SITES = 16
+BLOCKS_PER_WORKER = 4
+SHARED_MEMORY_DIR = '/dev/shm'
+
+
+def _extract_block(path: str, site_names: list[str], hdf_names: list[str], window: tuple | None,
+                   out_dir: str | None, block: int) -> tuple:
+    """
+    Читает продукты блока станций; ряд каждой пары имеет длину набора timestamp.
+
+    Returns:
+        tuple: (пары [(станция, спутник)], длины рядов (P,), наличие продуктов (P, C), столбцы)
+            Если задан out_dir, вместо столбцов возвращаются пути к .npy файлам.
+    """
+    pairs, lengths, present = [], [], []
+    parts = [[] for _ in hdf_names]
+    with h5py.File(path, 'r') as f:
+        for site_name in site_names:
+            if site_name not in f:
+                continue
+            site_group = f[site_name]
+            for sat_name in site_group.keys():
+                sat_group = site_group[sat_name]
+                if TIMESTAMP_DATASET not in sat_group:
+                    continue
+                timestamps = sat_group[TIMESTAMP_DATASET][:]
+                rows = slice(None)
+                if window is not None:
+                    lo, hi = window_bounds(timestamps, *window)
+                    # Как и при ленивом чтении, спутники без отсчётов в окне пропускаются
+                    if lo == hi:
+                        continue
+                    rows = slice(lo, hi)
+                n = len(timestamps[rows])
+                pairs.append((site_name, sat_name))
+                lengths.append(n)
+                row_present = []
+                for j, name in enumerate(hdf_names):
+                    values = timestamps[rows] if name == TIMESTAMP_DATASET else (
+                        sat_group[name][rows] if name in sat_group else None
+                    )
+                    # Продукт другой длины считается отсутствующим: столбцы выровнены по timestamp
+                    if values is not None and len(values) == n:
+                        parts[j].append(values)
+                        row_present.append(True)
+                    else:
+                        parts[j].append(n)
+                        row_present.append(False)
+                present.append(row_present)
+    columns = [_concat_column(part) for part in parts]
+    lengths = np.array(lengths, dtype=np.int64)
+    present = np.array(present, dtype=bool).reshape(len(pairs), len(hdf_names))
+    if out_dir is None:
+        return pairs, lengths, present, columns
+    files = []
+    for j, values in enumerate(columns):
+        file_path = str(Path(out_dir) / f"block_{block}_{j}.npy")
+        np.save(file_path, values)
+        files.append(file_path)
+    return pairs, lengths, present, files
+
+
+def _concat_column(part: list) -> NDArray:
+    """Склеивает ряды столбца; отсутствующие ряды (заданы длиной) заполняются NaN или 0."""
+    arrays = [values for values in part if not isinstance(values, int)]
+    dtype = np.result_type(*arrays) if arrays else np.dtype(np.float64)
+    fill = np.nan if np.issubdtype(dtype, np.floating) else 0
+    return np.concatenate(
+        [values if not isinstance(values, int) else np.full(values, fill, dtype=dtype) for values in part]
+        or [np.array([], dtype=dtype)]
+    ).astype(dtype, copy=False)
+
+
+def _build_store(blocks: list[tuple], hdf_names: list[str], site_lat: dict, site_lon: dict) -> SeriesStore:
+    """Собирает SeriesStore из блоков в их порядке."""
+    pairs = [pair for block in blocks for pair in block[0]]
+    site_names = list(dict.fromkeys(site_name for site_name, _ in pairs))
+    sat_names = np.array(sorted({sat_name for _, sat_name in pairs}), dtype=str)
+    site_codes = {name: i for i, name in enumerate(site_names)}
+    lengths = np.concatenate([block[1] for block in blocks])
+    present = np.concatenate([block[2] for block in blocks]).reshape(len(pairs), len(hdf_names))
+    columns = {}
+    for j, name in enumerate(hdf_names):
+        parts = [block[3][j] for block in blocks]
+        dtype = np.result_type(*[values for values, block in zip(parts, blocks) if block[2][:, j].any()] or parts)
+        # Блоки, где продукта нет совсем, заполнены NaN; значения в них закрыты признаком present
+        with np.errstate(invalid='ignore'):
+            columns[name] = np.concatenate(parts).astype(dtype, copy=False)
+    return SeriesStore(
+        site_names=np.array(site_names, dtype=str),
+        site_lat=np.array([site_lat.get(name, np.nan) for name in site_names], dtype=np.float64),
+        site_lon=np.array([site_lon.get(name, np.nan) for name in site_names], dtype=np.float64),
+        sat_names=sat_names,
+        pair_site=np.array([site_codes[site_name] for site_name, _ in pairs], dtype=np.int32),
+        pair_sat=np.searchsorted(sat_names, np.array([sat_name for _, sat_name in pairs], dtype=str)).astype(np.int32),
+        offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        columns=columns,
+        present={name: present[:, j].copy() for j, name in enumerate(hdf_names)},
+    )
+
+
+def extract_series(path: str | Path, site_names: list[str], hdf_names: list[str],
+                   window: tuple | None = None, workers: int = HDF_WORKERS) -> SeriesStore:
+    """
+    Читает продукты всех спутников заданных станций в SeriesStore, при необходимости в пуле процессов.
+
+    Спутники без набора timestamp пропускаются; timestamp всегда входит в столбцы.
+
+    Args:
+        path: путь к HDF файлу
+        site_names: имена станций
+        hdf_names: имена наборов данных, которые нужно прочитать
+        window: окно времени (start, end), см. hdf_reader.window_bounds
+        workers: число процессов; 1 - чтение в текущем процессе
+
+    Returns:
+        SeriesStore: станции в порядке site_names, спутники по имени
+    """
+    path = str(Path(path).resolve())
+    hdf_names = list(dict.fromkeys([TIMESTAMP_DATASET, *hdf_names]))
+    index = site_index(path)
+    site_lat = dict(zip(index.names.tolist(), index.lat.tolist()))
+    site_lon = dict(zip(index.names.tolist(), index.lon.tolist()))
+    workers = max(1, min(workers, len(site_names)))
+    if workers == 1 or len(site_names) < PARALLEL_MIN_SITES:
+        block = _extract_block(path, site_names, hdf_names, window, None, 0)
+        return _build_store([block], hdf_names, site_lat, site_lon)
+
+    bounds = np.linspace(0, len(site_names), min(len(site_names), workers * BLOCKS_PER_WORKER) + 1).astype(int)
+    shm_dir = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+    with tempfile.TemporaryDirectory(dir=shm_dir) as out_dir:
+        # spawn: процесс Streamlit многопоточный, fork из него небезопасен
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(_extract_block, path, site_names[lo:hi], hdf_names, window, out_dir, block)
+                for block, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])) if hi > lo
+            ]
+            # Сборка в порядке блоков, а не завершения задач
+            blocks = []
+            for future in futures:
+                pairs, lengths, present, files = future.result()
+                # Чтение из /dev/shm - копирование из памяти, файлы удаляются вместе с каталогом
+                blocks.append((pairs, lengths, present, [np.load(file_path) for file_path in files]))
+        return _build_store(blocks, hdf_names, site_lat, site_lon)
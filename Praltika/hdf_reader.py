@@ -0,0 +1,433 @@
+"""
+Ленивое чтение продуктов SIMuRG HDF по станциям и спутникам.
+
+Файл открывается один раз и остаётся открытым (кэш дескрипторов по пути,
+не больше HDF_MAX_OPEN_FILES файлов, давно не использованные закрываются),
+а для каждой пары (станция, спутник) возвращается LazyProducts - словарь,
+который читает набор данных из файла только при первом обращении к нему.
+Вызывающий код заранее указывает нужные продукты: остальные наборы данных
+не попадают в словарь и не читаются вовсе.
+
+Список станций файла с координатами, спутниками и покрытием по времени
+хранится в индексе SiteIndex рядом с файлом (<файл>.sites.npz). Индекс
+строится при первом открытии только по атрибутам и именам групп и
+пересобирается, если изменились путь, размер или время изменения HDF файла.
+Границы по времени спутников станции читаются при первом запросе окна для
+этой станции и дописываются в индекс.
+
+Для анализа окрестности события продукты можно читать только в окне
+времени: границы окна находятся бинарным поиском по набору данных
+timestamp, а из остальных наборов читается только нужный диапазон.
+"""
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+
+# Кэш дескрипторов в порядке использования (LRU)
+_open_files: OrderedDict[str, tuple[tuple[int, int], h5py.File]] = OrderedDict()
+_open_files_lock = threading.Lock()
+HDF_MAX_OPEN_FILES = 8
+
+SITE_INDEX_SUFFIX = '.sites.npz'
+TIMESTAMP_DATASET = 'timestamp'
+
+
+def open_hdf(path: str | Path) -> h5py.File:
+    """
+    Открытый на чтение HDF файл из кэша дескрипторов.
+
+    Если файл на диске изменился (размер или время изменения), старый
+    дескриптор закрывается и файл открывается заново. В кэше не больше
+    HDF_MAX_OPEN_FILES файлов: дольше всех не использованный закрывается
+    (LazyProducts открывает файл заново при следующем чтении).
+    """
+    key = str(Path(path).resolve())
+    stat = os.stat(key)
+    version = (stat.st_size, stat.st_mtime_ns)
+    with _open_files_lock:
+        cached = _open_files.get(key)
+        if cached is not None:
+            cached_version, f = cached
+            if cached_version == version and f.id.valid:
+                _open_files.move_to_end(key)
+                return f
+            if f.id.valid:
+                f.close()
+        f = h5py.File(key, 'r')
+        _open_files[key] = (version, f)
+        _open_files.move_to_end(key)
+        while len(_open_files) > HDF_MAX_OPEN_FILES:
+            _, (_, oldest) = _open_files.popitem(last=False)
+            if oldest.id.valid:
+                oldest.close()
+        return f
+
+
+def is_hdf_open(path: str | Path) -> bool:
+    """Есть ли открытый дескриптор файла в кэше (такой файл нельзя удалять)."""
+    key = str(Path(path).resolve())
+    with _open_files_lock:
+        cached = _open_files.get(key)
+        return cached is not None and bool(cached[1].id.valid)
+
+
+def close_hdf(path: str | Path | None = None) -> None:
+    """Закрывает кэшированный дескриптор файла path или все дескрипторы (перед удалением файла)."""
+    with _open_files_lock:
+        keys = list(_open_files) if path is None else [str(Path(path).resolve())]
+        for key in keys:
+            cached = _open_files.pop(key, None)
+            if cached is not None and cached[1].id.valid:
+                cached[1].close()
+
+
+def timestamps_to_datetime64(timestamps) -> NDArray:
+    """Временные метки HDF (секунды Unix, UTC) в массив datetime64[s] одним приведением типа."""
+    return np.rint(np.asarray(timestamps, dtype=np.float64)).astype(np.int64).astype('datetime64[s]')
+
+
+def to_unix_seconds(value) -> float:
+    """Момент времени (секунды Unix, datetime, datetime64) в секунды Unix; naive datetime считается UTC."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, np.datetime64):
+        return float(value.astype('datetime64[ms]').astype(np.int64)) / 1000.0
+    return float(value)
+
+
+def window_bounds(timestamps: NDArray, start=None, end=None) -> tuple[int, int]:
+    """
+    Границы индексов [lo, hi) отсчётов с start <= timestamp <= end.
+
+    Args:
+        timestamps: отсортированные временные метки, секунды Unix
+        start, end: границы окна; None - без ограничения
+
+    Returns:
+        tuple: (lo, hi)
+    """
+    lo = 0 if start is None else int(np.searchsorted(timestamps, to_unix_seconds(start), side='left'))
+    hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, to_unix_seconds(end), side='right'))
+    return lo, max(lo, hi)
+
+
+class LazyProducts(Mapping):
+    """
+    Продукты одной пары (станция, спутник), читаемые из HDF при первом обращении.
+
+    Ключи - те же объекты, что использует вызывающий код (например, элементы
+    DataProducts). Наличие ключа проверяется по метаданным группы, без чтения
+    данных. При сериализации pickle словарь материализуется в обычный dict:
+    сохранённые данные не должны зависеть от того, существует ли файл.
+
+    Если задано окно времени, все продукты содержат только отсчёты окна.
+    """
+
+    def __init__(self, path: str | Path, group: str, datasets: dict, derived: dict | None = None,
+                 available: set | None = None, window: tuple | None = None):
+        """
+        Args:
+            path: путь к HDF файлу
+            group: путь группы пары в файле, например "irkj/G21"
+            datasets: {ключ: имя набора данных в группе}
+            derived: {ключ: (имя исходного набора данных, функция преобразования)}
+            available: имена наборов данных в группе; если не задано, читаются из файла
+            window: окно времени (start, end); границы - секунды Unix, datetime или datetime64, None - открыта
+        """
+        self.path = path
+        self.group = group
+        if available is None:
+            available = set(open_hdf(path)[group].keys())
+        self._datasets = {key: name for key, name in datasets.items() if name in available}
+        self._derived = {key: source for key, source in (derived or {}).items() if source[0] in available}
+        self._arrays: dict[str, NDArray] = {}
+        self._values: dict = {}
+        # Без набора timestamp окно применить нельзя, продукты читаются целиком
+        self.window = window if window is not None and TIMESTAMP_DATASET in available else None
+        self._timestamps: NDArray | None = None
+        self._bounds: tuple[int, int] | None = None
+
+    @property
+    def bounds(self) -> tuple[int, int] | None:
+        """Индексы [lo, hi) окна в наборах данных группы; None - окно не задано."""
+        if self.window is None:
+            return None
+        if self._bounds is None:
+            # Полная копия timestamp нужна только для поиска границ: это самый маленький набор группы
+            self._timestamps = open_hdf(self.path)[self.group][TIMESTAMP_DATASET][:]
+            self._bounds = window_bounds(self._timestamps, *self.window)
+        return self._bounds
+
+    def _read(self, name: str) -> NDArray:
+        if name not in self._arrays:
+            bounds = self.bounds
+            if bounds is None:
+                self._arrays[name] = open_hdf(self.path)[self.group][name][:]
+            elif name == TIMESTAMP_DATASET:
+                self._arrays[name] = self._timestamps[bounds[0]:bounds[1]]
+            else:
+                # Чтение только диапазона окна (hyperslab), а не всего набора
+                self._arrays[name] = open_hdf(self.path)[self.group][name][bounds[0]:bounds[1]]
+        return self._arrays[name]
+
+    def __getitem__(self, key):
+        if key in self._datasets:
+            return self._read(self._datasets[key])
+        if key in self._derived:
+            if key not in self._values:
+                name, convert = self._derived[key]
+                self._values[key] = convert(self._read(name))
+            return self._values[key]
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._datasets or key in self._derived
+
+    def __iter__(self) -> Iterator:
+        yield from self._derived
+        yield from self._datasets
+
+    def __len__(self) -> int:
+        return len(self._datasets) + len(self._derived)
+
+    def __repr__(self) -> str:
+        return f"LazyProducts({self.group!r}, loaded={sorted(self._arrays)})"
+
+    def materialize(self) -> dict:
+        """Читает все продукты и возвращает обычный словарь."""
+        return {key: self[key] for key in self}
+
+    def __reduce__(self):
+        return dict, (self.materialize(),)
+
+
+def iter_sat_products(path: str | Path, site_names: list[str], datasets: dict,
+                      derived: dict | None = None, required: str | None = None,
+                      window: tuple | None = None) -> Iterator[tuple[str, str, LazyProducts]]:
+    """
+    Ленивые продукты для всех спутников заданных станций.
+
+    Args:
+        path: путь к HDF файлу
+        site_names: имена станций (группы верхнего уровня)
+        datasets: {ключ: имя набора данных}
+        derived: {ключ: (имя исходного набора данных, функция преобразования)}
+        required: набор данных, без которого спутник пропускается
+        window: окно времени (start, end); спутники без данных в окне пропускаются по индексу станций
+
+    Yields:
+        tuple: (имя станции, имя спутника, LazyProducts)
+    """
+    f = open_hdf(path)
+    if window is not None:
+        index = site_time_bounds(path, site_names)
+        positions = {name: i for i, name in enumerate(index.names.tolist())}
+        start = -np.inf if window[0] is None else to_unix_seconds(window[0])
+        end = np.inf if window[1] is None else to_unix_seconds(window[1])
+        # NaN (нет timestamp) не отбрасывается: такие спутники проверяются обычным способом
+        outside = (index.sat_end < start) | (index.sat_start > end)
+    for site_name in site_names:
+        if site_name not in f:
+            continue
+        site_group = f[site_name]
+        skipped = set()
+        if window is not None and site_name in positions:
+            lo, hi = index.sat_offsets[positions[site_name]], index.sat_offsets[positions[site_name] + 1]
+            skipped = set(index.sat_names[lo:hi][outside[lo:hi]].tolist())
+        for sat_name in site_group.keys():
+            if sat_name in skipped:
+                continue
+            available = set(site_group[sat_name].keys())
+            if required is not None and required not in available:
+                continue
+            yield site_name, sat_name, LazyProducts(path, f"{site_name}/{sat_name}", datasets, derived, available, window)
+
+
+@dataclass
+class SiteIndex:
+    """Станции HDF файла: координаты, спутники и покрытие по времени."""
+    # Ключ исходного файла: путь, размер, время изменения
+    source: str
+    size: int
+    mtime_ns: int
+    # Станции (N): имя и координаты в градусах
+    names: NDArray
+    lat: NDArray
+    lon: NDArray
+    # Спутники станции i: sat_names[sat_offsets[i]:sat_offsets[i + 1]]
+    sat_offsets: NDArray
+    sat_names: NDArray
+    # Первая и последняя временная метка каждого спутника (секунды Unix, NaN - нет данных)
+    sat_start: NDArray
+    sat_end: NDArray
+    # Прочитаны ли границы по времени спутников станции (N); до этого sat_start/sat_end - NaN
+    bounds_known: NDArray
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def matches(self, source: str, size: int, mtime_ns: int) -> bool:
+        return (self.source, self.size, self.mtime_ns) == (source, size, mtime_ns)
+
+    def site_sats(self, i: int) -> list[str]:
+        """Спутники станции с индексом i."""
+        return self.sat_names[self.sat_offsets[i]:self.sat_offsets[i + 1]].tolist()
+
+    def site_coverage(self) -> tuple[NDArray, NDArray]:
+        """Начало и конец данных по каждой станции (секунды Unix, NaN - нет данных или границы не прочитаны)."""
+        start = np.full(len(self), np.nan)
+        end = np.full(len(self), np.nan)
+        nonempty = np.diff(self.sat_offsets) > 0
+        offsets = self.sat_offsets[:-1][nonempty]
+        with np.errstate(invalid='ignore'):
+            start[nonempty] = np.fmin.reduceat(self.sat_start, offsets) if len(offsets) else []
+            end[nonempty] = np.fmax.reduceat(self.sat_end, offsets) if len(offsets) else []
+        return start, end
+
+    def region_mask(self, min_lat: float = -90, max_lat: float = 90,
+                    min_lon: float = -180, max_lon: float = 180) -> NDArray:
+        """Маска станций строго внутри прямоугольника, как в исходном переборе групп."""
+        return (self.lat > min_lat) & (self.lat < max_lat) & (self.lon > min_lon) & (self.lon < max_lon)
+
+    def read_time_bounds(self, f: h5py.File, sites: NDArray) -> bool:
+        """
+        Читает первую и последнюю временную метку спутников станций sites (индексы), если они ещё не прочитаны.
+
+        Returns:
+            bool: были ли прочитаны новые границы
+        """
+        sites = [int(i) for i in sites if not self.bounds_known[i]]
+        for i in sites:
+            site_group = f[str(self.names[i])]
+            for k in range(self.sat_offsets[i], self.sat_offsets[i + 1]):
+                timestamps = site_group[str(self.sat_names[k])].get(TIMESTAMP_DATASET)
+                if timestamps is not None and timestamps.shape and timestamps.shape[0] > 0:
+                    self.sat_start[k] = timestamps[0]
+                    self.sat_end[k] = timestamps[-1]
+            self.bounds_known[i] = True
+        return bool(sites)
+
+    @classmethod
+    def build(cls, f: h5py.File, source: str, size: int, mtime_ns: int) -> 'SiteIndex':
+        """Обходит группы файла по атрибутам и именам, без чтения данных (один раз на версию файла)."""
+        names, lat, lon, counts = [], [], [], []
+        sat_names = []
+        for site_name, site_group in f.items():
+            attrs = site_group.attrs
+            if 'lat' not in attrs or 'lon' not in attrs:
+                continue
+            names.append(site_name)
+            lat.append(attrs['lat'])
+            lon.append(attrs['lon'])
+            sats = list(site_group.keys())
+            counts.append(len(sats))
+            sat_names.extend(sats)
+        return cls(
+            source=source,
+            size=size,
+            mtime_ns=mtime_ns,
+            names=np.array(names, dtype=str),
+            lat=np.degrees(np.array(lat, dtype=np.float64)),
+            lon=np.degrees(np.array(lon, dtype=np.float64)),
+            sat_offsets=np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64),
+            sat_names=np.array(sat_names, dtype=str),
+            sat_start=np.full(len(sat_names), np.nan),
+            sat_end=np.full(len(sat_names), np.nan),
+            bounds_known=np.zeros(len(names), dtype=bool),
+        )
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + '.tmp.npz')
+        np.savez(
+            tmp, source=self.source, size=self.size, mtime_ns=self.mtime_ns,
+            names=self.names, lat=self.lat, lon=self.lon, sat_offsets=self.sat_offsets,
+            sat_names=self.sat_names, sat_start=self.sat_start, sat_end=self.sat_end,
+            bounds_known=self.bounds_known,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'SiteIndex':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                source=str(data['source']),
+                size=int(data['size']),
+                mtime_ns=int(data['mtime_ns']),
+                names=data['names'],
+                lat=data['lat'],
+                lon=data['lon'],
+                sat_offsets=data['sat_offsets'],
+                sat_names=data['sat_names'],
+                sat_start=data['sat_start'].copy(),
+                sat_end=data['sat_end'].copy(),
+                # В индексах прежнего формата границы прочитаны для всех станций
+                bounds_known=(data['bounds_known'].copy() if 'bounds_known' in data.files
+                              else np.ones(len(data['names']), dtype=bool)),
+            )
+
+
+_site_indexes: dict[str, SiteIndex] = {}
+_site_indexes_lock = threading.Lock()
+
+
+def site_index(path: str | Path) -> SiteIndex:
+    """
+    Индекс станций HDF файла.
+
+    Порядок поиска: память процесса, файл <path>.sites.npz, обход групп HDF.
+    Индекс из памяти или с диска используется, только если совпадают путь,
+    размер и время изменения файла. Если сохранить индекс рядом с файлом
+    нельзя, он остаётся только в памяти процесса.
+    """
+    source = str(Path(path).resolve())
+    stat = os.stat(source)
+    key = (source, stat.st_size, stat.st_mtime_ns)
+    with _site_indexes_lock:
+        index = _site_indexes.get(source)
+        if index is not None and index.matches(*key):
+            return index
+        sidecar = Path(source + SITE_INDEX_SUFFIX)
+        index = None
+        if sidecar.exists():
+            try:
+                index = SiteIndex.load(sidecar)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"⚠️ Не удалось прочитать индекс станций {sidecar.name}: {e}")
+        if index is None or not index.matches(*key):
+            index = SiteIndex.build(open_hdf(source), *key)
+            try:
+                index.save(sidecar)
+            except OSError as e:
+                print(f"⚠️ Не удалось сохранить индекс станций {sidecar.name}: {e}")
+        _site_indexes[source] = index
+        return index
+
+
+def site_time_bounds(path: str | Path, site_names: list[str]) -> SiteIndex:
+    """
+    Индекс станций с прочитанными границами по времени спутников станций site_names.
+
+    Границы читаются из файла только для станций, для которых их ещё нет, и
+    сохраняются в индекс рядом с файлом.
+    """
+    index = site_index(path)
+    positions = {name: i for i, name in enumerate(index.names.tolist())}
+    sites = np.array([positions[name] for name in site_names if name in positions], dtype=np.int64)
+    with _site_indexes_lock:
+        if index.read_time_bounds(open_hdf(path), sites):
+            sidecar = Path(index.source + SITE_INDEX_SUFFIX)
+            try:
+                index.save(sidecar)
+            except OSError as e:
+                print(f"⚠️ Не удалось сохранить индекс станций {sidecar.name}: {e}")
+    return index
@@ -0,0 +1,266 @@
+"""
+Глобальные ионосферные карты (GIM) в формате IONEX.
+
+Карты TEC файла разбираются в один массив (время, широта, долгота) в TECU.
+Значения карты читаются по фиксированным столбцам формата (I5) одним
+преобразованием NumPy на карту. Разобранные карты кэшируются на диске (.npz
+по хэшу содержимого) и в памяти процесса. Интерполяция - билинейная по
+пространству и линейная по времени - считается векторно сразу для всех
+точек, например для миллионов точек SIP.
+"""
+import gzip
+import hashlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from ephemeris_cache import CACHE_DIR, file_sha256
+
+GIM_CACHE_DIR = CACHE_DIR / "gim"
+# Значение "нет данных" в картах IONEX
+IONEX_MISSING = 9999
+IONEX_FIELD_WIDTH = 5
+IONEX_FIELDS_PER_LINE = 16
+
+
+@dataclass
+class GimMaps:
+    """Карты вертикального TEC одного файла IONEX."""
+    epochs: NDArray        # (T,) datetime64[s], UTC
+    lat: NDArray           # (L,) градусы, в порядке файла (обычно от 87.5 до -87.5)
+    lon: NDArray           # (M,) градусы
+    tec: NDArray           # (T, L, M) float32, TECU; NaN - нет данных
+    height: float = 450.0  # высота тонкого слоя, км
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    @property
+    def is_global(self) -> bool:
+        """Сетка по долготе замкнута (360°)."""
+        if len(self.lon) < 2:
+            return False
+        # С повтором узла 180° (обычно) или без него
+        return abs(float(self.lon[1] - self.lon[0])) * len(self.lon) >= 360.0 - 1e-6
+
+    def interpolate(self, times, lat, lon) -> NDArray:
+        """
+        Вертикальный TEC в точках: билинейно по широте и долготе, линейно по времени.
+
+        Args:
+            times: моменты времени (datetime64 или секунды Unix), той же формы, что lat, или скаляр
+            lat: широты точек, градусы
+            lon: долготы точек, градусы
+
+        Returns:
+            NDArray: TEC в TECU (float64) формы lat; NaN вне сетки карт или периода карт
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        shape = lat.shape
+        lat = lat.ravel()
+        lon = np.broadcast_to(np.asarray(lon, dtype=np.float64), shape).ravel()
+        times = np.asarray(times)
+        if np.issubdtype(times.dtype, np.datetime64):
+            times = times.astype('datetime64[s]').astype(np.int64)
+        t = np.broadcast_to(times.astype(np.float64), shape).ravel()
+
+        # Дробные индексы по времени, широте и долготе
+        epochs = self.epochs.astype('datetime64[s]').astype(np.int64).astype(np.float64)
+        n_t, n_lat, n_lon = self.tec.shape
+        ft = np.interp(t, epochs, np.arange(n_t, dtype=np.float64))
+        valid = (t >= epochs[0]) & (t <= epochs[-1])
+
+        dlat = float(self.lat[1] - self.lat[0]) if n_lat > 1 else 1.0
+        fi = (lat - self.lat[0]) / dlat
+        valid &= (fi >= 0) & (fi <= n_lat - 1)
+
+        dlon = float(self.lon[1] - self.lon[0]) if n_lon > 1 else 1.0
+        fj = (lon - self.lon[0]) / dlon
+        if self.is_global:
+            # Долгота замкнута: индекс берётся по модулю числа различных узлов
+            period = int(round(360.0 / abs(dlon)))
+            fj = np.mod(fj, period)
+        else:
+            period = None
+            valid &= (fj >= 0) & (fj <= n_lon - 1)
+
+        ft, fi, fj = np.where(valid, ft, 0.0), np.where(valid, fi, 0.0), np.where(valid, fj, 0.0)
+        t0 = np.minimum(np.floor(ft).astype(np.intp), max(n_t - 2, 0))
+        i0 = np.minimum(np.floor(fi).astype(np.intp), max(n_lat - 2, 0))
+        j0 = np.floor(fj).astype(np.intp)
+        if period is None:
+            j0 = np.minimum(j0, max(n_lon - 2, 0))
+            wj = fj - j0
+            j1 = np.minimum(j0 + 1, n_lon - 1)
+        else:
+            wj = fj - j0
+            j0 = j0 % period
+            # Если узел 180° повторён последним столбцом, он и берётся; иначе - переход к первому
+            j1 = j0 + 1 if n_lon > period else (j0 + 1) % period
+        t1 = np.minimum(t0 + 1, n_t - 1)
+        i1 = np.minimum(i0 + 1, n_lat - 1)
+        wt, wi = ft - t0, fi - i0
+
+        result = np.zeros(len(lat), dtype=np.float64)
+        for ti, w_t in ((t0, 1.0 - wt), (t1, wt)):
+            plane = (
+                (1.0 - wi) * ((1.0 - wj) * self.tec[ti, i0, j0] + wj * self.tec[ti, i0, j1])
+                + wi * ((1.0 - wj) * self.tec[ti, i1, j0] + wj * self.tec[ti, i1, j1])
+            )
+            result += w_t * plane
+        result[~valid] = np.nan
+        return result.reshape(shape)
+
+    def save(self, path: str | Path) -> None:
+        np.savez(path, epochs=self.epochs.astype('datetime64[s]').astype(np.int64), lat=self.lat,
+                 lon=self.lon, tec=self.tec, height=np.float64(self.height))
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'GimMaps':
+        with np.load(path) as data:
+            return cls(
+                epochs=data['epochs'].astype('datetime64[s]'),
+                lat=data['lat'],
+                lon=data['lon'],
+                tec=data['tec'],
+                height=float(data['height']),
+            )
+
+
+def _read_bytes(source) -> bytes:
+    """Содержимое файла IONEX из пути (.gz или обычный) либо из байтов."""
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    return data
+
+
+def _grid(line: bytes) -> NDArray:
+    """Сетка по строке заголовка LAT1 / LAT2 / DLAT или LON1 / LON2 / DLON (2X,3F6.1)."""
+    start, stop, step = float(line[2:8]), float(line[8:14]), float(line[14:20])
+    count = int(round((stop - start) / step)) + 1
+    return start + step * np.arange(count, dtype=np.float64)
+
+
+def parse_ionex(source) -> GimMaps:
+    """
+    Разбирает карты TEC файла IONEX (карты RMS и высот пропускаются).
+
+    Args:
+        source: путь к файлу (.gz поддерживается) или содержимое в байтах
+
+    Returns:
+        GimMaps: карты в порядке файла
+    """
+    lines = _read_bytes(source).splitlines()
+    exponent = -1
+    lat = lon = None
+    height = 450.0
+    body = 0
+    for body, line in enumerate(lines):
+        label = line[60:].strip()
+        if label == b'EXPONENT':
+            exponent = int(line[:6])
+        elif label == b'LAT1 / LAT2 / DLAT':
+            lat = _grid(line)
+        elif label == b'LON1 / LON2 / DLON':
+            lon = _grid(line)
+        elif label == b'HGT1 / HGT2 / DHGT':
+            height = float(line[2:8])
+        elif label == b'END OF HEADER':
+            break
+    if lat is None or lon is None:
+        raise ValueError("В заголовке IONEX нет сетки LAT1 / LAT2 / DLAT или LON1 / LON2 / DLON")
+
+    row_width = len(lon) * IONEX_FIELD_WIDTH
+    epochs, maps = [], []
+    in_map = False
+    map_exponent = exponent
+    rows = []
+    row = []
+    for line in lines[body + 1:]:
+        label = line[60:].strip()
+        if label == b'START OF TEC MAP':
+            in_map, rows, row, map_exponent = True, [], [], exponent
+        elif not in_map:
+            continue
+        elif label == b'EPOCH OF CURRENT MAP':
+            fields = [int(line[i:i + 6]) for i in range(0, 36, 6)]
+            epochs.append(np.datetime64(datetime(*fields), 's'))
+        elif label == b'EXPONENT':
+            map_exponent = int(line[:6])
+        elif label == b'LAT/LON1/LON2/DLON/H':
+            if row:
+                rows.append(b''.join(row)[:row_width])
+            row = []
+        elif label == b'END OF TEC MAP':
+            if row:
+                rows.append(b''.join(row)[:row_width])
+            # Все значения карты - одно преобразование столбцов шириной I5
+            values = np.frombuffer(b''.join(rows), dtype=f'S{IONEX_FIELD_WIDTH}').astype(np.int32)
+            tec = np.where(values == IONEX_MISSING, np.nan, values * 10.0 ** map_exponent).astype(np.float32)
+            maps.append(tec.reshape(len(rows), len(lon)))
+            in_map = False
+        else:
+            # Строка значений: до 16 полей I5; последняя строка широты может быть короче
+            row.append(line[:IONEX_FIELDS_PER_LINE * IONEX_FIELD_WIDTH])
+
+    if not maps:
+        raise ValueError("В файле IONEX нет карт TEC")
+    tec = np.stack(maps)
+    if tec.shape[1] != len(lat):
+        raise ValueError(f"Число широт в картах ({tec.shape[1]}) не совпадает с заголовком ({len(lat)})")
+    return GimMaps(epochs=np.array(epochs, dtype='datetime64[s]'), lat=lat, lon=lon, tec=tec, height=height)
+
+
+_gims: dict[str, GimMaps] = {}
+_gims_lock = threading.Lock()
+
+
+def load_gim(source, cache_dir: Path = GIM_CACHE_DIR) -> GimMaps:
+    """
+    Карты IONEX с кэшированием: в памяти процесса и на диске (<sha256>.npz).
+
+    Args:
+        source: путь к файлу IONEX (.gz поддерживается) или содержимое в байтах
+        cache_dir: каталог дискового кэша
+
+    Returns:
+        GimMaps: разобранные карты
+    """
+    if isinstance(source, (bytes, bytearray)):
+        key = hashlib.sha256(source).hexdigest()
+    else:
+        key = file_sha256(Path(source))
+    with _gims_lock:
+        if key in _gims:
+            return _gims[key]
+    cache_file = Path(cache_dir) / f"{key}.npz"
+    if cache_file.exists():
+        try:
+            gim = GimMaps.load(cache_file)
+        except (OSError, ValueError, KeyError):
+            gim = None
+    else:
+        gim = None
+    if gim is None:
+        gim = parse_ionex(source)
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_name(cache_file.stem + '.tmp.npz')
+            gim.save(tmp)
+            tmp.replace(cache_file)
+        except OSError as e:
+            # Без дискового кэша карты просто разбираются заново в следующем процессе
+            print(f"⚠️ Не удалось сохранить карты GIM в кэш: {e}")
+    with _gims_lock:
+        _gims[key] = gim
+    return gim
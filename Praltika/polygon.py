@@ -0,0 +1,119 @@
+"""
+Векторизованная проверка попадания точек в полигон.
+
+Полигон задаётся списком вершин [(lat, lon), ...], как во всём приложении.
+Долготы вершин разворачиваются так, чтобы соседние вершины отличались не
+более чем на 180°: полигон, пересекающий антимеридиан, становится
+непрерывным, а долготы точек приводятся к тому же диапазону. Полигоны,
+охватывающие полюс (обход на 360° по долготе), не поддерживаются.
+"""
+import numpy as np
+from numpy.typing import NDArray
+
+
+def polygon_arrays(polygon) -> tuple[NDArray, NDArray]:
+    """
+    Массивы широт и развернутых долгот вершин полигона.
+
+    Долготы непрерывны вдоль контура, минимальная из них лежит в [-180, 180).
+    """
+    vertices = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    plat = vertices[:, 0]
+    plon = np.unwrap(vertices[:, 1], period=360.0)
+    plon = plon - 360.0 * np.floor((plon.min() + 180.0) / 360.0)
+    return plat, plon
+
+
+def polygon_bbox(polygon) -> tuple[float, float, float, float]:
+    """
+    Ограничивающий прямоугольник полигона: (lat_min, lat_max, lon_min, lon_max).
+
+    Для полигона через антимеридиан lon_max > 180.
+    """
+    plat, plon = polygon_arrays(polygon)
+    return plat.min(), plat.max(), plon.min(), plon.max()
+
+
+def wrap_longitudes(lon, lon_min: float) -> NDArray:
+    """Приводит долготы к диапазону [lon_min, lon_min + 360)."""
+    return lon_min + np.mod(np.asarray(lon, dtype=np.float64) - lon_min, 360.0)
+
+
+def points_in_polygon(lat, lon, polygon, return_indices: bool = False) -> NDArray:
+    """
+    Проверяет попадание массива точек в полигон.
+
+    Точки вне ограничивающего прямоугольника отбрасываются сразу, для
+    оставшихся выполняется ray casting: цикл идёт только по рёбрам
+    полигона, точки обрабатываются массивом.
+
+    Args:
+        lat: широты точек
+        lon: долготы точек
+        polygon: список точек полигона [(lat1, lon1), (lat2, lon2), ...]
+        return_indices: вернуть индексы точек (в развёрнутом массиве) вместо маски
+
+    Returns:
+        NDArray: булева маска той же формы, что lat, или массив индексов
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    shape = lat.shape
+    lat = lat.ravel()
+    if len(polygon) < 3:
+        inside = np.zeros(lat.shape, dtype=bool)
+        return np.nonzero(inside)[0] if return_indices else inside.reshape(shape)
+
+    plat, plon = polygon_arrays(polygon)
+    lon = wrap_longitudes(np.ravel(lon), plon.min())
+
+    # Предварительный отбор по ограничивающему прямоугольнику (lon >= lon_min после приведения)
+    candidates = np.nonzero((lat >= plat.min()) & (lat <= plat.max()) & (lon <= plon.max()))[0]
+    cand_lat = lat[candidates]
+    cand_lon = lon[candidates]
+    cand_inside = np.zeros(len(candidates), dtype=bool)
+    for yi, xi, yj, xj in zip(plat, plon, np.roll(plat, 1), np.roll(plon, 1)):
+        if yi == yj:
+            continue
+        crosses = (yi > cand_lat) != (yj > cand_lat)
+        x_cross = (xj - xi) * (cand_lat - yi) / (yj - yi) + xi
+        cand_inside ^= crosses & (cand_lon < x_cross)
+
+    indices = candidates[cand_inside]
+    if return_indices:
+        return indices
+    inside = np.zeros(lat.shape, dtype=bool)
+    inside[indices] = True
+    return inside.reshape(shape)
+
+
+def distance_to_boundary(lat, lon, polygon) -> NDArray:
+    """
+    Приближённое расстояние от точек до границы полигона в градусах широты.
+
+    Расстояние до каждого ребра считается на плоскости (долгота, широта) с
+    долготой, умноженной на cos широты точки; берётся минимум по рёбрам.
+
+    Args:
+        lat: широты точек
+        lon: долготы точек
+        polygon: список точек полигона [(lat1, lon1), (lat2, lon2), ...]
+
+    Returns:
+        NDArray: расстояния той же формы, что lat
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    if len(polygon) < 2:
+        return np.full(lat.shape, np.inf)
+    plat, plon = polygon_arrays(polygon)
+    # Точки приводятся к диапазону ±180° вокруг центра полигона, чтобы точки западнее него не уходили на +360°
+    lon = wrap_longitudes(lon, (plon.min() + plon.max()) / 2 - 180.0)
+    scale = np.cos(np.radians(lat))
+    distance = np.full(lat.shape, np.inf)
+    for yi, xi, yj, xj in zip(plat, plon, np.roll(plat, 1), np.roll(plon, 1)):
+        ex, ey = (xj - xi) * scale, yj - yi
+        px, py = (lon - xi) * scale, lat - yi
+        length2 = ex ** 2 + ey ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            u = np.clip(np.where(length2 > 0, (px * ex + py * ey) / length2, 0.0), 0.0, 1.0)
+        distance = np.fmin(distance, np.hypot(px - u * ex, py - u * ey))
+    return distance
@@ -0,0 +1,270 @@
+"""
+Фоновая предзагрузка файлов соседних дней (HDF и nav).
+
+Пока пользователь смотрит выбранный день, соседние дни (или дни заданного
+диапазона) скачиваются в локальный кэш пулом из нескольких потоков. Очередь
+ограничена: лишние спекулятивные задачи не ставятся. Для каждого дня
+запоминается время последнего просмотра или загрузки; при превышении
+дискового лимита удаляются файлы дней, которые дольше всего не открывались.
+Дни, скачанные пользователем явно, и открытые файлы не удаляются.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable
+
+PREFETCH_WORKERS = 2
+# Максимум задач в очереди и в работе одновременно
+PREFETCH_QUEUE_SIZE = 8
+PREFETCH_DAYS_BEFORE = 1
+PREFETCH_DAYS_AFTER = 1
+PREFETCH_MAX_BYTES = 10 * 1024 ** 3
+# Неудачная предзагрузка дня повторяется не раньше чем через столько секунд
+PREFETCH_RETRY_INTERVAL = 10 * 60
+VIEWS_FILE = Path("app_data") / "prefetch_views.json"
+
+
+class DayPrefetcher:
+    """
+    Пул фоновых загрузок по дням с LRU вытеснением по дисковому лимиту.
+
+    Загрузчики - функции fetch(day) -> Path для каждого вида файлов ('hdf',
+    'nav', ...). Загрузчики выполняются в фоновых потоках и не должны
+    обращаться к интерфейсу Streamlit.
+    """
+
+    def __init__(self, fetchers: dict[str, Callable[[date], Path]], day_files: Callable[[date], list[Path]],
+                 max_bytes: int = PREFETCH_MAX_BYTES, workers: int = PREFETCH_WORKERS,
+                 queue_size: int = PREFETCH_QUEUE_SIZE, views_file: Path = VIEWS_FILE,
+                 on_evict: Callable[[Path], None] | None = None,
+                 in_use: Callable[[Path], bool] | None = None):
+        """
+        Args:
+            fetchers: {вид файла: загрузчик fetch(day) -> Path}
+            day_files: файлы дня, которые учитываются в лимите и удаляются при вытеснении
+            max_bytes: дисковый лимит для файлов day_files всех дней
+            workers: число потоков загрузки
+            queue_size: максимум незавершённых задач
+            views_file: файл с временем последнего использования дней
+            on_evict: вызывается для каждого файла перед удалением (например, закрыть дескриптор)
+            in_use: проверка, открыт ли файл; дни с открытыми файлами не удаляются
+        """
+        self.fetchers = fetchers
+        self.day_files = day_files
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.views_file = Path(views_file)
+        self.on_evict = on_evict
+        self.in_use = in_use
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, date], Future] = {}
+        # Ошибки предзагрузки: (сообщение, время ошибки)
+        self._errors: dict[tuple[str, date], tuple[str, float]] = {}
+        self._current: date | None = None
+
+    # --- время использования дней ---
+    def _read_views(self) -> dict:
+        """Состояние: {'views': {день: время использования}, 'explicit': [дни, скачанные явно]}."""
+        try:
+            with open(self.views_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {'views': {}, 'explicit': []}
+        if 'views' not in state:
+            # Прежний формат: только время использования дней
+            state = {'views': state, 'explicit': []}
+        return state
+
+    def _write_views(self, state: dict) -> None:
+        self.views_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.views_file.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp, self.views_file)
+
+    def _touch(self, day: date, explicit: bool = False) -> None:
+        with self._lock:
+            state = self._read_views()
+            state['views'][day.isoformat()] = time.time()
+            if explicit and day.isoformat() not in state['explicit']:
+                state['explicit'].append(day.isoformat())
+            self._write_views(state)
+
+    def viewed(self, day: date) -> None:
+        """Отмечает просмотр дня: он становится текущим и последним в очереди на вытеснение."""
+        self._current = day
+        self._touch(day)
+        self.evict()
+
+    def downloaded(self, day: date) -> None:
+        """Отмечает день, скачанный пользователем явно: его файлы не удаляются при вытеснении."""
+        self._touch(day, explicit=True)
+
+    # --- предзагрузка ---
+    def prefetch(self, day: date, kinds: tuple[str, ...] | None = None, start: date | None = None,
+                 end: date | None = None, before: int = PREFETCH_DAYS_BEFORE,
+                 after: int = PREFETCH_DAYS_AFTER) -> list[date]:
+        """
+        Ставит в очередь загрузку соседних с day дней.
+
+        Args:
+            day: выбранный день
+            kinds: виды файлов; по умолчанию все загрузчики
+            start, end: диапазон дней (например, период бури); если задан, берутся
+                все его дни, ближайшие к day - первыми
+            before, after: число дней до и после day, если диапазон не задан
+
+        Returns:
+            list: дни, для которых поставлена хотя бы одна задача
+        """
+        kinds = tuple(self.fetchers) if kinds is None else kinds
+        if start is not None and end is not None:
+            days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        else:
+            days = [day + timedelta(days=i) for i in range(-before, after + 1)]
+        # Данные за будущие дни ещё не готовы; ближайшие к выбранному дню - первыми
+        days = sorted((d for d in days if d != day and d <= date.today()), key=lambda d: abs((d - day).days))
+        queued = []
+        for d in days:
+            for kind in kinds:
+                if self._submit(kind, d):
+                    if not queued or queued[-1] != d:
+                        queued.append(d)
+        return queued
+
+    def _submit(self, kind: str, day: date) -> bool:
+        key = (kind, day)
+        with self._lock:
+            running = sum(not future.done() for future in self._pending.values())
+            # Готовые задачи остаются в словаре: файл уже в кэше, повторно не ставится
+            error = self._errors.get(key)
+            retry_later = error is not None and time.time() - error[1] < PREFETCH_RETRY_INTERVAL
+            if retry_later or running >= self.queue_size:
+                return False
+            if key in self._pending and (error is None or not self._pending[key].done()):
+                return False
+            self._pending[key] = self._executor.submit(self._run, kind, day)
+            return True
+
+    def _run(self, kind: str, day: date) -> Path | None:
+        try:
+            path = self.fetchers[kind](day)
+        except Exception as e:
+            # Ошибка спекулятивной загрузки повторяется не раньше PREFETCH_RETRY_INTERVAL, день загрузится по запросу
+            with self._lock:
+                self._errors[(kind, day)] = (str(e), time.time())
+            print(f"⚠️ Предзагрузка {kind} за {day} не удалась: {e}")
+            return None
+        with self._lock:
+            self._errors.pop((kind, day), None)
+        print(f"📦 Предзагружен {kind} за {day}: {Path(path).name}")
+        self._touch(day)
+        self.evict()
+        return path
+
+    def wait(self, kind: str, day: date, timeout: float | None = None) -> Path | None:
+        """
+        Дожидается идущей фоновой загрузки, чтобы не качать тот же файл второй раз параллельно.
+
+        Returns:
+            Path | None: путь к файлу или None, если загрузки не было или она не удалась
+        """
+        with self._lock:
+            future = self._pending.get((kind, day))
+        if future is None:
+            return None
+        return future.result(timeout=timeout)
+
+    def status(self, day: date) -> dict[str, str]:
+        """Состояние загрузок дня: {вид: 'pending' | 'done' | 'error'}."""
+        with self._lock:
+            result = {}
+            for (kind, d), future in self._pending.items():
+                if d == day:
+                    result[kind] = 'done' if future.done() else 'pending'
+            for (kind, d) in self._errors:
+                if d == day and (kind not in result or result[kind] == 'done'):
+                    result[kind] = 'error'
+            return result
+
+    # --- вытеснение ---
+    def evict(self) -> list[date]:
+        """
+        Удаляет файлы давно не использовавшихся дней, пока объём превышает max_bytes.
+
+        Текущий день, дни, скачанные пользователем явно, дни с открытыми
+        файлами (in_use) и дни с незавершёнными загрузками не удаляются.
+
+        Returns:
+            list: дни, файлы которых удалены
+        """
+        with self._lock:
+            protected = {d for (_, d), future in self._pending.items() if not future.done()}
+            if self._current is not None:
+                protected.add(self._current)
+            state = self._read_views()
+            views = state['views']
+            # Явно скачанные дни, файлы которых уже удалены (например, очисткой данных), больше не защищаются
+            explicit = [d for d in state['explicit'] if any(p.exists() for p in self.day_files(date.fromisoformat(d)))]
+            changed = explicit != state['explicit']
+            state['explicit'] = explicit
+            protected |= {date.fromisoformat(day_str) for day_str in explicit}
+            ordered = sorted(views.items(), key=lambda item: item[1])
+            sizes = {}
+            for day_str, _ in ordered:
+                day = date.fromisoformat(day_str)
+                sizes[day] = sum(p.stat().st_size for p in self.day_files(day) if p.exists())
+            total = sum(sizes.values())
+            removed = []
+            for day_str, _ in ordered:
+                if total <= self.max_bytes:
+                    break
+                day = date.fromisoformat(day_str)
+                if day in protected or not sizes[day]:
+                    continue
+                if self.in_use is not None and any(self.in_use(p) for p in self.day_files(day) if p.exists()):
+                    continue
+                for p in self.day_files(day):
+                    if self.on_evict is not None:
+                        self.on_evict(p)
+                    p.unlink(missing_ok=True)
+                total -= sizes[day]
+                views.pop(day_str)
+                # Удалённый день можно будет предзагрузить снова
+                self._pending = {k: f for k, f in self._pending.items() if k[1] != day}
+                removed.append(day)
+            if removed or changed:
+                self._write_views(state)
+            if removed:
+                print(f"🧹 Удалены файлы дней: {', '.join(str(d) for d in removed)}")
+            return removed
+
+
+_prefetcher: DayPrefetcher | None = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher(fetchers: dict[str, Callable[[date], Path]], day_files: Callable[[date], list[Path]],
+                   **kwargs) -> DayPrefetcher:
+    """
+    Общий предзагрузчик процесса.
+
+    Streamlit перезапускает скрипт приложения при каждом действии, поэтому
+    пул потоков хранится здесь, а не в модуле приложения. Загрузчики
+    обновляются при каждом вызове.
+    """
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = DayPrefetcher(fetchers, day_files, **kwargs)
+        else:
+            _prefetcher.fetchers = fetchers
+            _prefetcher.day_files = day_files
+            _prefetcher.on_evict = kwargs.get('on_evict', _prefetcher.on_evict)
+            _prefetcher.in_use = kwargs.get('in_use', _prefetcher.in_use)
+        return _prefetcher
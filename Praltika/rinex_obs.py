@@ -0,0 +1,295 @@
+"""
+Быстрое чтение файлов наблюдений RINEX 3 (.rnx, .gz) в колоночном виде.
+
+Файл читается одним проходом. Строки наблюдений каждой системы копятся
+блоками, выравниваются до фиксированной ширины и разбираются срезами
+фиксированных столбцов (F14.3 на наблюдаемую) сразу для всего блока
+средствами NumPy, без разбиения строк на поля в Python. Разбираются только
+выбранные наблюдаемые: остальные столбцы не преобразуются. Результат -
+массивы по спутникам и наблюдаемым, из которых считается TEC.
+"""
+import gzip
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+# Ширина поля наблюдения: значение F14.3, LLI и сила сигнала
+OBS_FIELD_WIDTH = 16
+OBS_VALUE_WIDTH = 14
+OBS_FIRST_COLUMN = 3
+# Число строк системы, после которого блок преобразуется в массивы
+OBS_BLOCK_LINES = 50000
+
+SPEED_OF_LIGHT = 299792458.0
+# Коэффициент ионосферной задержки, м * Гц^2 / (электрон/м^2)
+IONO_FACTOR = 40.308
+TECU = 1e16
+
+# Несущие частоты по системе и номеру диапазона в коде наблюдаемой (ГЛОНАСС FDMA не входит)
+FREQUENCIES = {
+    'G': {'1': 1575.42e6, '2': 1227.60e6, '5': 1176.45e6},
+    'J': {'1': 1575.42e6, '2': 1227.60e6, '5': 1176.45e6, '6': 1278.75e6},
+    'E': {'1': 1575.42e6, '5': 1176.45e6, '7': 1207.14e6, '8': 1191.795e6, '6': 1278.75e6},
+    'C': {'1': 1575.42e6, '2': 1561.098e6, '5': 1176.45e6, '7': 1207.14e6, '6': 1268.52e6},
+}
+
+# WGS-84
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+
+
+@dataclass
+class RinexObs:
+    """Наблюдения одной станции: эпохи и ряды наблюдаемых по спутникам."""
+    marker_name: str
+    approx_position: NDArray                  # (3,) ECEF, м
+    interval: float | None                    # шаг наблюдений, с
+    obs_types: dict[str, list[str]]           # все наблюдаемые заголовка по системам
+    epochs: NDArray                           # (E,) datetime64[ms], время приёмника
+    epoch_index: dict[str, NDArray]           # спутник -> индексы эпох его наблюдений
+    observations: dict[str, dict[str, NDArray]]  # спутник -> наблюдаемая -> значения (NaN - нет)
+
+    @property
+    def satellites(self) -> list[str]:
+        return sorted(self.observations)
+
+    def times(self, sat: str) -> NDArray:
+        """Моменты наблюдений спутника."""
+        return self.epochs[self.epoch_index[sat]]
+
+    def site_latlon(self) -> tuple[float, float, float]:
+        """Широта, долгота (градусы) и высота (м) станции по APPROX POSITION XYZ."""
+        return ecef_to_geodetic(*self.approx_position)
+
+
+def ecef_to_geodetic(x: float, y: float, z: float) -> tuple[float, float, float]:
+    """Геодезические координаты WGS-84 (широта, долгота в градусах, высота в м) по ECEF (итерации)."""
+    e2 = WGS84_F * (2 - WGS84_F)
+    lon = np.arctan2(y, x)
+    p = np.hypot(x, y)
+    lat = np.arctan2(z, p * (1 - e2))
+    height = 0.0
+    for _ in range(5):
+        n = WGS84_A / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+        height = p / np.cos(lat) - n if p > 0 else abs(z) - WGS84_A * np.sqrt(1 - e2)
+        lat = np.arctan2(z, p * (1 - e2 * n / (n + height)))
+    return float(np.degrees(lat)), float(np.degrees(lon)), float(height)
+
+
+def _iter_lines(source) -> Iterator[bytes]:
+    """Строки файла из пути (.gz или обычный) либо из байтов."""
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+        if data[:2] == b'\x1f\x8b':
+            data = gzip.decompress(data)
+        yield from data.splitlines()
+        return
+    path = Path(source)
+    with open(path, 'rb') as raw:
+        gzipped = raw.read(2) == b'\x1f\x8b'
+    with (gzip.open(path, 'rb') if gzipped else open(path, 'rb')) as f:
+        for line in f:
+            yield line.rstrip(b'\r\n')
+
+
+def _epoch_time(line: bytes) -> np.datetime64:
+    """Время эпохи из строки '> yyyy mm dd hh mm ss.sssssss'."""
+    seconds = float(line[18:29])
+    whole = int(seconds)
+    moment = datetime(int(line[2:6]), int(line[7:9]), int(line[10:12]), int(line[13:15]), int(line[16:18]), whole)
+    return np.datetime64(moment, 'ms') + np.timedelta64(int(round((seconds - whole) * 1000)), 'ms')
+
+
+class _SystemBlock:
+    """Строки наблюдений одной системы и их разбор в столбцы выбранных наблюдаемых."""
+
+    def __init__(self, codes: list[str], selected: list[str]):
+        self.codes = selected
+        self.columns = [OBS_FIRST_COLUMN + OBS_FIELD_WIDTH * codes.index(code) for code in selected]
+        # Строки обрезаются после последнего нужного поля
+        self.width = max(self.columns, default=OBS_FIRST_COLUMN) + OBS_VALUE_WIDTH if selected else OBS_FIRST_COLUMN
+        self.lines: list[bytes] = []
+        self.epochs: list[int] = []
+        self.parts: list[tuple] = []
+
+    def add(self, line: bytes, epoch: int) -> None:
+        self.lines.append(line[:self.width].ljust(self.width))
+        self.epochs.append(epoch)
+        if len(self.lines) >= OBS_BLOCK_LINES:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.lines:
+            return
+        rows = np.frombuffer(b''.join(self.lines), dtype=f'S{self.width}')
+        layout = np.dtype({
+            'names': ['sat'] + self.codes,
+            'formats': ['S3'] + [f'S{OBS_VALUE_WIDTH}'] * len(self.codes),
+            'offsets': [0] + self.columns,
+            'itemsize': self.width,
+        })
+        fields = rows.view(layout)
+        sats = fields['sat'].copy()
+        values = []
+        for code in self.codes:
+            column = fields[code].copy()
+            # Пустое поле - наблюдения нет
+            column[column == b' ' * OBS_VALUE_WIDTH] = b'nan'
+            values.append(column.astype(np.float64))
+        self.parts.append((sats, np.array(self.epochs, dtype=np.int64), values))
+        self.lines, self.epochs = [], []
+
+
+def parse_rinex_obs(source, observables: Iterable[str] | dict[str, Iterable[str]] | None = None,
+                    systems: str | None = None) -> RinexObs:
+    """
+    Разбирает файл наблюдений RINEX 3.
+
+    Args:
+        source: путь к файлу (.rnx или .gz) или содержимое в байтах
+        observables: коды наблюдаемых ('C1C', 'L1C', ...) для всех систем или словарь
+            {система: коды}; None - все наблюдаемые заголовка
+        systems: системы, которые нужно читать (например, 'GE'); None - все
+
+    Returns:
+        RinexObs: эпохи и ряды выбранных наблюдаемых по спутникам
+    """
+    lines = _iter_lines(source)
+    marker_name = ''
+    position = np.full(3, np.nan)
+    interval = None
+    obs_types: dict[str, list[str]] = {}
+    version = None
+    last_system = None
+    for line in lines:
+        label = line[60:80].strip()
+        if label == b'RINEX VERSION / TYPE':
+            version = float(line[:9])
+        elif label == b'MARKER NAME':
+            marker_name = line[:60].decode('ascii', errors='replace').strip()
+        elif label == b'APPROX POSITION XYZ':
+            position = np.array([float(line[i:i + 14]) for i in (0, 14, 28)])
+        elif label == b'INTERVAL':
+            interval = float(line[:10])
+        elif label == b'SYS / # / OBS TYPES':
+            system = line[:1].decode()
+            if system.strip():
+                last_system = system
+                obs_types[system] = []
+            obs_types[last_system].extend(line[7:60].decode('ascii').split())
+        elif label == b'END OF HEADER':
+            break
+    if version is not None and version < 3:
+        raise ValueError(f"Поддерживаются только файлы RINEX 3, версия файла {version}")
+
+    blocks = {}
+    for system, codes in obs_types.items():
+        if systems is not None and system not in systems:
+            continue
+        wanted = observables.get(system, ()) if isinstance(observables, dict) else observables
+        selected = list(codes) if wanted is None else [code for code in wanted if code in codes]
+        blocks[system] = _SystemBlock(codes, selected)
+
+    epochs = []
+    remaining = 0
+    skip = 0
+    for line in lines:
+        if skip:
+            # Записи событий (флаги 2-5) и наблюдения с флагом 6 пропускаются
+            skip -= 1
+            continue
+        if line[:1] == b'>':
+            flag = int(line[31:32] or b'0')
+            count = int(line[32:35] or b'0')
+            if flag > 1:
+                skip, remaining = count, 0
+                continue
+            epochs.append(_epoch_time(line))
+            remaining = count
+            continue
+        if remaining:
+            remaining -= 1
+            block = blocks.get(line[:1].decode('ascii', errors='replace'))
+            if block is not None:
+                block.add(line, len(epochs) - 1)
+
+    epoch_index, observations = {}, {}
+    for block in blocks.values():
+        block.flush()
+        if not block.parts:
+            continue
+        sats = np.concatenate([part[0] for part in block.parts])
+        rows = np.concatenate([part[1] for part in block.parts])
+        values = [np.concatenate([part[2][j] for part in block.parts]) for j in range(len(block.codes))]
+        # Строки системы группируются по спутнику с сохранением порядка эпох
+        order = np.argsort(sats, kind='stable')
+        names, starts = np.unique(sats[order], return_index=True)
+        bounds = np.append(starts, len(order))
+        for name, lo, hi in zip(names, bounds[:-1], bounds[1:]):
+            sat = name.decode('ascii').replace(' ', '0')
+            idx = order[lo:hi]
+            epoch_index[sat] = rows[idx]
+            observations[sat] = {code: column[idx] for code, column in zip(block.codes, values)}
+
+    return RinexObs(
+        marker_name=marker_name,
+        approx_position=position,
+        interval=interval,
+        obs_types=obs_types,
+        epochs=np.array(epochs, dtype='datetime64[ms]'),
+        epoch_index=epoch_index,
+        observations=observations,
+    )
+
+
+def carrier_frequency(sat: str, code: str) -> float:
+    """
+    Несущая частота наблюдаемой code спутника sat, Гц.
+
+    Raises:
+        ValueError: частота не определяется по коду (ГЛОНАСС FDMA, неизвестная система или диапазон)
+    """
+    system, band = sat[0], code[1:2]
+    if system == 'R':
+        raise ValueError(f"Частота ГЛОНАСС {sat} зависит от литеры канала, передайте frequencies=(f1, f2)")
+    if system not in FREQUENCIES:
+        raise ValueError(f"Неизвестная система {system!r} спутника {sat}, передайте frequencies=(f1, f2)")
+    if band not in FREQUENCIES[system]:
+        raise ValueError(f"Неизвестный диапазон {band!r} наблюдаемой {code} для системы {system}")
+    return FREQUENCIES[system][band]
+
+
+def slant_tec(obs: RinexObs, sat: str, code1: str, code2: str,
+              frequencies: tuple[float, float] | None = None) -> NDArray:
+    """
+    Наклонный TEC по геометрически свободной комбинации двух частот, TECU.
+
+    Для псевдодальностей (C..) результат абсолютный, но шумный; для фаз (L..)
+    - точный с точностью до постоянной (неоднозначность) на каждой дуге.
+
+    Args:
+        obs: наблюдения станции
+        sat: спутник ('G05')
+        code1, code2: наблюдаемые одного типа на двух частотах, например 'C1C' и 'C2W'
+        frequencies: частоты (f1, f2) в Гц, если их нельзя определить по коду (например, ГЛОНАСС)
+
+    Returns:
+        NDArray: TEC по эпохам спутника (см. RinexObs.times); NaN, если нет наблюдения
+
+    Raises:
+        ValueError: частоты не заданы и не определяются по кодам наблюдаемых
+    """
+    if frequencies is not None:
+        f1, f2 = frequencies
+    else:
+        f1, f2 = carrier_frequency(sat, code1), carrier_frequency(sat, code2)
+    values1, values2 = obs.observations[sat][code1], obs.observations[sat][code2]
+    factor = f1 ** 2 * f2 ** 2 / (IONO_FACTOR * (f1 ** 2 - f2 ** 2)) / TECU
+    if code1[0] == 'L':
+        # Фаза в циклах: в метры, знак задержки противоположен коду
+        return factor * (values1 * SPEED_OF_LIGHT / f1 - values2 * SPEED_OF_LIGHT / f2)
+    return factor * (values2 - values1)
@@ -134,35 +134,71 @@ import logging
 logging.getLogger("requests").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 300)
+RETRIES = 5
+
 def load_data(
     url: str,
     local_file: Path,
     override: bool = False
 ) -> None:
+    """Downloads url to local_file.
+
+    Data goes to `<local_file>.part` in 1 MB chunks. After a broken connection
+    the download continues from the end of the part file with an HTTP Range
+    request (up to RETRIES attempts; re-running the cell also resumes). The file
+    is renamed to local_file only after its size matches Content-Length and it
+    starts with the HDF5 signature.
+    """
     if local_file.exists() and not override:
         print(f"File {local_file} exists. Use override=True to download it again.")
         return
 
-    with open(local_file, "wb") as f:
-        print(f"Downloading {local_file} from {url}")
-        response = requests.get(url, stream=True)
-        total_length = response.headers.get('content-length')
-
-        if total_length is None:
-            f.write(response.content)
-        else:
-            dl = 0
-            previous = 0
-            total_length = int(total_length)
-            for chunk in response.iter_content(chunk_size=4096):
-                dl += len(chunk)
-                f.write(chunk)
-                done = int(50 * dl / total_length)
-                if done > previous: # to prevent warnings from notebook
-                    sys.stdout.write("\r[%s%s]" % ('=' * done, ' ' * (50-done)) )
-                    sys.stdout.flush()
-                previous = done
-            sys.stdout.write("\n")
+    part_file = local_file.with_name(local_file.name + ".part")
+    print(f"Downloading {local_file} from {url}")
+    total_length = None
+    for attempt in range(RETRIES + 1):
+        dl = part_file.stat().st_size if part_file.exists() else 0
+        headers = {"Range": f"bytes={dl}-"} if dl else {}
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                if response.status_code == 416:  # part file is already complete
+                    break
+                response.raise_for_status()
+                if response.status_code != 206:  # server ignored Range, start over
+                    dl = 0
+                    length = response.headers.get('content-length')
+                    total_length = int(length) if length else None
+                else:
+                    total_length = int(response.headers['content-range'].rpartition('/')[2])
+                previous = 0
+                with open(part_file, "ab" if dl else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        dl += len(chunk)
+                        f.write(chunk)
+                        if total_length:
+                            done = int(50 * dl / total_length)
+                            if done > previous: # to prevent warnings from notebook
+                                sys.stdout.write("\r[%s%s]" % ('=' * done, ' ' * (50-done)) )
+                                sys.stdout.flush()
+                            previous = done
+            if total_length is None or dl >= total_length:
+                break
+        except requests.exceptions.RequestException as e:
+            if attempt == RETRIES:
+                raise
+            print(f"\nConnection error: {e}. Resuming...")
+    sys.stdout.write("\n")
+
+    size = part_file.stat().st_size
+    if total_length is not None and size != total_length:
+        raise IOError(f"Downloaded {size} bytes of {total_length}, run the cell again to resume")
+    with open(part_file, "rb") as f:
+        if f.read(8) != b"\x89HDF\r\n\x1a\n":
+            part_file.unlink()
+            raise IOError(f"{url} did not return an HDF5 file")
+    os.replace(part_file, local_file)
 
 """### Data download
 
@@ -281,6 +317,28 @@ class GnssSat:
             return NotImplemented
         return self.name == other.name
 
+def read_site_coordinates(local_file: str | Path) -> tuple[NDArray, NDArray, NDArray]:
+    """Reads site names and coordinates (degrees), cached in a sidecar file.
+
+    Walking all site groups of a daily file takes seconds, so the result is
+    stored next to the HDF file as `<file>.sites.npz` together with file size
+    and modification time. The cache is rebuilt when the HDF file changes.
+    """
+    local_file = Path(local_file)
+    sidecar = local_file.with_name(local_file.name + ".sites.npz")
+    stat = local_file.stat()
+    if sidecar.exists():
+        with np.load(sidecar, allow_pickle=False) as index:
+            if int(index["size"]) == stat.st_size and int(index["mtime_ns"]) == stat.st_mtime_ns:
+                return index["names"], index["lat"], index["lon"]
+    with h5py.File(local_file) as f:
+        names = list(f.keys())
+        lat = np.degrees([f[name].attrs['lat'] for name in names])
+        lon = np.degrees([f[name].attrs['lon'] for name in names])
+    names = np.array(names, dtype=str)
+    np.savez(sidecar, names=names, lat=lat, lon=lon, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    return names, lat, lon
+
 def get_sites(
     local_file: str | Path,
     min_lat: float = -90,
@@ -295,17 +353,9 @@ def get_sites(
     needed. Output will contain only site in region defined by min_lat,
     max_lat, min_lon, max_lon.
     """
-    f = h5py.File(local_file)
-    sites_names = list(f.keys())
-    sites = list()
-    for site_name in sites_names:
-        site_info = f[site_name].attrs
-        site_lat = np.degrees(site_info['lat'])
-        site_lon = np.degrees(site_info['lon'])
-        if min_lat < site_lat < max_lat and min_lon < site_lon < max_lon:
-            sites.append(GnssSite(site_name, site_lat, site_lon))
-    f.close()
-    return sites
+    names, lat, lon = read_site_coordinates(local_file)
+    in_region = (min_lat < lat) & (lat < max_lat) & (min_lon < lon) & (lon < max_lon)
+    return [GnssSite(str(names[i]), lat[i], lon[i]) for i in np.nonzero(in_region)[0]]
 
 sites = get_sites(
     series_files[study_date].local_path,
@@ -324,6 +374,8 @@ Given sites we can retrieve data for them. See hdf-file structure to see how thi
 def retrieve_visible_sats_data(
     local_file: str | Path,
     sites: list[GnssSite],
+    products: tuple[DataProducts, ...] = tuple(DataProducts),
+    time_window: tuple[datetime, datetime] | None = None,
 ) -> dict[GnssSite, dict[GnssSat, dict[DataProduct, NDArray]]]:
     """Select data for given epoch and sites.
 
@@ -331,7 +383,17 @@ def retrieve_visible_sats_data(
     We addres data related to particular site and satellite as
     result[SITE][SAT]. For example ROTI data for IRKJ site and G21 satellites
     will be retrieved from result as result["irkj"]["G21"]["roti"]
+
+    Only datasets listed in `products` are read from the file, so plotting
+    a single product does not load all of them. If `time_window` (start, end)
+    is given, index bounds are found by binary search over timestamps and
+    only this slice of every dataset is read.
     """
+    hdf_names = {
+        data_product: data_product.value.hdf_name
+        for data_product in products
+        if data_product.value.hdf_name is not None
+    }
     f = h5py.File(local_file)
     data = dict()
     for site in sites:
@@ -341,14 +403,24 @@ def retrieve_visible_sats_data(
         sats = f[site.name].keys()
         for sat_name in sats:
             sat = GnssSat(sat_name, sat_name[0])
-            timestamps = f[site.name][sat.name][DataProducts.timestamp.value.hdf_name][:]
-            times = [datetime.fromtimestamp(t).replace(tzinfo= _UTC) for t in timestamps]
-            # time is not in HDF so we add it separate from loop over other data products
-            data[site][sat] = {DataProducts.time.value: np.array(times)}
-            for data_product in DataProducts:
-                if data_product.value.hdf_name is None:
+            sat_group = f[site.name][sat.name]
+            timestamps = sat_group[DataProducts.timestamp.value.hdf_name][:]
+            window = slice(None)
+            if time_window is not None:
+                window = slice(
+                    np.searchsorted(timestamps, time_window[0].timestamp(), side='left'),
+                    np.searchsorted(timestamps, time_window[1].timestamp(), side='right'),
+                )
+                if window.start == window.stop:
                     continue
-                data[site][sat][data_product] = f[site.name][sat.name][data_product.value.hdf_name][:]
+                timestamps = timestamps[window]
+            data[site][sat] = dict()
+            if DataProducts.time in products:
+                # time is not in HDF so we add it separate from loop over other data products
+                # single cast of UTC epoch seconds to datetime64, no python datetime objects
+                data[site][sat][DataProducts.time.value] = np.rint(timestamps).astype(np.int64).astype('datetime64[s]')
+            for data_product, hdf_name in hdf_names.items():
+                data[site][sat][data_product] = sat_group[hdf_name][window]
     f.close()
     return data
 
@@ -370,7 +442,16 @@ def reoder_data_by_sat(
 Now we are ready to retrieve data from HDF file.
 """
 
-series_by_site = retrieve_visible_sats_data(series_files[study_date].local_path, sites)
+series_by_site = retrieve_visible_sats_data(
+    series_files[study_date].local_path,
+    sites,
+    products=(DataProducts.time, DataProducts.roti, DataProducts.dtec_2_10),
+    # plots below show one hour around the event, so only that window is read
+    time_window=(
+        datetime(2025, 1, 5, 11).replace(tzinfo=_UTC),
+        datetime(2025, 1, 5, 13).replace(tzinfo=_UTC),
+    ),
+)
 series_by_sat = reoder_data_by_sat(series_by_site)
 
 """# Develop function for plots
@@ -449,8 +530,9 @@ def plot_single_sat(
     start_time = datetime(2999, 1, 1).replace(tzinfo=_UTC)
     for site, d in data_plot[sat].items():
         _t = d[DataProducts.time.value]
-        if start_time > _t[0]:
-            start_time = _t[0]
+        _t0 = _t[0].item().replace(tzinfo=_UTC)
+        if start_time > _t0:
+            start_time = _t0
         _val = d[plot_product]
         #for i in range(len(_t)-1):
             #if d['times'][i] - d['times'][i+1] > timedelta(0, 30):
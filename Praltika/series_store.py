@@ -0,0 +1,232 @@
+"""
+Колоночное хранилище временных рядов пар (станция, спутник).
+
+Вместо словаря site -> sat -> product с тысячами маленьких массивов каждый
+продукт хранится одним массивом, в котором ряды пар идут подряд (как в
+формате CSR): ряд пары p занимает диапазон offsets[p]:offsets[p + 1].
+Станции и спутники закодированы целыми индексами в таблицы имён. Доступ
+"сначала станция" и "сначала спутник" - представления SeriesView поверх
+одного хранилища, которые возвращают срезы столбцов без копирования.
+
+На диске хранилище - каталог с .npy файлом на каждый массив и meta.json.
+Загрузка открывает массивы через memory map, поэтому почти ничего не читает.
+"""
+import json
+import os
+import shutil
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+@dataclass
+class SeriesStore:
+    """Ряды всех пар (станция, спутник) в виде плоских массивов."""
+    # Таблица станций (S)
+    site_names: NDArray
+    site_lat: NDArray
+    site_lon: NDArray
+    # Таблица спутников (K)
+    sat_names: NDArray
+    # Пары (P): индексы станции и спутника, границы рядов в столбцах (P + 1)
+    pair_site: NDArray
+    pair_sat: NDArray
+    offsets: NDArray
+    # Столбцы продуктов длиной offsets[-1] и признак наличия продукта у пары (P)
+    columns: dict[str, NDArray]
+    present: dict[str, NDArray]
+    _groups: dict = field(default=None, init=False, repr=False, compare=False)
+
+    TABLES = ('site_names', 'site_lat', 'site_lon', 'sat_names', 'pair_site', 'pair_sat', 'offsets')
+
+    def __len__(self) -> int:
+        return len(self.pair_site)
+
+    @property
+    def n_samples(self) -> int:
+        return int(self.offsets[-1])
+
+    def series(self, pair: int, column: str) -> NDArray:
+        """Ряд продукта column для пары pair (срез без копирования)."""
+        return self.columns[column][self.offsets[pair]:self.offsets[pair + 1]]
+
+    def sample_pairs(self) -> NDArray:
+        """Индекс пары для каждого отсчёта столбцов - для векторных расчётов по всему набору."""
+        return np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.offsets))
+
+    def add_column(self, name: str, values: NDArray, present: NDArray | None = None) -> None:
+        """Добавляет столбец, вычисленный по всему набору (например, время из timestamp)."""
+        if len(values) != self.n_samples:
+            raise ValueError(f"Длина столбца {name}: {len(values)}, ожидается {self.n_samples}")
+        self.columns[name] = values
+        self.present[name] = np.ones(len(self), dtype=bool) if present is None else present
+
+    def groups(self, by: str) -> tuple[NDArray, NDArray]:
+        """
+        Пары, сгруппированные по станции (by='site') или спутнику (by='sat').
+
+        Returns:
+            tuple: (order, group_offsets) - пары группы i: order[group_offsets[i]:group_offsets[i + 1]]
+        """
+        if self._groups is None:
+            self._groups = {}
+        if by not in self._groups:
+            codes, size = (self.pair_site, len(self.site_names)) if by == 'site' else (self.pair_sat, len(self.sat_names))
+            order = np.argsort(codes, kind='stable')
+            group_offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=size))])
+            self._groups[by] = (order, group_offsets)
+        return self._groups[by]
+
+    def by_site(self, site_keys=None, sat_keys=None, product_keys: dict | None = None) -> 'SeriesView':
+        """Представление store[site][sat][product]."""
+        return SeriesView(self, 'site', site_keys, sat_keys, product_keys)
+
+    def by_sat(self, site_keys=None, sat_keys=None, product_keys: dict | None = None) -> 'SeriesView':
+        """Представление store[sat][site][product]."""
+        return SeriesView(self, 'sat', site_keys, sat_keys, product_keys)
+
+    def save(self, path: str | Path, metadata: dict | None = None) -> None:
+        """
+        Сохраняет хранилище в каталог path: по .npy файлу на массив и meta.json.
+
+        Каталог пишется рядом и подменяет старый целиком, поэтому массивы,
+        открытые из старого каталога через memory map, остаются валидными.
+
+        Args:
+            path: каталог хранилища
+            metadata: дополнительные данные для meta.json (должны сериализоваться в JSON)
+        """
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        old = path.with_name(path.name + '.old')
+        for stale in (tmp, old):
+            if stale.exists():
+                shutil.rmtree(stale)
+        tmp.mkdir(parents=True)
+        for name in self.TABLES:
+            np.save(tmp / f"{name}.npy", getattr(self, name))
+        for name in self.columns:
+            np.save(tmp / f"column_{name}.npy", self.columns[name])
+            np.save(tmp / f"present_{name}.npy", self.present[name])
+        with open(tmp / "meta.json", "w", encoding='utf-8') as f:
+            json.dump({'columns': list(self.columns), 'metadata': metadata or {}}, f, ensure_ascii=False)
+        if path.exists():
+            os.replace(path, old)
+        os.replace(tmp, path)
+        if old.exists():
+            shutil.rmtree(old)
+
+    @classmethod
+    def load(cls, path: str | Path, mmap_mode: str | None = 'r') -> 'SeriesStore':
+        """Открывает хранилище из каталога; по умолчанию массивы открываются через memory map (только чтение)."""
+        path = Path(path)
+        columns = read_store_meta(path)['columns']
+        tables = {name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode) for name in cls.TABLES}
+        return cls(
+            **tables,
+            columns={name: np.load(path / f"column_{name}.npy", mmap_mode=mmap_mode) for name in columns},
+            present={name: np.load(path / f"present_{name}.npy", mmap_mode=mmap_mode) for name in columns},
+        )
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_groups'] = None
+        return state
+
+
+def read_store_meta(path: str | Path) -> dict:
+    """Содержимое meta.json хранилища: {'columns': [...], 'metadata': {...}}."""
+    with open(Path(path) / "meta.json", encoding='utf-8') as f:
+        return json.load(f)
+
+
+class SeriesView(Mapping):
+    """
+    Вложенные словари поверх SeriesStore без копирования данных.
+
+    Ключи станций и спутников - объекты вызывающего кода (например, GnssSite
+    и GnssSat) в порядке таблиц хранилища; по умолчанию - имена. Ключи
+    продуктов задаются словарём {ключ: имя столбца}.
+    """
+
+    def __init__(self, store: SeriesStore, outer: str, site_keys=None, sat_keys=None,
+                 product_keys: dict | None = None):
+        self.store = store
+        self.outer = outer
+        self.site_keys = list(store.site_names.tolist() if site_keys is None else site_keys)
+        self.sat_keys = list(store.sat_names.tolist() if sat_keys is None else sat_keys)
+        self.product_keys = {name: name for name in store.columns} if product_keys is None else dict(product_keys)
+        self._order, self._group_offsets = store.groups(outer)
+        outer_keys = self.site_keys if outer == 'site' else self.sat_keys
+        counts = np.diff(self._group_offsets)
+        # Только станции/спутники, у которых есть ряды
+        self._index = {outer_keys[i]: i for i in np.nonzero(counts)[0]}
+
+    def transposed(self) -> 'SeriesView':
+        """То же хранилище с другим порядком ключей (станция <-> спутник)."""
+        return SeriesView(self.store, 'sat' if self.outer == 'site' else 'site',
+                          self.site_keys, self.sat_keys, self.product_keys)
+
+    def __getitem__(self, key) -> 'PairsView':
+        i = self._index[key]
+        pairs = self._order[self._group_offsets[i]:self._group_offsets[i + 1]]
+        if self.outer == 'site':
+            return PairsView(self.store, pairs, self.store.pair_sat[pairs], self.sat_keys, self.product_keys)
+        return PairsView(self.store, pairs, self.store.pair_site[pairs], self.site_keys, self.product_keys)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class PairsView(Mapping):
+    """Ряды одной станции по спутникам (или одного спутника по станциям)."""
+
+    def __init__(self, store: SeriesStore, pairs: NDArray, codes: NDArray, keys: list, product_keys: dict):
+        self.store = store
+        self.product_keys = product_keys
+        self._pairs = {keys[c]: int(p) for c, p in zip(codes.tolist(), pairs.tolist())}
+
+    def __getitem__(self, key) -> 'ProductsView':
+        return ProductsView(self.store, self._pairs[key], self.product_keys)
+
+    def __contains__(self, key) -> bool:
+        return key in self._pairs
+
+    def __iter__(self) -> Iterator:
+        return iter(self._pairs)
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+
+class ProductsView(Mapping):
+    """Продукты одной пары: срезы столбцов хранилища."""
+
+    def __init__(self, store: SeriesStore, pair: int, product_keys: dict):
+        self.store = store
+        self.pair = pair
+        self._columns = {
+            key: column for key, column in product_keys.items()
+            if column in store.columns and store.present[column][pair]
+        }
+
+    def __getitem__(self, key) -> NDArray:
+        return self.store.series(self.pair, self._columns[key])
+
+    def __contains__(self, key) -> bool:
+        return key in self._columns
+
+    def __iter__(self) -> Iterator:
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
@@ -0,0 +1,179 @@
+"""
+Интервалы пересечения SIP траекторий с полигоном с адаптивным уточнением по времени.
+
+Геометрия сначала считается на грубой сетке (COARSE_STEP_SECONDS). Затем
+уточняются только отрезки сетки, на концах которых состояние "SIP видимого
+спутника внутри полигона" различается, или SIP проходит ближе margin_deg к
+границе полигона: такие отрезки делятся пополам до длины tolerance секунд.
+Результат - интервалы входа/выхода для каждой пары (станция, спутник).
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.typing import NDArray
+
+from ephemeris import GPS_EPOCH, BroadcastEphemeris, satellite_positions, to_gps_seconds
+from polygon import distance_to_boundary, points_in_polygon
+from sip_geometry import (ELEVATION_CUTOFF_DEG, pair_elevation_azimuth, sip_coordinates,
+                          station_geometry, stations_to_ecef)
+
+COARSE_STEP_SECONDS = 300
+CROSSING_TOLERANCE_SECONDS = 1.0
+# Запас до границы полигона на грубом шаге; SIP смещается за 5 минут на доли градуса
+CROSSING_MARGIN_DEG = 1.0
+
+
+@dataclass
+class CrossingIntervals:
+    """Интервалы нахождения SIP внутри полигона; время в шкале GPS, datetime64[ms]."""
+    stations: list
+    satellites: list
+    station: NDArray
+    satellite: NDArray
+    start: NDArray
+    end: NDArray
+    # Число расчётов геометрии (пар станция-спутник-момент) на грубой сетке и при уточнении
+    coarse_evaluations: int
+    refine_evaluations: int
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def to_dict(self) -> dict:
+        """{(станция, спутник): [(начало, конец), ...]}"""
+        intervals = {}
+        for s, k, t0, t1 in zip(self.station, self.satellite, self.start, self.end):
+            intervals.setdefault((self.stations[s], self.satellites[k]), []).append((t0, t1))
+        return intervals
+
+
+def _gps_datetime(seconds: NDArray) -> NDArray:
+    return GPS_EPOCH + np.round(np.asarray(seconds) * 1000).astype('timedelta64[ms]')
+
+
+def _evaluate(ephemeris, sats, stations_xyz, stations_latlon, s_idx, k_idx, t, polygon, cutoff):
+    """Состояние и расстояние до границы для набора троек (станция, спутник, момент)."""
+    sat_xyz = np.full((len(t), 3), np.nan)
+    for k in np.unique(k_idx):
+        sel = k_idx == k
+        sat_xyz[sel] = satellite_positions(ephemeris, [sats[k]], t[sel])[0]
+    el, az = pair_elevation_azimuth(stations_xyz[s_idx], sat_xyz)
+    sip_lat, sip_lon = sip_coordinates(
+        np.radians(stations_latlon[s_idx, 0]), np.radians(stations_latlon[s_idx, 1]), el, az
+    )
+    return _state(el, sip_lat, sip_lon, polygon, cutoff)
+
+
+def _state(el, sip_lat, sip_lon, polygon, cutoff):
+    with np.errstate(invalid='ignore'):
+        visible = el >= cutoff
+    inside = visible & points_in_polygon(sip_lat, sip_lon, polygon)
+    # Для невидимых отсчётов граница полигона не важна
+    distance = np.where(visible, distance_to_boundary(sip_lat, sip_lon, polygon), np.inf)
+    return inside, distance
+
+
+def crossing_intervals(ephemeris: BroadcastEphemeris, sats: list, stations: list, stations_latlon: NDArray,
+                       stations_height: NDArray, polygon_points, start, end,
+                       elevation_cutoff: float = ELEVATION_CUTOFF_DEG,
+                       coarse_step: float = COARSE_STEP_SECONDS,
+                       tolerance: float = CROSSING_TOLERANCE_SECONDS,
+                       margin_deg: float = CROSSING_MARGIN_DEG) -> CrossingIntervals:
+    """
+    Интервалы, в которых SIP спутника (выше маски по элевейшн) находится внутри полигона.
+
+    Args:
+        ephemeris: разобранный навигационный файл
+        sats: список спутников
+        stations: коды станций
+        stations_latlon: координаты станций (S, 2), градусы
+        stations_height: высоты станций (S,), метры
+        polygon_points: список точек полигона [(lat, lon), ...]
+        start, end: границы временного диапазона (шкала GPS)
+        elevation_cutoff: маска по элевейшн, градусы
+        coarse_step: шаг грубой сетки, секунды
+        tolerance: точность границ интервалов, секунды
+        margin_deg: запас до границы полигона на грубом шаге, градусы
+
+    Returns:
+        CrossingIntervals: интервалы для всех пар (станция, спутник)
+    """
+    stations_latlon = np.asarray(stations_latlon, dtype=np.float64).reshape(-1, 2)
+    stations_height = np.asarray(stations_height, dtype=np.float64).reshape(-1)
+    stations_xyz = stations_to_ecef(stations_latlon[:, 0], stations_latlon[:, 1], stations_height)
+    cutoff = np.radians(elevation_cutoff)
+
+    t_start, t_end = to_gps_seconds([start, end])
+    grid = np.arange(t_start, t_end, coarse_step, dtype=np.float64)
+    grid = np.append(grid, t_end)
+
+    # 1. Грубая сетка: (S, K, Tc)
+    geometry = station_geometry(stations_latlon, stations_height, satellite_positions(ephemeris, sats, grid))
+    inside, distance = _state(geometry.elevation, geometry.sip_lat, geometry.sip_lon, polygon_points, cutoff)
+    coarse_evaluations = inside.size
+
+    # 2. Отрезки сетки для уточнения
+    changed = inside[..., :-1] != inside[..., 1:]
+    near = np.fmin(distance[..., :-1], distance[..., 1:]) < margin_deg
+    s_idx, k_idx, j_idx = np.nonzero(changed | near)
+    t0, t1 = grid[j_idx], grid[j_idx + 1]
+    in0, in1 = inside[s_idx, k_idx, j_idx], inside[s_idx, k_idx, j_idx + 1]
+    d0, d1 = distance[s_idx, k_idx, j_idx], distance[s_idx, k_idx, j_idx + 1]
+
+    events_s, events_k, events_t, events_in = [], [], [], []
+    refine_evaluations = 0
+    while len(t0):
+        tm = (t0 + t1) / 2
+        in_m, d_m = _evaluate(ephemeris, sats, stations_xyz, stations_latlon, s_idx, k_idx, tm, polygon_points, cutoff)
+        refine_evaluations += len(tm)
+        # Каждый отрезок делится на две половины
+        s_idx, k_idx = np.concatenate([s_idx, s_idx]), np.concatenate([k_idx, k_idx])
+        t0, t1 = np.concatenate([t0, tm]), np.concatenate([tm, t1])
+        in0, in1 = np.concatenate([in0, in_m]), np.concatenate([in_m, in1])
+        d0, d1 = np.concatenate([d0, d_m]), np.concatenate([d_m, d1])
+        changed = in0 != in1
+        length = t1 - t0
+        # Отрезки длиной не больше tolerance дают событие входа/выхода в своей середине
+        done = length <= tolerance
+        event = done & changed
+        events_s.append(s_idx[event])
+        events_k.append(k_idx[event])
+        events_t.append((t0[event] + t1[event]) / 2)
+        events_in.append(in1[event])
+        # Запас до границы уменьшается вместе с длиной отрезка
+        keep = ~done & (changed | (np.fmin(d0, d1) < margin_deg * length / coarse_step))
+        s_idx, k_idx, t0, t1 = s_idx[keep], k_idx[keep], t0[keep], t1[keep]
+        in0, in1, d0, d1 = in0[keep], in1[keep], d0[keep], d1[keep]
+
+    # 3. Сборка интервалов: начальное состояние на начале сетки и события входа/выхода
+    start_s, start_k = np.nonzero(inside[..., 0])
+    end_s, end_k = np.nonzero(inside[..., -1])
+    ev_s = np.concatenate(events_s + [start_s, end_s]).astype(np.int64)
+    ev_k = np.concatenate(events_k + [start_k, end_k]).astype(np.int64)
+    ev_t = np.concatenate(events_t + [np.full(len(start_s), t_start), np.full(len(end_s), t_end)])
+    # Вход - True; на начале сетки - вход, на конце - выход
+    ev_in = np.concatenate(events_in + [np.ones(len(start_s), bool), np.zeros(len(end_s), bool)])
+    order = np.lexsort((ev_t, ev_k, ev_s))
+
+    station_out, sat_out, start_out, end_out = [], [], [], []
+    opened = {}
+    for i in order:
+        key = (ev_s[i], ev_k[i])
+        if ev_in[i]:
+            opened.setdefault(key, ev_t[i])
+        elif key in opened:
+            station_out.append(key[0])
+            sat_out.append(key[1])
+            start_out.append(opened.pop(key))
+            end_out.append(ev_t[i])
+
+    return CrossingIntervals(
+        stations=list(stations),
+        satellites=list(sats),
+        station=np.array(station_out, dtype=np.int32),
+        satellite=np.array(sat_out, dtype=np.int16),
+        start=_gps_datetime(start_out),
+        end=_gps_datetime(end_out),
+        coarse_evaluations=int(coarse_evaluations),
+        refine_evaluations=int(refine_evaluations),
+    )
@@ -0,0 +1,283 @@
+"""
+Пакетный расчёт геометрии станция-спутник.
+
+Элевейшн, азимут и координаты подыоносферных точек (SIP) считаются сразу
+для всех станций × спутников × эпох трансляцией массивов NumPy. Формулы
+совпадают с xyz_to_el_az и calculate_sips из sip_utils. Станции
+обрабатываются блоками, размер которых подбирается под бюджет памяти.
+Отсчёты ниже маски по элевейшн отбрасываются сразу после расчёта углов,
+дальше идут только видимые тройки станция-спутник-эпоха.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.typing import NDArray
+
+from polygon import points_in_polygon
+
+RE = 6378000.0
+HEIGHT_OF_THIN_IONOSPHERE = 300000
+FLATTENING = 0.003353
+ELEVATION_CUTOFF_DEG = 10.0
+GEOMETRY_MEMORY_BUDGET = 512 * 1024 ** 2
+# Примерное число промежуточных массивов float64 размера (K, T) на одну станцию
+_ARRAYS_PER_STATION = 24
+
+
+@dataclass
+class StationGeometry:
+    """Геометрия для блока станций [start, stop): все массивы формы (S, K, T), углы в радианах, SIP в градусах."""
+    start: int
+    stop: int
+    elevation: NDArray
+    azimuth: NDArray
+    sip_lat: NDArray
+    sip_lon: NDArray
+
+
+@dataclass
+class VisibleGeometry:
+    """
+    Видимые отсчёты блока станций [start, stop), сжатые в одномерные массивы.
+
+    station_idx - абсолютный индекс станции, sat_idx и epoch_idx - индексы в
+    массиве спутников (K, T). Отсчёты упорядочены по станции, спутнику и эпохе.
+    """
+    start: int
+    stop: int
+    station_idx: NDArray
+    sat_idx: NDArray
+    epoch_idx: NDArray
+    elevation: NDArray
+    azimuth: NDArray
+    sip_lat: NDArray
+    sip_lon: NDArray
+
+    def station_slice(self, station: int) -> slice:
+        """Срез отсчётов одной станции (абсолютный индекс)."""
+        lo, hi = np.searchsorted(self.station_idx, [station, station + 1])
+        return slice(int(lo), int(hi))
+
+    def station_samples(self, station: int) -> tuple:
+        """Отсчёты одной станции: (sat_idx, epoch_idx, elevation, azimuth, sip_lat, sip_lon)."""
+        part = self.station_slice(station)
+        return (
+            self.sat_idx[part], self.epoch_idx[part],
+            self.elevation[part], self.azimuth[part],
+            self.sip_lat[part], self.sip_lon[part],
+        )
+
+
+def stations_to_ecef(lat, lon, height) -> NDArray:
+    """
+    ECEF координаты станций (то же приближение, что использовалось для одной станции).
+
+    Args:
+        lat: широты станций, градусы
+        lon: долготы станций, градусы
+        height: высоты станций, метры
+
+    Returns:
+        NDArray: массив (S, 3)
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    height = np.asarray(height, dtype=np.float64)
+    n = RE / np.sqrt(1 - (2 * FLATTENING - FLATTENING ** 2) * np.sin(lat) ** 2)
+    return np.stack([
+        (n + height) * np.cos(lat) * np.cos(lon),
+        (n + height) * np.cos(lat) * np.sin(lon),
+        (n * (1 - FLATTENING ** 2) + height) * np.sin(lat),
+    ], axis=-1)
+
+
+def stations_per_chunk(n_sats: int, n_epochs: int, memory_budget: int = GEOMETRY_MEMORY_BUDGET) -> int:
+    """Сколько станций помещается в один блок при заданном бюджете памяти."""
+    per_station = max(1, n_sats * n_epochs * 8 * _ARRAYS_PER_STATION)
+    return max(1, memory_budget // per_station)
+
+
+@dataclass
+class SatelliteTerms:
+    """Не зависящие от станции величины для спутников (K, T): радиус и тригонометрия сферических координат."""
+    xyz: NDArray
+    r: NDArray
+    sin_b: NDArray
+    cos_b: NDArray
+    sin_l: NDArray
+    cos_l: NDArray
+
+
+def satellite_terms(sats_xyz: NDArray) -> SatelliteTerms:
+    """Предварительный расчёт величин спутников, общих для всех станций."""
+    sats_xyz = np.asarray(sats_xyz, dtype=np.float64)
+    x_s, y_s, z_s = sats_xyz[..., 0], sats_xyz[..., 1], sats_xyz[..., 2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.sqrt(x_s ** 2 + y_s ** 2 + z_s ** 2)
+        b_s = np.arcsin(z_s / r)
+    l_s = np.arctan2(y_s, x_s)
+    return SatelliteTerms(sats_xyz, r, np.sin(b_s), np.cos(b_s), np.sin(l_s), np.cos(l_s))
+
+
+def elevation_azimuth(stations_xyz: NDArray, sats, earth_radius=RE) -> tuple[NDArray, NDArray]:
+    """
+    Элевейшн и азимут для станций (S, 3) и спутников (K, T, 3).
+
+    Args:
+        stations_xyz: ECEF координаты станций (S, 3)
+        sats: массив координат спутников (K, T, 3) или результат satellite_terms
+
+    Returns:
+        tuple: (elevation, azimuth) формы (S, K, T) в радианах; NaN там, где нет координат спутника
+    """
+    if not isinstance(sats, SatelliteTerms):
+        sats = satellite_terms(sats)
+    return _elevation_azimuth(np.asarray(stations_xyz, dtype=np.float64)[:, None, None, :], sats, earth_radius)
+
+
+def pair_elevation_azimuth(stations_xyz: NDArray, sats_xyz: NDArray, earth_radius=RE) -> tuple[NDArray, NDArray]:
+    """Элевейшн и азимут для пар станция-спутник: оба массива формы (N, 3), результат (N,)."""
+    return _elevation_azimuth(np.asarray(stations_xyz, dtype=np.float64), satellite_terms(sats_xyz), earth_radius)
+
+
+def _elevation_azimuth(site: NDArray, sats: SatelliteTerms, earth_radius=RE) -> tuple[NDArray, NDArray]:
+    """Общая часть расчёта углов; site транслируется на форму массивов sats с осью координат в конце."""
+    x_0, y_0, z_0 = site[..., 0], site[..., 1], site[..., 2]
+    b_0 = np.arcsin(z_0 / np.sqrt(x_0 ** 2 + y_0 ** 2 + z_0 ** 2))
+    l_0 = np.arctan2(y_0, x_0)
+    sin_b0, cos_b0, sin_l0, cos_l0 = np.sin(b_0), np.cos(b_0), np.sin(l_0), np.cos(l_0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # cos(l_s - l_0) через заранее посчитанные sin/cos долготы спутника
+        cos_dl = sats.cos_l * cos_l0 + sats.sin_l * sin_l0
+        cos_sigma = sin_b0 * sats.sin_b + cos_b0 * sats.cos_b * cos_dl
+        sin_sigma = np.sqrt(1 - cos_sigma ** 2)
+        dx = sats.xyz[..., 0] - x_0
+        dy = sats.xyz[..., 1] - y_0
+        dz = sats.xyz[..., 2] - z_0
+        x_t = -dx * sin_l0 + dy * cos_l0
+        y_t = -dx * cos_l0 * sin_b0 - dy * sin_l0 * sin_b0 + dz * cos_b0
+        # cos/sin от sigma = arctan2(sin_sigma, cos_sigma) с нормировкой, как в xyz_to_el_az
+        norm = np.hypot(sin_sigma, cos_sigma)
+        el = np.arctan2(cos_sigma / norm - earth_radius / sats.r, sin_sigma / norm)
+    az = np.arctan2(x_t, y_t)
+    az = np.where(az < 0, az + 2 * np.pi, az)
+    return el, az
+
+
+def sip_coordinates(site_lat, site_lon, elevation: NDArray, azimuth: NDArray,
+                    ionospheric_height=HEIGHT_OF_THIN_IONOSPHERE, earth_radius=RE) -> tuple[NDArray, NDArray]:
+    """
+    Координаты SIP; все аргументы согласованы по правилам трансляции NumPy.
+
+    Args:
+        site_lat: широты станций, радианы
+        site_lon: долготы станций, радианы
+        elevation: элевейшн, радианы
+        azimuth: азимут, радианы
+
+    Returns:
+        tuple: (lat, lon) SIP в градусах
+    """
+    site_lat = np.asarray(site_lat, dtype=np.float64)
+    site_lon = np.asarray(site_lon, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        psi = (np.pi / 2 - elevation) - np.arcsin(np.cos(elevation) * earth_radius / (earth_radius + ionospheric_height))
+        lat = np.arcsin(np.sin(site_lat) * np.cos(psi) + np.cos(site_lat) * np.sin(psi) * np.cos(azimuth))
+        lon = site_lon + np.arcsin(np.sin(psi) * np.sin(azimuth) / np.cos(site_lat))
+    lon = np.where(lon > np.pi, lon - 2 * np.pi, lon)
+    lon = np.where(lon < -np.pi, lon + 2 * np.pi, lon)
+    return np.degrees(lat), np.degrees(lon)
+
+
+def iter_station_geometry(stations_latlon: NDArray, stations_height: NDArray, sats_xyz: NDArray,
+                          memory_budget: int = GEOMETRY_MEMORY_BUDGET):
+    """
+    Геометрия для всех станций блоками, укладывающимися в memory_budget.
+
+    Args:
+        stations_latlon: координаты станций (S, 2), градусы
+        stations_height: высоты станций (S,), метры
+        sats_xyz: координаты спутников (K, T, 3), NaN - нет данных
+        memory_budget: ограничение памяти на блок, байты
+
+    Yields:
+        StationGeometry: результаты для очередного блока станций
+    """
+    stations_latlon = np.asarray(stations_latlon, dtype=np.float64).reshape(-1, 2)
+    stations_height = np.asarray(stations_height, dtype=np.float64).reshape(-1)
+    sats = satellite_terms(sats_xyz)
+    stations_xyz = stations_to_ecef(stations_latlon[:, 0], stations_latlon[:, 1], stations_height)
+    chunk = stations_per_chunk(sats.r.shape[0], sats.r.shape[1], memory_budget)
+    for start in range(0, len(stations_latlon), chunk):
+        stop = min(start + chunk, len(stations_latlon))
+        el, az = elevation_azimuth(stations_xyz[start:stop], sats)
+        sip_lat, sip_lon = sip_coordinates(
+            np.radians(stations_latlon[start:stop, 0])[:, None, None],
+            np.radians(stations_latlon[start:stop, 1])[:, None, None],
+            el, az
+        )
+        yield StationGeometry(start, stop, el, az, sip_lat, sip_lon)
+
+
+def iter_visible_geometry(stations_latlon: NDArray, stations_height: NDArray, sats_xyz: NDArray,
+                          elevation_cutoff: float = ELEVATION_CUTOFF_DEG,
+                          memory_budget: int = GEOMETRY_MEMORY_BUDGET):
+    """
+    Как iter_station_geometry, но SIP считаются только для отсчётов с элевейшн не ниже маски.
+
+    Args:
+        stations_latlon: координаты станций (S, 2), градусы
+        stations_height: высоты станций (S,), метры
+        sats_xyz: координаты спутников (K, T, 3), NaN - нет данных
+        elevation_cutoff: маска по элевейшн, градусы
+        memory_budget: ограничение памяти на блок, байты
+
+    Yields:
+        VisibleGeometry: видимые отсчёты очередного блока станций
+    """
+    stations_latlon = np.asarray(stations_latlon, dtype=np.float64).reshape(-1, 2)
+    stations_height = np.asarray(stations_height, dtype=np.float64).reshape(-1)
+    site_lat = np.radians(stations_latlon[:, 0])
+    site_lon = np.radians(stations_latlon[:, 1])
+    sats = satellite_terms(sats_xyz)
+    stations_xyz = stations_to_ecef(stations_latlon[:, 0], stations_latlon[:, 1], stations_height)
+    chunk = stations_per_chunk(sats.r.shape[0], sats.r.shape[1], memory_budget)
+    cutoff = np.radians(elevation_cutoff)
+    for start in range(0, len(stations_latlon), chunk):
+        stop = min(start + chunk, len(stations_latlon))
+        el, az = elevation_azimuth(stations_xyz[start:stop], sats)
+        # NaN (нет координат спутника) в маску не попадает
+        with np.errstate(invalid='ignore'):
+            visible = el >= cutoff
+        s, k, t = np.nonzero(visible)
+        el, az = el[visible], az[visible]
+        sip_lat, sip_lon = sip_coordinates(
+            np.broadcast_to(site_lat[start:stop, None, None], visible.shape)[visible],
+            np.broadcast_to(site_lon[start:stop, None, None], visible.shape)[visible],
+            el, az
+        )
+        yield VisibleGeometry(start, stop, s + start, k, t, el, az, sip_lat, sip_lon)
+
+
+def station_geometry(stations_latlon: NDArray, stations_height: NDArray, sats_xyz: NDArray,
+                     memory_budget: int = GEOMETRY_MEMORY_BUDGET) -> StationGeometry:
+    """Геометрия для всех станций одним результатом (S, K, T); см. iter_station_geometry."""
+    chunks = list(iter_station_geometry(stations_latlon, stations_height, sats_xyz, memory_budget))
+    if not chunks:
+        empty = np.empty((0,) + np.shape(sats_xyz)[:2])
+        return StationGeometry(0, 0, empty, empty, empty, empty)
+    return StationGeometry(
+        0, chunks[-1].stop,
+        np.concatenate([c.elevation for c in chunks]),
+        np.concatenate([c.azimuth for c in chunks]),
+        np.concatenate([c.sip_lat for c in chunks]),
+        np.concatenate([c.sip_lon for c in chunks]),
+    )
+
+
+def samples_in_polygon(samples: tuple, polygon) -> tuple:
+    """Оставляет из отсчётов станции (см. VisibleGeometry.station_samples) только SIP внутри полигона."""
+    sip_lat, sip_lon = samples[4], samples[5]
+    inside = points_in_polygon(sip_lat, sip_lon, polygon, return_indices=True)
+    return tuple(values[inside] for values in samples)
@@ -0,0 +1,88 @@
+"""
+Расчёт пересечений SIP с полигоном по станциям, последовательно или в пуле процессов.
+
+Массив координат спутников (K, T, 3) передаётся процессам не сериализацией,
+а через временный .npy файл, который каждый процесс открывает через memory
+map. Станции делятся на непрерывные блоки, результаты блоков собираются в
+исходном порядке станций, поэтому результат совпадает с последовательным.
+"""
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from sip_geometry import ELEVATION_CUTOFF_DEG, GEOMETRY_MEMORY_BUDGET, iter_visible_geometry, samples_in_polygon
+
+SIP_WORKERS = os.cpu_count() or 1
+# Меньше станций обрабатываются в текущем процессе: запуск пула дороже расчёта
+PARALLEL_MIN_STATIONS = 8
+BLOCKS_PER_WORKER = 4
+
+
+def _station_block(sats_xyz, stations_latlon: NDArray, stations_height: NDArray, polygon_points,
+                   elevation_cutoff: float, memory_budget: int) -> list[tuple]:
+    """Отсчёты внутри полигона для блока станций, по одному кортежу массивов на станцию."""
+    results = []
+    for geometry in iter_visible_geometry(stations_latlon, stations_height, sats_xyz, elevation_cutoff, memory_budget):
+        for j in range(geometry.start, geometry.stop):
+            results.append(samples_in_polygon(geometry.station_samples(j), polygon_points))
+    return results
+
+
+def _station_block_worker(xyz_path: str, stations_latlon: NDArray, stations_height: NDArray, polygon_points,
+                          elevation_cutoff: float, memory_budget: int) -> list[tuple]:
+    """Точка входа процесса: координаты спутников открываются из файла через memory map."""
+    sats_xyz = np.load(xyz_path, mmap_mode='r')
+    return _station_block(sats_xyz, stations_latlon, stations_height, polygon_points, elevation_cutoff, memory_budget)
+
+
+def station_intersections(stations_latlon: NDArray, stations_height: NDArray, sats_xyz: NDArray, polygon_points,
+                          elevation_cutoff: float = ELEVATION_CUTOFF_DEG, workers: int = SIP_WORKERS,
+                          memory_budget: int = GEOMETRY_MEMORY_BUDGET) -> list[tuple]:
+    """
+    Видимые отсчёты всех станций, SIP которых попадают в полигон.
+
+    Args:
+        stations_latlon: координаты станций (S, 2), градусы
+        stations_height: высоты станций (S,), метры
+        sats_xyz: координаты спутников (K, T, 3), NaN - нет данных
+        polygon_points: список точек полигона [(lat, lon), ...]
+        elevation_cutoff: маска по элевейшн, градусы
+        workers: число процессов; 1 - расчёт в текущем процессе
+        memory_budget: ограничение памяти на блок станций внутри процесса, байты
+
+    Returns:
+        list: для каждой станции кортеж массивов (sat_idx, epoch_idx, elevation, azimuth, sip_lat, sip_lon)
+    """
+    stations_latlon = np.asarray(stations_latlon, dtype=np.float64).reshape(-1, 2)
+    stations_height = np.asarray(stations_height, dtype=np.float64).reshape(-1)
+    n_stations = len(stations_latlon)
+    workers = max(1, min(workers, n_stations))
+    if workers == 1 or n_stations < PARALLEL_MIN_STATIONS:
+        return _station_block(sats_xyz, stations_latlon, stations_height, polygon_points, elevation_cutoff, memory_budget)
+
+    bounds = np.linspace(0, n_stations, min(n_stations, workers * BLOCKS_PER_WORKER) + 1).astype(int)
+    # Каждый процесс держит свои блоки станций, поэтому бюджет делится между ними
+    worker_budget = max(1, memory_budget // workers)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        xyz_path = str(Path(temp_dir) / "sats_xyz.npy")
+        np.save(xyz_path, np.ascontiguousarray(sats_xyz, dtype=np.float64))
+        # spawn: процесс Streamlit многопоточный, fork из него небезопасен
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(
+                    _station_block_worker, xyz_path,
+                    stations_latlon[lo:hi], stations_height[lo:hi],
+                    polygon_points, elevation_cutoff, worker_budget
+                )
+                for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+            ]
+            # Сборка в порядке блоков, а не завершения задач
+            results = []
+            for future in futures:
+                results.extend(future.result())
+    return results
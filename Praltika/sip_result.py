@@ -0,0 +1,162 @@
+"""
+Колоночный формат результатов расчёта SIP.
+
+Точки хранятся набором массивов одинаковой длины (struct-of-arrays):
+станция и спутник - категориальные коды в таблицы станций и спутников,
+время - datetime64[s]. Для кода, работающего со списком словарей,
+есть ленивое представление SipPoints, которое строит словарь точки только
+при обращении к ней.
+"""
+import io
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.typing import NDArray
+
+POINT_COLUMNS = ['satellite', 'latitude', 'longitude', 'time', 'elevation', 'azimuth',
+                 'station', 'station_name', 'station_lat', 'station_lon']
+
+
+@dataclass
+class SipResult:
+    """Точки SIP внутри полигона в колоночном виде."""
+    # Таблица станций (категории для столбца station)
+    station_codes: NDArray
+    station_names: NDArray
+    station_lats: NDArray
+    station_lons: NDArray
+    # Таблица спутников (категории для столбца satellite)
+    satellites: NDArray
+    # Столбцы точек
+    station: NDArray
+    satellite: NDArray
+    time: NDArray
+    latitude: NDArray
+    longitude: NDArray
+    elevation: NDArray
+    azimuth: NDArray
+
+    @classmethod
+    def empty(cls, satellites=()) -> 'SipResult':
+        return cls(
+            station_codes=np.array([], dtype=str),
+            station_names=np.array([], dtype=str),
+            station_lats=np.array([], dtype=np.float64),
+            station_lons=np.array([], dtype=np.float64),
+            satellites=np.array(list(satellites), dtype=str),
+            station=np.array([], dtype=np.int32),
+            satellite=np.array([], dtype=np.int16),
+            time=np.array([], dtype='datetime64[s]'),
+            latitude=np.array([], dtype=np.float64),
+            longitude=np.array([], dtype=np.float64),
+            elevation=np.array([], dtype=np.float64),
+            azimuth=np.array([], dtype=np.float64),
+        )
+
+    @classmethod
+    def from_stations(cls, stations: list[tuple], sats: list, times: NDArray, samples: list[tuple]) -> 'SipResult':
+        """
+        Собирает результат из отсчётов станций.
+
+        Args:
+            stations: список (station_code, station_info) в порядке samples
+            sats: список спутников (K)
+            times: времена эпох (T), datetime64[s]
+            samples: для каждой станции кортеж массивов (sat_idx, epoch_idx, elevation, azimuth, sip_lat, sip_lon)
+
+        Returns:
+            SipResult: точки всех станций; в таблицу станций попадают только станции с точками
+        """
+        kept = [(station, part) for station, part in zip(stations, samples) if len(part[0])]
+        if not kept:
+            return cls.empty(sats)
+        times = np.asarray(times, dtype='datetime64[s]')
+        return cls(
+            station_codes=np.array([code.upper() for (code, _), _ in kept], dtype=str),
+            station_names=np.array([info['name'] for (_, info), _ in kept], dtype=str),
+            station_lats=np.array([info['lat'] for (_, info), _ in kept], dtype=np.float64),
+            station_lons=np.array([info['lon'] for (_, info), _ in kept], dtype=np.float64),
+            satellites=np.array(list(sats), dtype=str),
+            station=np.repeat(np.arange(len(kept), dtype=np.int32), [len(part[0]) for _, part in kept]),
+            satellite=np.concatenate([part[0] for _, part in kept]).astype(np.int16),
+            time=times[np.concatenate([part[1] for _, part in kept])],
+            elevation=np.concatenate([part[2] for _, part in kept]),
+            azimuth=np.concatenate([part[3] for _, part in kept]),
+            latitude=np.concatenate([part[4] for _, part in kept]),
+            longitude=np.concatenate([part[5] for _, part in kept]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.latitude)
+
+    @property
+    def points(self) -> 'SipPoints':
+        """Представление в старом формате: последовательность словарей точек."""
+        return SipPoints(self)
+
+    def station_column(self) -> NDArray:
+        """Коды станций для каждой точки."""
+        return self.station_codes[self.station]
+
+    def satellite_column(self) -> NDArray:
+        """Спутники для каждой точки."""
+        return self.satellites[self.satellite]
+
+    def point(self, i: int) -> dict:
+        """Точка i в формате словаря, как раньше возвращали функции расчёта SIP."""
+        s = self.station[i]
+        return {
+            'satellite': str(self.satellites[self.satellite[i]]),
+            'latitude': float(self.latitude[i]),
+            'longitude': float(self.longitude[i]),
+            'time': str(self.time[i]),
+            'elevation': float(self.elevation[i]),
+            'azimuth': float(self.azimuth[i]),
+            'station': str(self.station_codes[s]),
+            'station_name': str(self.station_names[s]),
+            'station_lat': float(self.station_lats[s]),
+            'station_lon': float(self.station_lons[s]),
+        }
+
+    def satellites_with_points(self) -> list:
+        """Спутники, у которых есть хотя бы одна точка (в порядке таблицы спутников)."""
+        return [str(self.satellites[k]) for k in np.unique(self.satellite)]
+
+    def to_csv(self) -> str:
+        """CSV со столбцами POINT_COLUMNS."""
+        s = self.station
+        columns = [
+            self.satellite_column(),
+            self.latitude, self.longitude,
+            np.datetime_as_string(self.time, unit='s'),
+            self.elevation, self.azimuth,
+            self.station_codes[s], self.station_names[s],
+            self.station_lats[s], self.station_lons[s],
+        ]
+        table = np.empty((len(self), len(columns)), dtype=object)
+        for j, column in enumerate(columns):
+            table[:, j] = column
+        buffer = io.StringIO()
+        buffer.write(','.join(POINT_COLUMNS) + '\n')
+        np.savetxt(buffer, table, fmt='%s', delimiter=',')
+        return buffer.getvalue()
+
+
+class SipPoints(Sequence):
+    """Ленивая последовательность словарей точек поверх SipResult."""
+
+    def __init__(self, result: SipResult):
+        self.result = result
+
+    def __len__(self) -> int:
+        return len(self.result)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.result.point(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.result.point(index)
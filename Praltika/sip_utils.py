@@ -3,29 +3,36 @@ import numpy as np
 from numpy.typing import NDArray
 from pathlib import Path
 from datetime import datetime, timedelta
-import gzip
-import shutil
+import io
+import os
+import threading
+import zlib
 from dataclasses import dataclass
 import logging
 import h5py
 import tempfile
 import json
 
-# Проверка доступности библиотеки coordinates
-try:
-    from coordinates import satellite_xyz
-    COORDINATES_AVAILABLE = True
-except ImportError:
-    COORDINATES_AVAILABLE = False
+from ephemeris import BroadcastEphemeris, parse_nav, satellite_positions
+from ephemeris_cache import get_default_cache
+from station_catalog import load_catalog, make_session
+from polygon import points_in_polygon
+from tec_text import TecPoints, read_tec_points
+from ionex import GimMaps, load_gim
+from rinex_obs import parse_rinex_obs
+from sip_geometry import ELEVATION_CUTOFF_DEG, HEIGHT_OF_THIN_IONOSPHERE, RE
+from sip_parallel import SIP_WORKERS, station_intersections
+from sip_result import SipResult
+from sip_crossings import COARSE_STEP_SECONDS, CROSSING_TOLERANCE_SECONDS, crossing_intervals
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # --- Константы ---
-RE = 6378000.0
 TIME_STEP_SECONDS = 30
-HEIGHT_OF_THIN_IONOSPHERE = 300000
+# Минимальная доля эпох с координатами, при которой спутник участвует в расчете
+MIN_VALID_SAT_FRACTION = 0.1
 
 # --- GNSS спутники ---
 GNSS_SATS = []
@@ -35,10 +42,71 @@ GNSS_SATS.extend(['E' + str(i).zfill(2) for i in range(1, 37)])
 GNSS_SATS.extend(['C' + str(i).zfill(2) for i in range(1, 41)])
 
 # --- Загрузка навигационного файла ---
+NAV_CHUNK_SIZE = 64 * 1024
+# Минимальный размер распакованного nav-файла
+NAV_MIN_SIZE = 1000
+NAV_TIMEOUT = 30
+GZIP_MAGIC = b'\x1f\x8b'
+
+_nav_session = None
+_nav_session_lock = threading.Lock()
+
+
+def nav_session() -> requests.Session:
+    """Общая сессия загрузки nav-файлов: зеркала и соседние дни используют одни keep-alive соединения."""
+    global _nav_session
+    with _nav_session_lock:
+        if _nav_session is None:
+            _nav_session = make_session(workers=2)
+        return _nav_session
+
+
+def _stream_gunzip(response: requests.Response, target: Path) -> int:
+    """
+    Распаковывает gzip из HTTP потока прямо в target, без промежуточного .gz на диске.
+
+    Если сервер уже снял сжатие (Content-Encoding: gzip), данные пишутся как есть.
+
+    Returns:
+        int: размер распакованных данных в байтах
+
+    Raises:
+        ValueError: поток gzip оборван или повреждён
+    """
+    decompressor = None
+    size = 0
+    with open(target, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=NAV_CHUNK_SIZE):
+            if not chunk:
+                continue
+            if decompressor is None:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk[:2] == GZIP_MAGIC else False
+            if decompressor is False:
+                data = chunk
+            else:
+                try:
+                    data = decompressor.decompress(chunk)
+                    # Файл из нескольких gzip-блоков: следующий блок начинается в unused_data
+                    while decompressor.eof and decompressor.unused_data:
+                        rest = decompressor.unused_data
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                        data += decompressor.decompress(rest)
+                except zlib.error as e:
+                    raise ValueError(f"повреждённый gzip: {e}") from e
+            f.write(data)
+            size += len(data)
+    if decompressor and not decompressor.eof:
+        raise ValueError("gzip поток оборван до конца файла")
+    return size
+
+
 def load_nav_file(epoch: datetime, tempdir: str = "./") -> Path:
     """
     Загружает nav-файл с SIMuRG для указанной даты
     
+    Архив распаковывается на лету из HTTP потока в итоговый файл; размер
+    проверяется по распакованным данным.
+    
     Args:
         epoch: дата для загрузки nav-файла
         tempdir: временная директория для сохранения файлов
@@ -56,8 +124,9 @@ def load_nav_file(epoch: datetime, tempdir: str = "./") -> Path:
             f"https://simurg.space/files/{epoch.year}/{yday}/nav/{file_name}.gz"
         ]
         
-        gziped_file = Path(tempdir) / (file_name + ".gz")
         local_file = Path(tempdir) / file_name
+        part_file = Path(tempdir) / (file_name + ".part")
+        session = nav_session()
         
         print(f"📡 Загрузка nav-файла для {epoch.strftime('%Y-%m-%d')} (день {yday})")
         
@@ -65,36 +134,24 @@ def load_nav_file(epoch: datetime, tempdir: str = "./") -> Path:
         for i, url in enumerate(possible_urls):
             try:
                 print(f"🔄 Попытка {i+1}: {url}")
-                response = requests.get(url, stream=True, timeout=30)
-                
-                if response.status_code == 200:
-                    print(f"✅ Успешно получен nav-файл с источника {i+1}")
-                    
-                    # Сохраняем файл
-                    with open(gziped_file, "wb") as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    
-                    # Распаковываем gzip файл
-                    print(f"📦 Распаковка файла {gziped_file.name}")
-                    with gzip.open(gziped_file, 'rb') as f_in:
-                        with open(local_file, 'wb') as f_out:
-                            shutil.copyfileobj(f_in, f_out)
-                    
-                    # Проверяем размер файла
-                    file_size = local_file.stat().st_size
-                    if file_size > 1000:  # Минимальный размер nav-файла
-                        print(f"✅ Nav-файл успешно загружен: {local_file} ({file_size} байт)")
-                        return local_file
+                with session.get(url, stream=True, timeout=NAV_TIMEOUT) as response:
+                    if response.status_code == 200:
+                        print(f"✅ Успешно получен nav-файл с источника {i+1}, распаковка на лету")
+                        file_size = _stream_gunzip(response, part_file)
+                    elif response.status_code == 404:
+                        print(f"❌ Файл не найден (404): {url}")
+                        continue
                     else:
-                        print(f"⚠️ Файл слишком мал ({file_size} байт), возможно поврежден")
+                        print(f"❌ HTTP ошибка {response.status_code}: {url}")
                         continue
-                        
-                elif response.status_code == 404:
-                    print(f"❌ Файл не найден (404): {url}")
-                    continue
+                
+                # Проверяем размер распакованных данных
+                if file_size > NAV_MIN_SIZE:  # Минимальный размер nav-файла
+                    os.replace(part_file, local_file)
+                    print(f"✅ Nav-файл успешно загружен: {local_file} ({file_size} байт)")
+                    return local_file
                 else:
-                    print(f"❌ HTTP ошибка {response.status_code}: {url}")
+                    print(f"⚠️ Файл слишком мал ({file_size} байт), возможно поврежден")
                     continue
                     
             except requests.exceptions.Timeout:
@@ -106,6 +163,8 @@ def load_nav_file(epoch: datetime, tempdir: str = "./") -> Path:
             except Exception as e:
                 print(f"❌ Ошибка при загрузке с источника {i+1}: {e}")
                 continue
+            finally:
+                part_file.unlink(missing_ok=True)
         
         # Если все источники не сработали
         raise ValueError(f"Не удалось загрузить nav-файл для даты {epoch.strftime('%Y-%m-%d')} ни с одного источника")
@@ -115,12 +174,84 @@ def load_nav_file(epoch: datetime, tempdir: str = "./") -> Path:
         raise
 
 # --- Получение координат спутников ---
+def make_time_grid(start: datetime, end: datetime, timestep: int = TIME_STEP_SECONDS) -> list:
+    """Равномерная сетка моментов времени от start до end включительно."""
+    times = []
+    current_time = start
+    while current_time <= end:
+        times.append(current_time)
+        current_time += timedelta(seconds=timestep)
+    return times
+
+def get_sat_xyz_array(nav_file, start: datetime, end: datetime, sats: list = GNSS_SATS, timestep: int = TIME_STEP_SECONDS, use_cache: bool = True, min_valid_fraction: float = 0.0):
+    """
+    Координаты спутников одним массивом, рассчитанные встроенным движком эфемерид.
+    
+    Для nav-файла на диске результат сохраняется в постоянный кэш (ephemeris_cache)
+    по ключу из временной сетки, списка спутников и хэша файла.
+    
+    Args:
+        nav_file: путь к навигационному файлу или уже разобранный BroadcastEphemeris
+        start: начальное время
+        end: конечное время
+        sats: список спутников
+        timestep: временной шаг в секундах
+        use_cache: использовать ли кэш координат на диске
+        min_valid_fraction: спутники, у которых доля эпох с координатами меньше, отбрасываются
+    
+    Returns:
+        tuple: (список спутников, массив (n_sats, n_epochs, 3) с NaN для пропусков, список времен)
+    """
+    times = make_time_grid(start, end, timestep)
+    is_file = not hasattr(nav_file, 'elements')
+    
+    key = None
+    if use_cache and is_file:
+        cache = get_default_cache()
+        key = cache.xyz_key(start, end, timestep, sats, cache.nav_hash(nav_file))
+        cached = cache.load_xyz(key)
+        if cached is not None:
+            print("💾 Координаты спутников взяты из кэша")
+            sats, xyz = cached
+    
+    if key is None or cached is None:
+        ephemeris = parse_nav(nav_file) if is_file else nav_file
+        sats = [sat for sat in sats if sat in ephemeris.elements]
+        xyz = satellite_positions(ephemeris, sats, times)
+        
+        if key is not None:
+            try:
+                get_default_cache().save_xyz(key, sats, xyz)
+            except OSError as e:
+                print(f"⚠️ Не удалось сохранить координаты в кэш: {e}")
+    
+    if min_valid_fraction > 0 and len(sats):
+        keep = np.count_nonzero(~np.isnan(xyz[..., 0]), axis=1) > len(times) * min_valid_fraction
+        sats = [sat for sat, k in zip(sats, keep) if k]
+        xyz = xyz[keep]
+    return list(sats), xyz, times
+
+def get_nav_file_for_date(date) -> Path:
+    """
+    Nav-файл за дату из постоянного кэша; при отсутствии загружается с SIMuRG.
+    
+    Args:
+        date: datetime.date объект
+    
+    Returns:
+        Path: путь к nav-файлу в каталоге кэша
+    """
+    return get_default_cache().get_nav_file(datetime.combine(date, datetime.min.time()), load_nav_file)
+
 def get_sat_xyz(nav_file: Path, start: datetime, end: datetime, sats: list = GNSS_SATS, timestep: int = TIME_STEP_SECONDS):
     """
-    Получение координат спутников из навигационного файла.
+    Получение координат спутников из навигационного файла в виде словаря.
+    
+    Обертка над get_sat_xyz_array для прежних вызовов: пропуски заполняются
+    нулями. Расчет SIP берет массив из get_sat_xyz_array напрямую.
     
     Args:
-        nav_file: путь к навигационному файлу
+        nav_file: путь к навигационному файлу или уже разобранный BroadcastEphemeris
         start: начальное время
         end: конечное время
         sats: список спутников
@@ -129,85 +260,32 @@ def get_sat_xyz(nav_file: Path, start: datetime, end: datetime, sats: list = GNS
     Returns:
         tuple: (словарь координат спутников, список времен)
     """
-    if not COORDINATES_AVAILABLE:
-        print("❌ Библиотека coordinates не установлена")
-        print("💡 Установите её командой: pip install git+https://github.com/gnss-lab/coordinates.git#egg=coordinates")
-        return {}, []
-    
     try:
+        if isinstance(nav_file, BroadcastEphemeris):
+            print(f"📁 Используются уже разобранные эфемериды ({len(nav_file.satellites)} спутников)")
         # Проверяем существование nav-файла
-        if not nav_file.exists():
+        elif not nav_file.exists():
             print(f"❌ Nav-файл не найден: {nav_file}")
             return {}, []
+        else:
+            file_size = nav_file.stat().st_size
+            print(f"📁 Обработка nav-файла: {nav_file} ({file_size} байт)")
         
-        file_size = nav_file.stat().st_size
-        print(f"📁 Обработка nav-файла: {nav_file} ({file_size} байт)")
-        
-        # Создаем временные метки
-        times = []
-        current_time = start
-        while current_time <= end:
-            times.append(current_time)
-            current_time += timedelta(seconds=timestep)
+        valid_sats, xyz, times = get_sat_xyz_array(nav_file, start, end, sats, timestep,
+                                                   min_valid_fraction=MIN_VALID_SAT_FRACTION)
         
         print(f"⏰ Временной диапазон: {len(times)} точек с {start} до {end}")
         
-        # Получаем координаты для всех спутников
-        sats_xyz = {}
-        successful_sats = 0
+        # Пропуски заполняем нулями, как и раньше
+        sats_xyz = {sat: np.nan_to_num(xyz[k], nan=0.0) for k, sat in enumerate(valid_sats)}
         
-        for sat_idx, sat in enumerate(sats):
-            try:
-                # Показываем прогресс
-                if sat_idx % 10 == 0:
-                    print(f"🛰️ Обработка спутника {sat_idx+1}/{len(sats)}: {sat}")
-                
-                # Получаем координаты для каждого спутника
-                xyz_data = []
-                valid_points = 0
-                
-                for t in times:
-                    try:
-                        # Используем правильный формат для библиотеки coordinates
-                        # Формат: satellite_xyz(nav_file_path, constellation, prn, epoch)
-                        constellation = sat[0]  # G, R, E, C
-                        prn = int(sat[1:])      # номер спутника
-                        
-                        xyz = satellite_xyz(str(nav_file), constellation, prn, t)
-                        
-                        if xyz is not None and len(xyz) == 3 and not all(x == 0 for x in xyz):
-                            xyz_data.append(xyz)
-                            valid_points += 1
-                        else:
-                            # Если данных нет, пропускаем точку
-                            xyz_data.append([0.0, 0.0, 0.0])
-                            
-                    except Exception as e:
-                        # Молча пропускаем ошибки для отдельных эпох
-                        xyz_data.append([0.0, 0.0, 0.0])
-                        continue
-                
-                # Добавляем спутник только если есть достаточно валидных точек
-                if valid_points > len(times) * 0.1:  # Минимум 10% валидных точек
-                    sats_xyz[sat] = np.array(xyz_data)
-                    successful_sats += 1
-                    if sat_idx < 5:  # Показываем детали для первых спутников
-                        print(f"  ✅ {sat}: {valid_points}/{len(times)} валидных точек")
-                
-            except Exception as e:
-                # Пропускаем спутники с ошибками
-                if sat_idx < 5:  # Показываем ошибки только для первых спутников
-                    print(f"  ❌ {sat}: ошибка - {str(e)[:50]}")
-                continue
+        print(f"✅ Успешно обработано {len(sats_xyz)} спутников из {len(sats)}")
         
-        print(f"✅ Успешно обработано {successful_sats} спутников из {len(sats)}")
-        
-        if successful_sats == 0:
+        if not sats_xyz:
             print("❌ Не удалось получить координаты ни для одного спутника")
             print("💡 Возможные причины:")
             print("   - Nav-файл поврежден или неполный")
             print("   - Неправильная дата или формат времени")
-            print("   - Проблемы с библиотекой coordinates")
         
         return sats_xyz, times
         
@@ -215,6 +293,29 @@ def get_sat_xyz(nav_file: Path, start: datetime, end: datetime, sats: list = GNS
         print(f"❌ Критическая ошибка в get_sat_xyz: {e}")
         return {}, []
 
+def load_sat_xyz(nav_source, start: datetime, end: datetime):
+    """
+    Координаты спутников для расчета SIP: массив с NaN для пропусков, без перевода в словарь.
+    
+    Args:
+        nav_source: путь к nav-файлу или разобранный BroadcastEphemeris
+        start: начальное время
+        end: конечное время
+    
+    Returns:
+        tuple: (список спутников, массив (n_sats, n_epochs, 3), список времен);
+            при ошибке - пустой список спутников
+    """
+    try:
+        if not isinstance(nav_source, BroadcastEphemeris) and not Path(nav_source).exists():
+            print(f"❌ Nav-файл не найден: {nav_source}")
+            return [], np.empty((0, 0, 3)), []
+        return get_sat_xyz_array(nav_source, start, end, GNSS_SATS, TIME_STEP_SECONDS,
+                                 min_valid_fraction=MIN_VALID_SAT_FRACTION)
+    except Exception as e:
+        print(f"❌ Не удалось рассчитать координаты спутников: {e}")
+        return [], np.empty((0, 0, 3)), []
+
 # --- Преобразование XYZ в элевейшн/азимут ---
 def xyz_to_el_az(xyz_site: tuple, xyz_sat: NDArray, earth_radius=RE):
     def cartesian_to_latlon(x, y, z, earth_radius=earth_radius):
@@ -330,71 +431,24 @@ def get_point_of_interest(site: str, height: float, sat_mask: dict, times: list,
 
 def get_all_stations(limit=15000):
     """
-    Получает список всех GNSS станций из API simurg.space
+    Получает список GNSS станций из локального каталога (station_catalog)
+    
+    Каталог загружается из API simurg.space параллельно и обновляется
+    инкрементно, поэтому повторные вызовы читают его с диска.
     
     Args:
-        limit (int): Максимальное количество станций для загрузки (по умолчанию 15000)
+        limit (int): Максимальное количество станций (по умолчанию 15000)
     
     Returns:
         list: Список кортежей (station_id, lat, lon) или пустой список при ошибке
     """
     try:
-        # Получаем список всех станций
-        response = requests.get("https://api.simurg.space/sites/", timeout=30)
-        response.raise_for_status()
-        
-        all_stations_data = response.json()
-        total_stations = len(all_stations_data)
-        
-        # Берем все доступные станции или лимит
-        max_stations = min(limit, total_stations)
-        step = max(1, total_stations // max_stations)
-        
-        stations = []
-        processed = 0
-        valid_stations = 0
-        error_stations = 0
-        
-        # Загружаем детали станций
-        for i in range(0, total_stations, step):
-            if len(stations) >= max_stations:
-                break
-                
-            station_id = all_stations_data[i]
-            
-            try:
-                # Получаем детали станции
-                station_url = f"https://api.simurg.space/sites/{station_id}"
-                station_response = requests.get(station_url, timeout=10)
-                station_response.raise_for_status()
-                
-                station_data = station_response.json()
-                
-                # Извлекаем координаты
-                if 'location' in station_data and 'lat' in station_data['location'] and 'lon' in station_data['location']:
-                    lat = float(station_data['location']['lat'])
-                    lon = float(station_data['location']['lon'])
-                    
-                    # Проверяем валидность координат
-                    if -90 <= lat <= 90 and -180 <= lon <= 180:
-                        stations.append((station_id, lat, lon))
-                        valid_stations += 1
-                    else:
-                        error_stations += 1
-                else:
-                    error_stations += 1
-                    
-            except Exception as e:
-                error_stations += 1
-                continue
-            
-            processed += 1
-        
+        stations = load_catalog().to_list()
+        if len(stations) > limit:
+            # Равномерная выборка по каталогу, как и при загрузке из API
+            step = max(1, len(stations) // limit)
+            stations = stations[::step][:limit]
         return stations
-        
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Ошибка сети при получении списка станций: {e}")
-        return []
     except Exception as e:
         print(f"❌ Неожиданная ошибка при получении станций: {e}")
         return []
@@ -411,25 +465,16 @@ def find_stations_in_polygon(polygon_points):
     """
     print(f"🔍 Поиск станций в полигоне с {len(polygon_points)} точками...")
     
-    # Получаем все доступные станции
-    all_stations_list = get_all_stations(limit=200)  # Увеличиваем лимит для лучшего покрытия
+    # Каталог станций с пространственным индексом (строится один раз на загрузку каталога)
+    catalog = load_catalog()
     
-    if not all_stations_list:
+    if len(catalog) == 0:
         print("❌ Не удалось получить список станций")
         return {}
     
-    print(f"📊 Проверяю {len(all_stations_list)} станций на попадание в полигон...")
+    print(f"📊 Проверяю {len(catalog)} станций на попадание в полигон...")
     
-    stations_in_polygon = {}
-    
-    for station_id, lat, lon in all_stations_list:
-        if is_point_in_polygon(lat, lon, polygon_points):
-            stations_in_polygon[station_id.lower()] = {
-                'lat': lat,
-                'lon': lon,
-                'name': station_id.upper(),
-                'height': 0.0  # Высота по умолчанию, можно получить из API если нужно
-            }
+    stations_in_polygon = catalog.to_dict(catalog.query_polygon(polygon_points))
     
     print(f"✅ Найдено {len(stations_in_polygon)} станций в полигоне")
     
@@ -452,52 +497,38 @@ def auto_download_nav_file_for_date(date):
     Returns:
         dict: Информация о загруженном файле и найденных станциях
     """
-    import tempfile
-    from datetime import datetime
-    
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Загружаем nav-файл
-            nav_file_path = load_nav_file(datetime.combine(date, datetime.min.time()), temp_dir)
-            
-            # Получаем ВСЕ станции из API (убираем лимит для показа всех станций)
-            stations_list = get_all_stations(limit=15000)  # Увеличиваем лимит для получения всех станций
-            
-            if not stations_list:
-                raise Exception("Не удалось получить список станций из API")
-            
-            # Преобразуем список станций в нужный формат
-            stations = {}
-            for station_id, lat, lon in stations_list:
-                stations[station_id.lower()] = {
-                    'lat': lat,
-                    'lon': lon,
-                    'name': station_id.upper(),
-                    'height': 0.0  # Высота по умолчанию
-                }
-            
-            # Проверяем размер NAV файла
-            nav_file_size = nav_file_path.stat().st_size
+        # Загружаем nav-файл (из кэша, если он уже скачивался)
+        nav_file_path = get_nav_file_for_date(date)
+        
+        # Получаем все станции из локального каталога
+        stations = load_catalog().to_dict()
+        
+        if not stations:
+            raise Exception("Не удалось получить список станций из API")
+        
+        # Проверяем размер NAV файла
+        nav_file_size = nav_file_path.stat().st_size
+        lines_processed = 0
+        
+        # Считаем количество строк в NAV файле для статистики
+        try:
+            with open(nav_file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                lines_processed = sum(1 for _ in f)
+        except:
             lines_processed = 0
-            
-            # Считаем количество строк в NAV файле для статистики
-            try:
-                with open(nav_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    lines_processed = sum(1 for _ in f)
-            except:
-                lines_processed = 0
-            
-            return {
-                'success': True,
-                'stations': stations,
-                'file_path': str(nav_file_path),
-                'file_size': nav_file_size,
-                'date': date,
-                'stations_count': len(stations),
-                'lines_processed': lines_processed,
-                'source': 'API + NAV_file'
-            }
-            
+        
+        return {
+            'success': True,
+            'stations': stations,
+            'file_path': str(nav_file_path),
+            'file_size': nav_file_size,
+            'date': date,
+            'stations_count': len(stations),
+            'lines_processed': lines_processed,
+            'source': 'API + NAV_file'
+        }
+        
     except Exception as e:
         error_msg = f"Ошибка загрузки данных для {date}: {str(e)}"
         return {
@@ -514,7 +545,40 @@ def auto_download_nav_file_for_date(date):
             ]
         }
 
-def request_ionosphere_data(date, structure_type, polygon_points, station_code=None, preloaded_nav_info=None):
+def add_background_tec(response: dict, gim) -> dict:
+    """
+    Добавляет к результату расчёта SIP фоновый TEC из карт GIM в каждой точке.
+    
+    Значения интерполируются по картам одним векторным вызовом (см. модуль ionex).
+    
+    Args:
+        response: результат request_ionosphere_data с колоночным 'sip'
+        gim: GimMaps либо путь к файлу или содержимое IONEX
+    
+    Returns:
+        dict: тот же response с 'background_tec' (TECU, NaN вне карт, порядок точек 'sip')
+    """
+    sip = response.get('sip')
+    if sip is None:
+        return response
+    if not isinstance(gim, GimMaps):
+        gim = load_gim(gim)
+    response['background_tec'] = gim.interpolate(sip.time, sip.latitude, sip.longitude)
+    response['metadata']['gim_maps'] = len(gim)
+    return response
+
+def preloaded_nav_source(date, preloaded_nav_info):
+    """
+    Предзагруженный nav для даты: разобранный BroadcastEphemeris (загруженный
+    пользователем файл) или путь к файлу; None, если он относится к другой дате.
+    """
+    if not (preloaded_nav_info and preloaded_nav_info.get('loaded') and preloaded_nav_info.get('date') == date):
+        return None
+    if preloaded_nav_info.get('ephemeris') is not None:
+        return preloaded_nav_info['ephemeris']
+    return Path(preloaded_nav_info['path'])
+
+def request_ionosphere_data(date, structure_type, polygon_points, station_code=None, preloaded_nav_info=None, elevation_cutoff=ELEVATION_CUTOFF_DEG, workers=SIP_WORKERS, gim=None):
     """
     Загружает nav-файл для указанной даты, находит все станции в полигоне,
     рассчитывает SIP траектории для всех найденных станций
@@ -526,19 +590,28 @@ def request_ionosphere_data(date, structure_type, polygon_points, station_code=N
         polygon_points: список точек полигона [(lat, lon), ...]
         station_code: код конкретной станции (если None, ищет все станции в полигоне)
         preloaded_nav_info: информация о предзагруженном nav-файле из session state
+        elevation_cutoff: маска по углу места в градусах, отсчёты ниже отбрасываются
+        workers: число процессов для расчёта по станциям (1 - в текущем процессе)
+        gim: карты GIM (GimMaps, путь или содержимое IONEX) для фонового TEC в точках SIP
     
     Returns:
         dict: структурированные данные с SIP траекториями или сообщение об ошибке
     """
+    if gim is not None:
+        response = request_ionosphere_data(date, structure_type, polygon_points, station_code,
+                                           preloaded_nav_info, elevation_cutoff, workers)
+        return add_background_tec(response, gim)
+    
     # Если указана конкретная станция, используем новую функцию
     if station_code:
         print(f"🎯 Обработка конкретной станции: {station_code.upper()}")
-        result = process_station_sips(station_code, date, polygon_points)
+        result = process_station_sips(station_code, date, polygon_points, elevation_cutoff, preloaded_nav_info)
         
         if result['success']:
             # Преобразуем результат в формат, ожидаемый приложением
             return {
                 'points': result['trajectory_points'],
+                'sip': result['sip'],
                 'metadata': {
                     'stations_processed': 1,
                     'stations_with_intersections': 1 if result['intersection_points'] > 0 else 0,
@@ -571,12 +644,6 @@ def request_ionosphere_data(date, structure_type, polygon_points, station_code=N
             }
     
     # Если станция не указана, используем старую логику для поиска всех станций в полигоне
-    import requests
-    import gzip
-    import io
-    import tempfile
-    from datetime import datetime, date as date_class, timedelta
-    
     # Используем реальный год из даты
     current_year = date.year
     day_of_year = date.timetuple().tm_yday
@@ -601,74 +668,59 @@ def request_ionosphere_data(date, structure_type, polygon_points, station_code=N
     # Загружаем навигационный файл
     try:
         # Проверяем, есть ли предзагруженный nav-файл для этой даты
-        if (preloaded_nav_info and 
-            preloaded_nav_info.get('loaded') and 
-            preloaded_nav_info.get('date') == date):
-            
+        nav_source = preloaded_nav_source(date, preloaded_nav_info)
+        if nav_source is not None:
             print(f"📡 Используем предзагруженный nav-файл для {date}")
-            nav_file_path = preloaded_nav_info['path']
-            temp_dir = preloaded_nav_info['temp_dir']
+            nav_file_path = Path(preloaded_nav_info.get('path') or preloaded_nav_info.get('name', 'uploaded'))
             print(f"✅ Навигационный файл: {nav_file_path}")
             
-            # Определяем временной диапазон (весь день)
-            start_time = datetime.combine(date, datetime.min.time())
-            end_time = datetime.combine(date, datetime.max.time().replace(microsecond=0))
-            
-            print(f"⏰ Временной диапазон: {start_time} - {end_time}")
-            
-            # Получаем координаты спутников
-            print(f"🛰️ Получение координат спутников из nav-файла...")
-            sats_xyz, times = get_sat_xyz(nav_file_path, start_time, end_time, GNSS_SATS, TIME_STEP_SECONDS)
-            
         else:
-            # Загружаем nav-файл заново
+            # Берем nav-файл из кэша или загружаем его
             print(f"📡 Загрузка навигационного файла для {current_year}-{day_of_year:03d}...")
-            with tempfile.TemporaryDirectory() as temp_dir:
-                try:
-                    # Используем функцию load_nav_file для загрузки nav-файла
-                    nav_file_path = load_nav_file(datetime.combine(date, datetime.min.time()), temp_dir)
-                    print(f"✅ Навигационный файл загружен: {nav_file_path}")
-                except ValueError as e:
-                    # Ошибка загрузки nav-файла
-                    error_msg = f"Не удалось загрузить nav-файл для {date}: {str(e)}"
-                    print(f"❌ {error_msg}")
-                    return {
-                        'points': [],
-                        'metadata': {
-                            'error': error_msg,
-                            'date': str(date),
-                            'year': current_year,
-                            'day_of_year': day_of_year,
-                            'suggestions': [
-                                'Проверьте подключение к интернету',
-                                'Убедитесь, что дата корректна',
-                                f'Nav-файл для {date} может быть недоступен на SIMuRG',
-                                'Попробуйте выбрать другую дату'
-                            ]
-                        }
+            try:
+                nav_source = nav_file_path = get_nav_file_for_date(date)
+                print(f"✅ Навигационный файл загружен: {nav_file_path}")
+            except ValueError as e:
+                # Ошибка загрузки nav-файла
+                error_msg = f"Не удалось загрузить nav-файл для {date}: {str(e)}"
+                print(f"❌ {error_msg}")
+                return {
+                    'points': [],
+                    'metadata': {
+                        'error': error_msg,
+                        'date': str(date),
+                        'year': current_year,
+                        'day_of_year': day_of_year,
+                        'suggestions': [
+                            'Проверьте подключение к интернету',
+                            'Убедитесь, что дата корректна',
+                            f'Nav-файл для {date} может быть недоступен на SIMuRG',
+                            'Попробуйте выбрать другую дату'
+                        ]
                     }
-                except Exception as e:
-                    error_msg = f"Неожиданная ошибка при загрузке nav-файла: {str(e)}"
-                    print(f"❌ {error_msg}")
-                    return {
-                        'points': [],
-                        'metadata': {
-                            'error': error_msg,
-                            'date': str(date)
-                        }
+                }
+            except Exception as e:
+                error_msg = f"Неожиданная ошибка при загрузке nav-файла: {str(e)}"
+                print(f"❌ {error_msg}")
+                return {
+                    'points': [],
+                    'metadata': {
+                        'error': error_msg,
+                        'date': str(date)
                     }
-                
-                # Определяем временной диапазон (весь день)
-                start_time = datetime.combine(date, datetime.min.time())
-                end_time = datetime.combine(date, datetime.max.time().replace(microsecond=0))
-                
-                print(f"⏰ Временной диапазон: {start_time} - {end_time}")
-                
-                # Получаем координаты спутников
-                print(f"🛰️ Получение координат спутников из nav-файла...")
-                sats_xyz, times = get_sat_xyz(nav_file_path, start_time, end_time, GNSS_SATS, TIME_STEP_SECONDS)
+                }
         
-        if not sats_xyz:
+        # Определяем временной диапазон (весь день)
+        start_time = datetime.combine(date, datetime.min.time())
+        end_time = datetime.combine(date, datetime.max.time().replace(microsecond=0))
+        
+        print(f"⏰ Временной диапазон: {start_time} - {end_time}")
+        
+        # Получаем координаты спутников (из кэша, если они уже считались)
+        print(f"🛰️ Получение координат спутников из nav-файла...")
+        sats, sat_array, times = load_sat_xyz(nav_source, start_time, end_time)
+        
+        if not sats:
             error_msg = "Не удалось получить координаты спутников из nav-файла"
             print(f"❌ {error_msg}")
             return {
@@ -678,171 +730,84 @@ def request_ionosphere_data(date, structure_type, polygon_points, station_code=N
                     'date': str(date),
                     'nav_file': str(nav_file_path) if 'nav_file_path' in locals() else 'unknown',
                     'suggestions': [
-                        'Проверьте, что библиотека coordinates установлена',
                         'Nav-файл может быть поврежден',
-                        'Попробуйте другую дату',
-                        'Установите coordinates: pip install git+https://github.com/gnss-lab/coordinates.git'
+                        'Попробуйте другую дату'
                     ]
                 }
             }
         
-        print(f"✅ Получены координаты для {len(sats_xyz)} спутников")
+        # Спутники с малой долей эпох с координатами уже отброшены (MIN_VALID_SAT_FRACTION)
+        print(f"✅ Получены координаты для {len(sats)} спутников")
         
-        # Проверяем качество данных спутников
-        valid_satellites = []
-        for sat, xyz_data in sats_xyz.items():
-            # Проверяем, есть ли валидные (не нулевые) координаты
-            non_zero_points = np.count_nonzero(np.any(xyz_data != 0, axis=1))
-            if non_zero_points > len(times) * 0.1:  # Минимум 10% валидных точек
-                valid_satellites.append(sat)
-        
-        print(f"📊 Спутников с достаточным количеством данных: {len(valid_satellites)}")
-        
-        if len(valid_satellites) < 4:  # Минимум для нормальной работы
+        if len(sats) < 4:  # Минимум для нормальной работы
             print("⚠️ Предупреждение: Мало спутников с валидными данными")
             print("💡 Это может повлиять на качество расчета SIP траекторий")
         
-        # Обрабатываем каждую станцию
-        all_result_points = []
-        stations_processed = []
-        total_intersections = 0
-        
+        # Проверяем данные станций
+        stations_valid = []
         for station_code, station in stations_to_process.items():
-            print(f"\n🔄 Обработка станции {station_code.upper()}: {station['name']}")
+            if not all(key in station for key in ['lat', 'lon', 'height', 'name']):
+                print(f"  ❌ Некорректные данные станции {station_code.upper()}: отсутствуют обязательные поля")
+                continue
             
-            try:
-                # Проверяем корректность данных станции
-                if not all(key in station for key in ['lat', 'lon', 'height', 'name']):
-                    print(f"  ❌ Некорректные данные станции {station_code.upper()}: отсутствуют обязательные поля")
-                    continue
-                
-                # Проверяем валидность координат
-                if not (-90 <= station['lat'] <= 90):
-                    print(f"  ❌ Некорректная широта станции {station_code.upper()}: {station['lat']}")
-                    continue
-                
-                if not (-180 <= station['lon'] <= 180):
-                    print(f"  ❌ Некорректная долгота станции {station_code.upper()}: {station['lon']}")
-                    continue
-                
-                # Координаты станции в XYZ
-                station_lat_rad = np.radians(station['lat'])
-                station_lon_rad = np.radians(station['lon'])
-                station_height = station['height']
-                
-                # Приблизительное преобразование в ECEF координаты
-                N = RE / np.sqrt(1 - (2*0.003353 - 0.003353**2) * np.sin(station_lat_rad)**2)
-                station_xyz = (
-                    (N + station_height) * np.cos(station_lat_rad) * np.cos(station_lon_rad),
-                    (N + station_height) * np.cos(station_lat_rad) * np.sin(station_lon_rad),
-                    (N * (1 - 0.003353**2) + station_height) * np.sin(station_lat_rad)
-                )
-                
-                print(f"  📍 Координаты станции: {station['lat']:.4f}°, {station['lon']:.4f}°, {station_height}м")
-                
-                # Рассчитываем элевейшн/азимут для всех спутников
-                try:
-                    sats_elaz = get_sat_elevation_azimuth(station_xyz, sats_xyz)
-                    if not sats_elaz:
-                        print(f"  ⚠️ Не удалось рассчитать углы для станции {station_code.upper()}")
-                        continue
-                    print(f"  📐 Рассчитаны углы для {len(sats_elaz)} спутников")
-                except Exception as e:
-                    print(f"  ❌ Ошибка расчета углов для станции {station_code.upper()}: {e}")
-                    continue
-                
-                # Рассчитываем SIP точки для всех спутников
-                try:
-                    sat_sips = get_sat_sips((station['lat'], station['lon']), sats_elaz)
-                    if not sat_sips:
-                        print(f"  ⚠️ Не удалось рассчитать SIP точки для станции {station_code.upper()}")
-                        continue
-                    print(f"  🎯 Рассчитаны SIP точки для {len(sat_sips)} спутников")
-                except Exception as e:
-                    print(f"  ❌ Ошибка расчета SIP точек для станции {station_code.upper()}: {e}")
-                    continue
-                
-                # Фильтруем SIP траектории по полигону
-                try:
-                    filtered_sips = filter_sips_by_polygon(sat_sips, polygon_points, times)
-                    print(f"  🔍 Фильтрация по полигону завершена")
-                except Exception as e:
-                    print(f"  ❌ Ошибка фильтрации по полигону для станции {station_code.upper()}: {e}")
-                    continue
-                
-                # Подсчитываем количество точек пересечения для этой станции
-                station_intersections = 0
-                trajectory_info = {}
-                
-                for sat, trajectory in filtered_sips.items():
-                    if trajectory and len(trajectory) > 0:
-                        station_intersections += len(trajectory)
-                        trajectory_info[sat] = {
-                            'points_count': len(trajectory),
-                            'trajectory': trajectory
-                        }
-                
-                if station_intersections > 0:
-                    print(f"  ✅ Станция {station_code.upper()}: {len(trajectory_info)} спутников, {station_intersections} пересечений")
-                    
-                    # Формируем результат для этой станции
-                    try:
-                        for sat, info in trajectory_info.items():
-                            for i, point in enumerate(info['trajectory']):
-                                # Проверяем валидность данных точки
-                                if not isinstance(point, dict) or 'lat' not in point or 'lon' not in point:
-                                    continue
-                                
-                                # Получаем углы для данного времени
-                                elevation = float(sats_elaz[sat][i, 0]) if sat in sats_elaz and i < len(sats_elaz[sat]) else 0.0
-                                azimuth = float(sats_elaz[sat][i, 1]) if sat in sats_elaz and i < len(sats_elaz[sat]) else 0.0
-                                
-                                all_result_points.append({
-                                    'satellite': sat,
-                                    'latitude': point['lat'],
-                                    'longitude': point['lon'],
-                                    'time': point['time'].isoformat() if 'time' in point else times[i].isoformat() if i < len(times) else '',
-                                    'elevation': elevation,
-                                    'azimuth': azimuth,
-                                    'station': station_code.upper(),
-                                    'station_name': station['name'],
-                                    'station_lat': station['lat'],
-                                    'station_lon': station['lon']
-                                })
-                    except Exception as e:
-                        print(f"  ❌ Ошибка формирования результатов для станции {station_code.upper()}: {e}")
-                        continue
-                    
-                    stations_processed.append({
-                        'code': station_code.upper(),
-                        'name': station['name'],
-                        'lat': station['lat'],
-                        'lon': station['lon'],
-                        'satellites_with_intersections': len(trajectory_info),
-                        'intersection_points': station_intersections
-                    })
-                    
-                    total_intersections += station_intersections
-                else:
-                    print(f"  ⚪ Станция {station_code.upper()}: нет пересечений с полигоном")
-                
-            except Exception as e:
-                print(f"  ❌ Критическая ошибка обработки станции {station_code.upper()}: {e}")
-                print(f"  💡 Возможные причины: некорректные координаты, проблемы с nav-файлом, ошибки расчета")
+            if not (-90 <= station['lat'] <= 90):
+                print(f"  ❌ Некорректная широта станции {station_code.upper()}: {station['lat']}")
                 continue
+            
+            if not (-180 <= station['lon'] <= 180):
+                print(f"  ❌ Некорректная долгота станции {station_code.upper()}: {station['lon']}")
+                continue
+            
+            stations_valid.append((station_code, station))
+        
+        # Геометрия считается сразу для блока станций × всех спутников × всех эпох
+        stations_latlon = np.array([(s['lat'], s['lon']) for _, s in stations_valid], dtype=np.float64).reshape(-1, 2)
+        stations_height = np.array([s['height'] for _, s in stations_valid], dtype=np.float64)
+        
+        print(f"📐 Расчет углов и SIP точек: {len(stations_valid)} станций × {len(sats)} спутников × {len(times)} эпох (маска {elevation_cutoff}°)")
+        
+        # Станции обрабатываются блоками, при workers > 1 - в пуле процессов
+        intersections = station_intersections(
+            stations_latlon, stations_height, sat_array, polygon_points, elevation_cutoff, workers
+        )
+        
+        stations_processed = []
+        total_intersections = 0
+        
+        for (station_code, station), samples in zip(stations_valid, intersections):
+            station_points = len(samples[0])
+            if station_points:
+                station_sats = len(np.unique(samples[0]))
+                print(f"  ✅ Станция {station_code.upper()}: {station_sats} спутников, {station_points} пересечений")
+                stations_processed.append({
+                    'code': station_code.upper(),
+                    'name': station['name'],
+                    'lat': station['lat'],
+                    'lon': station['lon'],
+                    'satellites_with_intersections': station_sats,
+                    'intersection_points': station_points
+                })
+                total_intersections += station_points
+            else:
+                print(f"  ⚪ Станция {station_code.upper()}: нет пересечений с полигоном")
+        
+        # Колоночный результат; 'points' - представление в виде словарей для совместимости
+        sip_result = SipResult.from_stations(stations_valid, sats, times, intersections)
         
         print(f"\n🎉 Обработка завершена!")
         print(f"📊 Всего обработано станций: {len(stations_processed)}")
         print(f"📊 Общее количество точек пересечения: {total_intersections}")
         
         return {
-            'points': all_result_points,
+            'points': sip_result.points,
+            'sip': sip_result,
             'metadata': {
                 'stations_in_polygon': len(stations_to_process),
                 'stations_processed': len(stations_processed),
                 'stations_with_intersections': len(stations_processed),
                 'total_intersection_points': total_intersections,
-                'satellites_processed': len(sats_xyz),
+                'satellites_processed': len(sats),
+                'elevation_cutoff': elevation_cutoff,
                 'time_range': {
                     'start': start_time.isoformat(),
                     'end': end_time.isoformat()
@@ -868,45 +833,106 @@ def request_ionosphere_data(date, structure_type, polygon_points, station_code=N
             }
         }
 
+def find_crossing_intervals(date, polygon_points, station_code=None, elevation_cutoff=ELEVATION_CUTOFF_DEG,
+                            coarse_step=COARSE_STEP_SECONDS, tolerance=CROSSING_TOLERANCE_SECONDS):
+    """
+    Находит интервалы входа/выхода SIP траекторий в полигон с адаптивным уточнением по времени.
+    
+    Вместо расчёта на всей сетке TIME_STEP_SECONDS геометрия считается на грубой
+    сетке coarse_step, а рядом с границей полигона уточняется делением пополам
+    (см. модуль sip_crossings).
+    
+    Args:
+        date: datetime.date объект
+        polygon_points: список точек полигона [(lat, lon), ...]
+        station_code: код конкретной станции (если None, берутся все станции в полигоне)
+        elevation_cutoff: маска по углу места в градусах
+        coarse_step: шаг грубой сетки в секундах
+        tolerance: точность границ интервалов в секундах
+    
+    Returns:
+        dict: {'success': True, 'intervals': CrossingIntervals, 'metadata': {...}} или ошибка
+    """
+    try:
+        if station_code:
+            station_info = load_catalog().get(station_code)
+            if station_info is None:
+                return {'success': False, 'error': f'Станция {station_code.upper()} не найдена в каталоге'}
+            stations = {station_code.lower(): station_info}
+        else:
+            stations = find_stations_in_polygon(polygon_points)
+            if not stations:
+                return {'success': False, 'error': 'В полигоне не найдено ни одной станции'}
+        
+        nav_file_path = get_nav_file_for_date(date)
+        ephemeris = parse_nav(nav_file_path)
+        sats = [sat for sat in GNSS_SATS if sat in ephemeris.elements]
+        
+        start_time = datetime.combine(date, datetime.min.time())
+        end_time = datetime.combine(date, datetime.max.time().replace(microsecond=0))
+        
+        print(f"⏱️ Поиск интервалов пересечения: {len(stations)} станций × {len(sats)} спутников, грубый шаг {coarse_step} с")
+        intervals = crossing_intervals(
+            ephemeris, sats,
+            [code.upper() for code in stations],
+            np.array([(s['lat'], s['lon']) for s in stations.values()], dtype=np.float64),
+            np.array([s['height'] for s in stations.values()], dtype=np.float64),
+            polygon_points, start_time, end_time,
+            elevation_cutoff, coarse_step, tolerance
+        )
+        
+        evaluations = intervals.coarse_evaluations + intervals.refine_evaluations
+        dense_evaluations = len(stations) * len(sats) * len(make_time_grid(start_time, end_time))
+        print(f"✅ Найдено {len(intervals)} интервалов, расчётов геометрии: {evaluations} (на сетке {TIME_STEP_SECONDS} с: {dense_evaluations})")
+        
+        return {
+            'success': True,
+            'intervals': intervals,
+            'metadata': {
+                'stations': len(stations),
+                'satellites': len(sats),
+                'intervals_count': len(intervals),
+                'geometry_evaluations': evaluations,
+                'dense_grid_evaluations': dense_evaluations,
+                'coarse_step': coarse_step,
+                'tolerance': tolerance,
+                'elevation_cutoff': elevation_cutoff,
+                'nav_file': str(nav_file_path),
+                'date': str(date)
+            }
+        }
+    except Exception as e:
+        print(f"❌ Ошибка поиска интервалов пересечения: {e}")
+        return {'success': False, 'error': f'Ошибка поиска интервалов пересечения: {str(e)}'}
+
 # --- Функции парсинга различных форматов данных ---
 
 def parse_text_ionosphere_content(content, polygon_points, structure_type):
-    """Парсинг текстовых файлов с данными ионосферы"""
+    """
+    Парсинг текстовых файлов с данными ионосферы
+    
+    Содержимое разбирается потоково блоками (см. модуль tec_text): в памяти
+    одновременно находятся только текущий блок и точки внутри полигона.
+    content может быть байтами, строкой, файловым объектом или итератором
+    блоков байтов HTTP ответа.
+    
+    Returns:
+        dict: 'tec_points' - массив (N, 3) [широта, долгота, TEC] точек внутри
+            полигона, 'points' - ленивое представление TecPoints поверх него
+    """
     try:
-        if isinstance(content, bytes):
-            content = content.decode('utf-8')
-        
-        lines = content.strip().split('\n')
-        points = []
-        
-        for line in lines:
-            if line.strip() and not line.startswith('#'):
-                parts = line.split()
-                if len(parts) >= 3:
-                    try:
-                        lat = float(parts[0])
-                        lon = float(parts[1])
-                        tec = float(parts[2])
-                        
-                        if is_point_in_polygon(lat, lon, polygon_points):
-                            points.append({
-                                'latitude': lat,
-                                'longitude': lon,
-                                'tec': tec,
-                                'index': 0.0,
-                                'timestamp': 'real_data',
-                                'source': 'simurg_text',
-                                'quality': 'real'
-                            })
-                    except ValueError:
-                        continue
+        stats = {}
+        values = read_tec_points(content, polygon_points, stats=stats)
+        # Точки остаются массивом; словари строятся только при обращении к точке
+        points = TecPoints(values, source='simurg_text', timestamp='real_data')
         
         return {
             'points': points,
+            'tec_points': values,
             'metadata': {
                 'source': 'text_file',
                 'file_type': 'txt',
-                'parsed_lines': len(lines),
+                'parsed_lines': stats.get('lines', 0),
                 'valid_points': len(points)
             }
         }
@@ -915,70 +941,127 @@ def parse_text_ionosphere_content(content, polygon_points, structure_type):
         return None
 
 def parse_hdf5_content(content, polygon_points, structure_type):
-    """Парсинг HDF5 файлов"""
+    """
+    Парсинг HDF5 файлов
+    
+    Содержимое открывается в памяти (h5py поверх BytesIO), без временного файла
+    на диске. Наборы latitude/longitude/tec читаются целиком, попадание в полигон
+    проверяется одной маской по всем точкам.
+    """
     try:
-        import tempfile
-        import h5py
+        points = []
+        with h5py.File(io.BytesIO(content), 'r') as f:
+            # Пытаемся найти стандартные датасеты
+            if 'latitude' in f and 'longitude' in f and 'tec' in f:
+                lats = f['latitude'][()]
+                lons = f['longitude'][()]
+                tecs = f['tec'][()]
+                
+                if tecs.ndim == 2 and lats.ndim == 1 and lons.ndim == 1 and tecs.shape == (len(lats), len(lons)):
+                    # Сетка: координаты заданы осями
+                    lats, lons = np.meshgrid(lats, lons, indexing='ij')
+                lats, lons, tecs = lats.ravel(), lons.ravel(), tecs.ravel()
+                
+                inside = points_in_polygon(lats, lons, polygon_points, return_indices=True)
+                points = [
+                    {
+                        'latitude': lat,
+                        'longitude': lon,
+                        'tec': tec,
+                        'index': 0.0,
+                        'timestamp': 'real_data',
+                        'source': 'simurg_hdf5',
+                        'quality': 'real'
+                    }
+                    for lat, lon, tec in zip(lats[inside].astype(np.float64).tolist(),
+                                             lons[inside].astype(np.float64).tolist(),
+                                             tecs[inside].astype(np.float64).tolist())
+                ]
         
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            tmp_file.write(content)
-            tmp_file.flush()
-            
-            points = []
-            with h5py.File(tmp_file.name, 'r') as f:
-                # Пытаемся найти стандартные датасеты
-                if 'latitude' in f and 'longitude' in f and 'tec' in f:
-                    lats = f['latitude'][:]
-                    lons = f['longitude'][:]
-                    tecs = f['tec'][:]
-                    
-                    for lat, lon, tec in zip(lats, lons, tecs):
-                        if is_point_in_polygon(lat, lon, polygon_points):
-                            points.append({
-                                'latitude': float(lat),
-                                'longitude': float(lon),
-                                'tec': float(tec),
-                                'index': 0.0,
-                                'timestamp': 'real_data',
-                                'source': 'simurg_hdf5',
-                                'quality': 'real'
-                            })
-            
-            return {
-                'points': points,
-                'metadata': {
-                    'source': 'hdf5_file',
-                    'file_type': 'h5',
-                    'valid_points': len(points)
-                }
+        return {
+            'points': points,
+            'metadata': {
+                'source': 'hdf5_file',
+                'file_type': 'h5',
+                'valid_points': len(points)
             }
+        }
     except Exception as e:
         print(f"Ошибка парсинга HDF5 файла: {e}")
         return None
 
 def parse_rinex_content(content, polygon_points, structure_type):
-    """Парсинг RINEX файлов"""
-    # Заглушка для RINEX файлов
-    return {
-        'points': [],
-        'metadata': {
-            'source': 'rinex_file',
-            'file_type': 'rinex',
-            'note': 'RINEX parsing not implemented'
+    """
+    Парсинг RINEX файлов наблюдений (RINEX 3, можно .gz)
+    
+    Наблюдения разбираются в массивы по спутникам (см. модуль rinex_obs) и
+    возвращаются в 'rinex' для расчёта TEC; точек карты файл наблюдений не даёт.
+    """
+    try:
+        obs = parse_rinex_obs(content)
+        lat, lon, height = obs.site_latlon()
+        in_polygon = bool(points_in_polygon([lat], [lon], polygon_points)[0]) if np.isfinite(lat) else False
+        return {
+            'points': [],
+            'rinex': obs,
+            'metadata': {
+                'source': 'rinex_file',
+                'file_type': 'rinex',
+                'marker_name': obs.marker_name,
+                'station_lat': lat,
+                'station_lon': lon,
+                'station_height': height,
+                'station_in_polygon': in_polygon,
+                'epochs': len(obs.epochs),
+                'satellites': len(obs.observations),
+                'obs_types': obs.obs_types
+            }
         }
-    }
+    except Exception as e:
+        print(f"Ошибка парсинга RINEX файла: {e}")
+        return None
 
 def parse_gim_content(content, polygon_points, structure_type):
-    """Парсинг GIM файлов"""
-    # Заглушка для GIM файлов
-    return {
-        'points': [],
-        'metadata': {
-            'source': 'gim_file',
-            'file_type': 'gim',
-            'note': 'GIM parsing not implemented'
+    """
+    Парсинг GIM файлов (IONEX)
+    
+    Возвращает узлы карт внутри полигона для всех эпох; сами карты - в 'gim'.
+    """
+    try:
+        gim = load_gim(content)
+        lat, lon = np.meshgrid(gim.lat, gim.lon, indexing='ij')
+        inside = points_in_polygon(lat, lon, polygon_points)
+        tec = gim.tec[:, inside]
+        epoch_idx, node_idx = np.nonzero(~np.isnan(tec))
+        epochs = gim.epochs.astype(str).tolist()
+        points = [
+            {
+                'latitude': la,
+                'longitude': lo,
+                'tec': value,
+                'index': 0.0,
+                'timestamp': epochs[e],
+                'source': 'gim',
+                'quality': 'model'
+            }
+            for la, lo, value, e in zip(lat[inside][node_idx].tolist(), lon[inside][node_idx].tolist(),
+                                        tec[epoch_idx, node_idx].astype(np.float64).tolist(), epoch_idx.tolist())
+        ]
+        
+        return {
+            'points': points,
+            'gim': gim,
+            'metadata': {
+                'source': 'gim_file',
+                'file_type': 'gim',
+                'maps': len(gim),
+                'grid': f"{len(gim.lat)}x{len(gim.lon)}",
+                'valid_points': len(points)
+            }
         }
-    }
+    except Exception as e:
+        print(f"Ошибка парсинга GIM файла: {e}")
+        return None
 
 def parse_tec_dat_file(content, polygon_points, structure_type):
     """Парсинг .dat файлов с TEC данными"""
@@ -989,14 +1072,28 @@ def parse_gim_file(gim_path):
     Обработка GIM (Global Ionosphere Map) файла
     
     Args:
-        gim_path: str - путь к GIM файлу
+        gim_path: str - путь к GIM файлу (IONEX, можно .gz)
     
     Returns:
-        dict - структурированные данные ионосферы
+        dict - структурированные данные ионосферы: карты 'gim' и метаданные
     """
-    # Функция заменена на parse_gim_file_content для работы с содержимым файлов
-    logger.warning("parse_gim_file устарела, используйте parse_gim_file_content")
-    return None
+    try:
+        gim = load_gim(Path(gim_path))
+        return {
+            'gim': gim,
+            'metadata': {
+                'source': 'gim_file',
+                'file_type': 'gim',
+                'maps': len(gim),
+                'start': str(gim.epochs[0]),
+                'end': str(gim.epochs[-1]),
+                'grid': f"{len(gim.lat)}x{len(gim.lon)}",
+                'height_km': gim.height
+            }
+        }
+    except Exception as e:
+        print(f"Ошибка чтения GIM файла {gim_path}: {e}")
+        return None
 
 def parse_text_ionosphere_file(file_path):
     """
@@ -1026,25 +1123,25 @@ def filter_data_by_polygon(data, polygon_points):
     if not data or not polygon_points or len(polygon_points) < 3:
         return data
     
+    points = data.get('points', [])
+    
+    # Фильтруем точки, которые находятся внутри полигона
+    lats = np.array([point.get('latitude', 0) for point in points], dtype=np.float64)
+    lons = np.array([point.get('longitude', 0) for point in points], dtype=np.float64)
+    inside = points_in_polygon(lats, lons, polygon_points, return_indices=True)
+    
     filtered_data = {
-        'points': [],
+        'points': [points[i] for i in inside],
         'metadata': data.get('metadata', {})
     }
     
-    # Фильтруем точки, которые находятся внутри полигона
-    for point in data.get('points', []):
-        lat = point.get('latitude', 0)
-        lon = point.get('longitude', 0)
-        if is_point_in_polygon(lat, lon, polygon_points):
-            filtered_data['points'].append(point)
-    
     logger.info(f"Отфильтровано {len(filtered_data['points'])} точек из {len(data.get('points', []))} по полигону")
     return filtered_data 
 
 def is_point_in_polygon(lat, lon, polygon):
     """
     Проверяет, находится ли точка внутри полигона
-    Использует алгоритм ray casting
+    Для массивов точек используйте polygon.points_in_polygon
     
     Args:
         lat (float): Широта точки
@@ -1054,24 +1151,7 @@ def is_point_in_polygon(lat, lon, polygon):
     Returns:
         bool: True если точка внутри полигона
     """
-    if len(polygon) < 3:
-        return False
-    
-    x, y = lon, lat
-    n = len(polygon)
-    inside = False
-    
-    j = n - 1
-    for i in range(n):
-        xi, yi = polygon[i][1], polygon[i][0]  # lon, lat
-        xj, yj = polygon[j][1], polygon[j][0]  # lon, lat
-        
-        # Проверяем пересечение луча с ребром полигона
-        if ((yi > y) != (yj > y)) and (x < (xj - xi) * (y - yi) / (yj - yi) + xi):
-            inside = not inside
-        j = i
-    
-    return inside
+    return bool(points_in_polygon([lat], [lon], polygon)[0])
 
 def filter_sips_by_polygon(sat_sips, polygon_coords, times):
     """
@@ -1088,26 +1168,23 @@ def filter_sips_by_polygon(sat_sips, polygon_coords, times):
     filtered_trajectories = {}
     
     for sat, sips in sat_sips.items():
-        trajectory = []
-        
-        for i, sip in enumerate(sips):
-            lat, lon = sip[0], sip[1]
-            
-            # Проверяем, находится ли точка внутри полигона
-            if is_point_in_polygon(lat, lon, polygon_coords):
-                time_obj = times[i] if i < len(times) else None
-                trajectory.append({
-                    'lat': lat,
-                    'lon': lon,
-                    'time': time_obj
-                })
+        # Все эпохи спутника проверяются одним вызовом
+        inside = points_in_polygon(sips[:, 0], sips[:, 1], polygon_coords, return_indices=True)
+        trajectory = [
+            {
+                'lat': sips[i, 0],
+                'lon': sips[i, 1],
+                'time': times[i] if i < len(times) else None
+            }
+            for i in inside
+        ]
         
         if trajectory:
             filtered_trajectories[sat] = trajectory
     
     return filtered_trajectories 
 
-def process_station_sips(station_code, date, polygon_points):
+def process_station_sips(station_code, date, polygon_points, elevation_cutoff=ELEVATION_CUTOFF_DEG, preloaded_nav_info=None):
     """
     Обрабатывает конкретную станцию - получает все SIP траектории, пересекающие полигон
     
@@ -1115,39 +1192,40 @@ def process_station_sips(station_code, date, polygon_points):
         station_code (str): Код станции (например, 'ERKG')
         date (datetime.date): Дата для обработки
         polygon_points (list): Список точек полигона [(lat, lon), ...]
+        elevation_cutoff (float): Маска по углу места в градусах
+        preloaded_nav_info (dict): предзагруженный nav (см. preloaded_nav_source)
     
     Returns:
         dict: Результат обработки с SIP траекториями или ошибкой
     """
-    import tempfile
-    from datetime import datetime, timedelta
-    
     print(f"🔄 Обработка станции {station_code.upper()} для даты {date}")
     
     try:
-        # 1. Получаем информацию о станции из API
+        # 1. Получаем информацию о станции из каталога (при отсутствии - из API)
         print(f"📡 Получение информации о станции {station_code.upper()}...")
         try:
-            station_url = f"https://api.simurg.space/sites/{station_code.lower()}"
-            station_response = requests.get(station_url, timeout=10)
-            station_response.raise_for_status()
-            
-            station_data = station_response.json()
-            
-            if 'location' not in station_data or 'lat' not in station_data['location'] or 'lon' not in station_data['location']:
-                return {
-                    'success': False,
-                    'error': f'Некорректные данные станции {station_code.upper()}: отсутствуют координаты',
-                    'station': station_code.upper()
+            station_info = load_catalog().get(station_code)
+            if station_info is None:
+                station_url = f"https://api.simurg.space/sites/{station_code.lower()}"
+                station_response = requests.get(station_url, timeout=10)
+                station_response.raise_for_status()
+                
+                station_data = station_response.json()
+                
+                if 'location' not in station_data or 'lat' not in station_data['location'] or 'lon' not in station_data['location']:
+                    return {
+                        'success': False,
+                        'error': f'Некорректные данные станции {station_code.upper()}: отсутствуют координаты',
+                        'station': station_code.upper()
+                    }
+                
+                station_info = {
+                    'lat': float(station_data['location']['lat']),
+                    'lon': float(station_data['location']['lon']),
+                    'name': station_code.upper(),
+                    'height': float(station_data['location'].get('height', 0.0))
                 }
             
-            station_info = {
-                'lat': float(station_data['location']['lat']),
-                'lon': float(station_data['location']['lon']),
-                'name': station_code.upper(),
-                'height': float(station_data['location'].get('height', 0.0))
-            }
-            
             print(f"✅ Станция найдена: {station_info['name']} ({station_info['lat']:.4f}°, {station_info['lon']:.4f}°, {station_info['height']:.1f}м)")
             
         except requests.exceptions.RequestException:
@@ -1165,148 +1243,95 @@ def process_station_sips(station_code, date, polygon_points):
         
         # 2. Загружаем навигационный файл
         print(f"📁 Загрузка навигационного файла для {date}...")
-        with tempfile.TemporaryDirectory() as temp_dir:
-            try:
-                nav_file_path = load_nav_file(datetime.combine(date, datetime.min.time()), temp_dir)
+        try:
+            nav_source = preloaded_nav_source(date, preloaded_nav_info)
+            if nav_source is not None:
+                nav_file_path = Path(preloaded_nav_info.get('path') or preloaded_nav_info.get('name', 'uploaded'))
+                print(f"📡 Используем предзагруженный nav-файл: {nav_file_path}")
+            else:
+                nav_source = nav_file_path = get_nav_file_for_date(date)
                 print(f"✅ Навигационный файл загружен: {nav_file_path}")
-            except Exception as e:
-                return {
-                    'success': False,
-                    'error': f'Не удалось загрузить nav-файл для {date}: {str(e)}',
-                    'station': station_code.upper(),
-                    'date': str(date)
-                }
-            
-            # 3. Определяем временной диапазон (весь день)
-            start_time = datetime.combine(date, datetime.min.time())
-            end_time = datetime.combine(date, datetime.max.time().replace(microsecond=0))
-            
-            print(f"⏰ Временной диапазон: {start_time} - {end_time}")
-            
-            # 4. Получаем координаты всех спутников из nav-файла
-            print(f"🛰️ Получение координат спутников из nav-файла...")
-            sats_xyz, times = get_sat_xyz(nav_file_path, start_time, end_time, GNSS_SATS, TIME_STEP_SECONDS)
-            
-            if not sats_xyz:
-                return {
-                    'success': False,
-                    'error': 'Не удалось получить координаты спутников из nav-файла',
-                    'station': station_code.upper(),
-                    'date': str(date)
-                }
-            
-            print(f"✅ Получены координаты для {len(sats_xyz)} спутников")
-            
-            # 5. Преобразуем координаты станции в XYZ (ECEF)
-            station_lat_rad = np.radians(station_info['lat'])
-            station_lon_rad = np.radians(station_info['lon'])
-            station_height = station_info['height']
-            
-            # Преобразование в ECEF координаты
-            N = RE / np.sqrt(1 - (2*0.003353 - 0.003353**2) * np.sin(station_lat_rad)**2)
-            station_xyz = (
-                (N + station_height) * np.cos(station_lat_rad) * np.cos(station_lon_rad),
-                (N + station_height) * np.cos(station_lat_rad) * np.sin(station_lon_rad),
-                (N * (1 - 0.003353**2) + station_height) * np.sin(station_lat_rad)
-            )
-            
-            print(f"📍 Координаты станции XYZ: ({station_xyz[0]:.0f}, {station_xyz[1]:.0f}, {station_xyz[2]:.0f})")
-            
-            # 6. Рассчитываем элевейшн/азимут для всех спутников
-            print(f"📐 Расчет углов элевейшн/азимут для всех спутников...")
-            sats_elaz = get_sat_elevation_azimuth(station_xyz, sats_xyz)
-            
-            if not sats_elaz:
-                return {
-                    'success': False,
-                    'error': f'Не удалось рассчитать углы для станции {station_code.upper()}',
-                    'station': station_code.upper()
-                }
-            
-            print(f"✅ Рассчитаны углы для {len(sats_elaz)} спутников")
-            
-            # 7. Рассчитываем SIP точки для всех спутников
-            print(f"🎯 Расчет SIP точек для всех спутников...")
-            sat_sips = get_sat_sips((station_info['lat'], station_info['lon']), sats_elaz)
-            
-            if not sat_sips:
-                return {
-                    'success': False,
-                    'error': f'Не удалось рассчитать SIP точки для станции {station_code.upper()}',
-                    'station': station_code.upper()
-                }
-            
-            print(f"✅ Рассчитаны SIP точки для {len(sat_sips)} спутников")
-            
-            # 8. Фильтруем SIP траектории по полигону
-            print(f"🔍 Фильтрация SIP траекторий по полигону...")
-            filtered_sips = filter_sips_by_polygon(sat_sips, polygon_points, times)
-            
-            # 9. Подсчитываем результаты
-            total_intersections = 0
-            satellites_with_intersections = []
-            all_trajectory_points = []
-            
-            for sat, trajectory in filtered_sips.items():
-                if trajectory and len(trajectory) > 0:
-                    total_intersections += len(trajectory)
-                    satellites_with_intersections.append(sat)
-                    
-                    # Добавляем точки траектории в общий список
-                    for i, point in enumerate(trajectory):
-                        # Получаем углы для данного времени
-                        elevation = float(sats_elaz[sat][i, 0]) if sat in sats_elaz and i < len(sats_elaz[sat]) else 0.0
-                        azimuth = float(sats_elaz[sat][i, 1]) if sat in sats_elaz and i < len(sats_elaz[sat]) else 0.0
-                        
-                        all_trajectory_points.append({
-                            'satellite': sat,
-                            'latitude': point['lat'],
-                            'longitude': point['lon'],
-                            'time': point['time'].isoformat() if 'time' in point else times[i].isoformat() if i < len(times) else '',
-                            'elevation': elevation,
-                            'azimuth': azimuth,
-                            'station': station_code.upper(),
-                            'station_name': station_info['name'],
-                            'station_lat': station_info['lat'],
-                            'station_lon': station_info['lon']
-                        })
-            
-            print(f"🎉 Обработка завершена!")
-            print(f"📊 Спутников с пересечениями: {len(satellites_with_intersections)} из {len(sats_xyz)}")
-            print(f"📊 Общее количество точек пересечения: {total_intersections}")
-            
-            if satellites_with_intersections:
-                print(f"🛰️ Спутники с пересечениями: {', '.join(satellites_with_intersections[:10])}")
-                if len(satellites_with_intersections) > 10:
-                    print(f"   ... и еще {len(satellites_with_intersections) - 10} спутников")
-            
+        except Exception as e:
             return {
-                'success': True,
-                'station': {
-                    'code': station_code.upper(),
-                    'name': station_info['name'],
-                    'lat': station_info['lat'],
-                    'lon': station_info['lon'],
-                    'height': station_info['height']
-                },
-                'date': str(date),
-                'satellites_total': len(sats_xyz),
-                'satellites_with_intersections': len(satellites_with_intersections),
-                'intersection_points': total_intersections,
-                'polygon_points_count': len(polygon_points),
-                'trajectory_points': all_trajectory_points,
-                'satellites_list': satellites_with_intersections,
-                'time_range': {
-                    'start': start_time.isoformat(),
-                    'end': end_time.isoformat()
-                },
-                'metadata': {
-                    'nav_file': str(nav_file_path),
-                    'source': 'nav_file + SIP_calculation',
-                    'processing_type': 'single_station'
-                }
+                'success': False,
+                'error': f'Не удалось загрузить nav-файл для {date}: {str(e)}',
+                'station': station_code.upper(),
+                'date': str(date)
             }
-            
+        
+        # 3. Определяем временной диапазон (весь день)
+        start_time = datetime.combine(date, datetime.min.time())
+        end_time = datetime.combine(date, datetime.max.time().replace(microsecond=0))
+        
+        print(f"⏰ Временной диапазон: {start_time} - {end_time}")
+        
+        # 4. Получаем координаты всех спутников из nav-файла
+        print(f"🛰️ Получение координат спутников из nav-файла...")
+        sats, sat_array, times = load_sat_xyz(nav_source, start_time, end_time)
+        
+        if not sats:
+            return {
+                'success': False,
+                'error': 'Не удалось получить координаты спутников из nav-файла',
+                'station': station_code.upper(),
+                'date': str(date)
+            }
+        
+        print(f"✅ Получены координаты для {len(sats)} спутников")
+        
+        # 5. Рассчитываем углы и SIP точки для всех спутников и эпох, оставляем точки внутри полигона
+        print(f"📐 Расчет углов элевейшн/азимут и SIP точек для всех спутников (маска {elevation_cutoff}°)...")
+        samples = station_intersections(
+            np.array([[station_info['lat'], station_info['lon']]]),
+            np.array([station_info['height']]),
+            sat_array,
+            polygon_points,
+            elevation_cutoff,
+            workers=1
+        )[0]
+        
+        # 6. Формируем точки траекторий в колоночном виде
+        sip_result = SipResult.from_stations([(station_code, station_info)], sats, times, [samples])
+        satellites_with_intersections = sip_result.satellites_with_points()
+        total_intersections = len(sip_result)
+        
+        print(f"🎉 Обработка завершена!")
+        print(f"📊 Спутников с пересечениями: {len(satellites_with_intersections)} из {len(sats)}")
+        print(f"📊 Общее количество точек пересечения: {total_intersections}")
+        
+        if satellites_with_intersections:
+            print(f"🛰️ Спутники с пересечениями: {', '.join(satellites_with_intersections[:10])}")
+            if len(satellites_with_intersections) > 10:
+                print(f"   ... и еще {len(satellites_with_intersections) - 10} спутников")
+        
+        return {
+            'success': True,
+            'station': {
+                'code': station_code.upper(),
+                'name': station_info['name'],
+                'lat': station_info['lat'],
+                'lon': station_info['lon'],
+                'height': station_info['height']
+            },
+            'date': str(date),
+            'satellites_total': len(sats),
+            'satellites_with_intersections': len(satellites_with_intersections),
+            'intersection_points': total_intersections,
+            'polygon_points_count': len(polygon_points),
+            'trajectory_points': sip_result.points,
+            'sip': sip_result,
+            'satellites_list': satellites_with_intersections,
+            'time_range': {
+                'start': start_time.isoformat(),
+                'end': end_time.isoformat()
+            },
+            'metadata': {
+                'nav_file': str(nav_file_path),
+                'source': 'nav_file + SIP_calculation',
+                'processing_type': 'single_station'
+            }
+        }
+        
     except Exception as e:
         print(f"❌ Критическая ошибка обработки станции {station_code.upper()}: {e}")
         return {
@@ -0,0 +1,343 @@
+"""
+Локальный каталог GNSS станций simurg.space.
+
+Координаты станций загружаются из API один раз пулом потоков через общую
+keep-alive сессию и сохраняются на диск компактной таблицей массивов
+(id, lat, lon, height). Последующие обновления запрашивают только новые
+идентификаторы, а все потребители читают каталог с диска за миллисекунды.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import requests
+from numpy.typing import NDArray
+from requests.adapters import HTTPAdapter
+
+from polygon import points_in_polygon, polygon_bbox
+
+SITES_API_URL = "https://api.simurg.space/sites/"
+CATALOG_FILE = Path("app_data") / "station_catalog.npz"
+CATALOG_MAX_AGE = 24 * 3600
+# После неудачного обновления API не запрашивается столько секунд, используется сохраненный каталог
+CATALOG_RETRY_INTERVAL = 15 * 60
+# Станции с некорректными координатами запрашиваются снова через столько секунд
+SKIPPED_RETRY_AGE = 7 * 24 * 3600
+FETCH_WORKERS = 16
+FETCH_TIMEOUT = 10
+GRID_CELL_DEG = 1.0
+
+
+class StationGridIndex:
+    """
+    Равномерная сетка по широте/долготе над станциями каталога.
+
+    Станции отсортированы по номеру ячейки, а cell_start хранит начало каждой
+    ячейки в этом порядке. Ячейки одной строки сетки идут подряд, поэтому
+    выборка по прямоугольнику - один срез на строку сетки.
+    """
+
+    def __init__(self, lat: NDArray, lon: NDArray, cell_deg: float = GRID_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.n_rows = int(np.ceil(180 / cell_deg))
+        self.n_cols = int(np.ceil(360 / cell_deg))
+        cells = self._rows(lat) * self.n_cols + self._cols(lon)
+        self.order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=self.n_rows * self.n_cols)
+        self.cell_start = np.concatenate([[0], np.cumsum(counts)])
+
+    def _rows(self, lat) -> NDArray:
+        return np.clip(((np.asarray(lat) + 90) // self.cell_deg).astype(np.int64), 0, self.n_rows - 1)
+
+    def _cols(self, lon) -> NDArray:
+        return np.clip(((np.asarray(lon) + 180) // self.cell_deg).astype(np.int64), 0, self.n_cols - 1)
+
+    def query_bbox(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> NDArray:
+        """
+        Индексы станций из ячеек, пересекающих прямоугольник (кандидаты, с запасом до ячейки).
+
+        lon_max > 180 означает прямоугольник через антимеридиан (см. polygon_bbox).
+        """
+        row0, row1 = self._rows([lat_min, lat_max])
+        rows = np.arange(row0, row1 + 1)
+        if lon_max - lon_min >= 360:
+            col_ranges = [(0, self.n_cols - 1)]
+        elif lon_max > 180:
+            col_ranges = [(self._cols(lon_min), self.n_cols - 1), (0, self._cols(lon_max - 360))]
+        else:
+            col_ranges = [tuple(self._cols([lon_min, lon_max]))]
+        slices = []
+        for col0, col1 in col_ranges:
+            starts = self.cell_start[rows * self.n_cols + col0]
+            ends = self.cell_start[rows * self.n_cols + col1 + 1]
+            slices.extend(self.order[s:e] for s, e in zip(starts, ends) if e > s)
+        if not slices:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(slices)
+
+
+@dataclass
+class StationCatalog:
+    """Таблица станций: идентификаторы и координаты в отдельных массивах."""
+    ids: NDArray
+    lat: NDArray
+    lon: NDArray
+    height: NDArray
+    # Идентификаторы, для которых API вернул некорректные координаты, и время проверки (Unix)
+    skipped: NDArray
+    skipped_at: NDArray
+    _index: StationGridIndex | None = field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def empty(cls) -> 'StationCatalog':
+        return cls(
+            ids=np.array([], dtype=str),
+            lat=np.array([], dtype=np.float64),
+            lon=np.array([], dtype=np.float64),
+            height=np.array([], dtype=np.float64),
+            skipped=np.array([], dtype=str),
+            skipped_at=np.array([], dtype=np.float64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def to_list(self) -> list[tuple]:
+        """Список кортежей (station_id, lat, lon), как возвращал get_all_stations."""
+        return list(zip(self.ids.tolist(), self.lat.tolist(), self.lon.tolist()))
+
+    def to_dict(self, indices=None) -> dict:
+        """Словарь {station_id: {'lat', 'lon', 'name', 'height'}} для выбранных строк каталога."""
+        if indices is None:
+            indices = np.arange(len(self.ids))
+        return {
+            str(self.ids[i]).lower(): {
+                'lat': float(self.lat[i]),
+                'lon': float(self.lon[i]),
+                'name': str(self.ids[i]).upper(),
+                'height': float(self.height[i]),
+            }
+            for i in indices
+        }
+
+    @property
+    def index(self) -> StationGridIndex:
+        """Пространственный индекс, строится один раз на загруженный каталог."""
+        if self._index is None:
+            self._index = StationGridIndex(self.lat, self.lon)
+        return self._index
+
+    def query_polygon(self, polygon) -> NDArray:
+        """
+        Индексы станций внутри полигона.
+
+        Сначала из сетки берутся кандидаты в ограничивающем прямоугольнике
+        полигона, затем для них выполняется векторизованная проверка.
+
+        Args:
+            polygon: список точек полигона [(lat, lon), ...]
+
+        Returns:
+            NDArray: индексы строк каталога
+        """
+        if len(polygon) < 3 or len(self) == 0:
+            return np.array([], dtype=np.int64)
+        candidates = self.index.query_bbox(*polygon_bbox(polygon))
+        mask = points_in_polygon(self.lat[candidates], self.lon[candidates], polygon)
+        return np.sort(candidates[mask])
+
+    def get(self, station_id: str) -> dict | None:
+        """Информация о станции по коду (без учёта регистра)."""
+        matches = np.nonzero(np.char.lower(self.ids) == station_id.lower())[0]
+        if len(matches) == 0:
+            return None
+        return next(iter(self.to_dict(matches[:1]).values()))
+
+    def save(self, path: Path = CATALOG_FILE) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.stem + '.tmp.npz')
+        np.savez(tmp, ids=self.ids, lat=self.lat, lon=self.lon, height=self.height, skipped=self.skipped,
+                 skipped_at=self.skipped_at)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path = CATALOG_FILE) -> 'StationCatalog':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                ids=data['ids'],
+                lat=data['lat'],
+                lon=data['lon'],
+                height=data['height'],
+                skipped=data['skipped'],
+                # В каталогах прежнего формата времени нет: такие станции будут запрошены снова
+                skipped_at=data['skipped_at'] if 'skipped_at' in data.files else np.zeros(len(data['skipped'])),
+            )
+
+    def expired_skipped(self, max_age: float = SKIPPED_RETRY_AGE) -> list[str]:
+        """Отброшенные станции, проверенные раньше max_age секунд назад."""
+        return self.skipped[self.skipped_at < time.time() - max_age].tolist()
+
+    def merged(self, rows: list[tuple], skipped: list[str], retried: list[str] = ()) -> 'StationCatalog':
+        """
+        Новый каталог с добавленными строками (station_id, lat, lon, height).
+
+        Args:
+            rows: новые станции
+            skipped: станции с некорректными координатами (время проверки - текущее)
+            retried: ранее отброшенные станции, запрошенные снова; их прежние записи удаляются
+        """
+        if not rows and not skipped and not len(retried):
+            return self
+        keep = ~np.isin(self.skipped, np.array(list(retried), dtype=str))
+        ids = np.concatenate([self.ids, np.array([r[0] for r in rows], dtype=str)])
+        lat = np.concatenate([self.lat, np.array([r[1] for r in rows], dtype=np.float64)])
+        lon = np.concatenate([self.lon, np.array([r[2] for r in rows], dtype=np.float64)])
+        height = np.concatenate([self.height, np.array([r[3] for r in rows], dtype=np.float64)])
+        order = np.argsort(ids, kind='stable')
+        return StationCatalog(
+            ids=ids[order],
+            lat=lat[order],
+            lon=lon[order],
+            height=height[order],
+            skipped=np.concatenate([self.skipped[keep], np.array(skipped, dtype=str)]),
+            skipped_at=np.concatenate([self.skipped_at[keep], np.full(len(skipped), time.time())]),
+        )
+
+
+def make_session(workers: int = FETCH_WORKERS) -> requests.Session:
+    """Сессия с пулом keep-alive соединений на workers потоков."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _fetch_station(session: requests.Session, station_id: str):
+    """Запрашивает координаты одной станции; None - некорректные данные."""
+    response = session.get(f"{SITES_API_URL}{station_id}", timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    location = data.get('location') if isinstance(data, dict) else None
+    if not isinstance(location, dict):
+        return None
+    try:
+        lat = float(location['lat'])
+        lon = float(location['lon'])
+        height = float(location.get('height') or 0.0)
+    except (KeyError, TypeError, ValueError):
+        # Нет координат, null или нечисловое значение - станция отбрасывается
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return (station_id, lat, lon, height)
+
+
+def fetch_stations(station_ids: list[str], session: requests.Session | None = None, workers: int = FETCH_WORKERS):
+    """
+    Параллельно загружает координаты станций.
+
+    Args:
+        station_ids: идентификаторы станций
+        session: общая HTTP-сессия (создаётся при необходимости)
+        workers: число потоков
+
+    Returns:
+        tuple: (список строк (id, lat, lon, height), список id с некорректными данными,
+            число сетевых ошибок)
+    """
+    session = session or make_session(workers)
+    rows, skipped, errors = [], [], 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_fetch_station, session, sid): sid for sid in station_ids}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except (requests.exceptions.RequestException, ValueError, TypeError):
+                # Сетевые ошибки не запоминаем - станция будет запрошена при следующем обновлении
+                errors += 1
+                continue
+            if row is None:
+                skipped.append(futures[future])
+            else:
+                rows.append(row)
+    return rows, skipped, errors
+
+
+def refresh_catalog(path: Path = CATALOG_FILE, workers: int = FETCH_WORKERS, full: bool = False) -> StationCatalog:
+    """
+    Обновляет каталог на диске, запрашивая только новые идентификаторы станций.
+
+    Args:
+        path: файл каталога
+        workers: число потоков загрузки
+        full: перезагрузить каталог целиком
+
+    Returns:
+        StationCatalog: обновленный каталог
+    """
+    path = Path(path)
+    catalog = StationCatalog.empty()
+    if path.exists() and not full:
+        catalog = StationCatalog.load(path)
+
+    session = make_session(workers)
+    response = session.get(SITES_API_URL, timeout=30)
+    response.raise_for_status()
+    all_ids = [str(sid) for sid in response.json()]
+
+    # Отброшенные давно станции запрашиваются снова: координаты в API могли исправить
+    retried = set(catalog.expired_skipped()) & set(all_ids)
+    known = (set(catalog.ids.tolist()) | set(catalog.skipped.tolist())) - retried
+    new_ids = [sid for sid in all_ids if sid not in known]
+    if new_ids:
+        print(f"📡 Загрузка {len(new_ids)} новых станций в каталог ({workers} потоков)...")
+        rows, skipped, errors = fetch_stations(new_ids, session, workers)
+        # Станции повторной проверки с сетевой ошибкой остаются отброшенными со старым временем
+        answered = {row[0] for row in rows} | set(skipped)
+        catalog = catalog.merged(rows, skipped, [sid for sid in retried if sid in answered])
+        if errors:
+            print(f"⚠️ Не удалось загрузить {errors} станций, они будут запрошены при следующем обновлении")
+    catalog.save(path)
+    print(f"✅ Каталог станций: {len(catalog)} станций")
+    return catalog
+
+
+_catalog: StationCatalog | None = None
+_catalog_lock = threading.Lock()
+# Время последней неудачной попытки обновления (time.monotonic)
+_last_failure: float | None = None
+
+
+def load_catalog(path: Path = CATALOG_FILE, refresh: bool = False) -> StationCatalog:
+    """
+    Каталог станций для текущего процесса.
+
+    Читает каталог с диска; если файла нет, он устарел (CATALOG_MAX_AGE) или
+    refresh=True, выполняет инкрементное обновление из API. При недоступности
+    API возвращается последняя сохраненная версия, а следующая попытка
+    обновления (кроме refresh=True) - не раньше чем через CATALOG_RETRY_INTERVAL.
+    """
+    global _catalog, _last_failure
+    path = Path(path)
+    with _catalog_lock:
+        stale = not path.exists() or time.time() - path.stat().st_mtime > CATALOG_MAX_AGE
+        if _catalog is not None and not refresh and not stale:
+            return _catalog
+        backoff = _last_failure is not None and time.monotonic() - _last_failure < CATALOG_RETRY_INTERVAL
+        if refresh or (stale and not backoff):
+            try:
+                _catalog = refresh_catalog(path)
+                _last_failure = None
+                return _catalog
+            except (requests.exceptions.RequestException, ValueError, TypeError) as e:
+                _last_failure = time.monotonic()
+                print(f"⚠️ Не удалось обновить каталог станций: {e}")
+        if _catalog is None:
+            _catalog = StationCatalog.load(path) if path.exists() else StationCatalog.empty()
+        return _catalog
@@ -0,0 +1,163 @@
+"""
+Потоковый разбор текстовых (.txt, .dat) файлов TEC: строки "lat lon tec ...".
+
+Данные читаются блоками фиксированного размера, граница блока сдвигается до
+последнего перевода строки. Каждый блок разбирается в массив (N, 3) одним
+вызовом NumPy, попадание в полигон проверяется маской по всему блоку, и
+наружу отдаются только попавшие в полигон строки. Память ограничена размером
+блока и не зависит от размера файла; точки внутри полигона хранятся массивом,
+а словари точек строит ленивое представление TecPoints.
+"""
+import os
+import warnings
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from polygon import points_in_polygon
+
+TEXT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def iter_chunks(source, chunk_size: int = TEXT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Блоки байтов из источника.
+
+    Args:
+        source: bytes, str (содержимое), путь (Path), двоичный файловый объект
+            с read() или итератор блоков байтов (например, response.iter_content())
+        chunk_size: размер блока
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size].tobytes()
+    elif isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size].encode('utf-8')
+    elif isinstance(source, os.PathLike):
+        with open(Path(source), 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+    elif hasattr(source, 'read'):
+        yield from iter(lambda: source.read(chunk_size), b'')
+    else:
+        yield from source
+
+
+def iter_lines_blocks(source, chunk_size: int = TEXT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Блоки из целых строк: хвост блока после последнего перевода строки переносится в следующий."""
+    tail = b''
+    for chunk in iter_chunks(source, chunk_size):
+        if not chunk:
+            continue
+        block = tail + chunk
+        cut = block.rfind(b'\n')
+        if cut < 0:
+            tail = block
+            continue
+        tail = block[cut + 1:]
+        yield block[:cut + 1]
+    if tail:
+        yield tail
+
+
+def _parse_rows_slow(lines: list[str]) -> NDArray:
+    """Построчный разбор блока с некорректными строками: такие строки пропускаются."""
+    rows = []
+    for line in lines:
+        if line.strip() and not line.startswith('#'):
+            parts = line.split()
+            if len(parts) >= 3:
+                try:
+                    rows.append((float(parts[0]), float(parts[1]), float(parts[2])))
+                except ValueError:
+                    continue
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def parse_block(block: bytes) -> NDArray:
+    """
+    Разбирает блок строк в массив (N, 3): широта, долгота, TEC.
+
+    Пустые строки и комментарии (#) пропускаются, лишние столбцы игнорируются.
+    Блок без ошибок разбирается парсером NumPy целиком; если в блоке есть
+    некорректные строки, он разбирается построчно.
+    """
+    lines = block.decode('utf-8', errors='replace').splitlines()
+    try:
+        with warnings.catch_warnings():
+            # Блок только из комментариев - не ошибка
+            warnings.simplefilter('ignore', UserWarning)
+            values = np.loadtxt(lines, dtype=np.float64, comments='#', usecols=(0, 1, 2), ndmin=2)
+        return values.reshape(-1, 3)
+    except ValueError:
+        return _parse_rows_slow(lines)
+
+
+def iter_tec_batches(source, polygon_points, chunk_size: int = TEXT_CHUNK_SIZE,
+                     stats: dict | None = None) -> Iterator[NDArray]:
+    """
+    Строки файла TEC внутри полигона, пачками по блокам.
+
+    Args:
+        source: источник данных, см. iter_chunks
+        polygon_points: список точек полигона [(lat, lon), ...]
+        chunk_size: размер блока чтения
+        stats: словарь, в который накапливаются 'lines' и 'rows' (все разобранные строки)
+
+    Yields:
+        NDArray: массив (N, 3) [широта, долгота, TEC] попавших в полигон строк блока
+    """
+    for block in iter_lines_blocks(source, chunk_size):
+        values = parse_block(block)
+        if stats is not None:
+            stats['lines'] = stats.get('lines', 0) + block.count(b'\n') + (not block.endswith(b'\n'))
+            stats['rows'] = stats.get('rows', 0) + len(values)
+        if len(values) == 0:
+            continue
+        inside = points_in_polygon(values[:, 0], values[:, 1], polygon_points)
+        if inside.any():
+            yield values[inside]
+
+
+def read_tec_points(source, polygon_points, chunk_size: int = TEXT_CHUNK_SIZE,
+                    stats: dict | None = None) -> NDArray:
+    """Все строки файла TEC внутри полигона одним массивом (N, 3) [широта, долгота, TEC]."""
+    batches = list(iter_tec_batches(source, polygon_points, chunk_size, stats))
+    return np.concatenate(batches) if batches else np.empty((0, 3), dtype=np.float64)
+
+
+class TecPoints(Sequence):
+    """Ленивая последовательность словарей точек поверх массива (N, 3), как SipPoints для SIP."""
+
+    def __init__(self, values: NDArray, source: str, timestamp: str, quality: str = 'real'):
+        self.values = values
+        self.source = source
+        self.timestamp = timestamp
+        self.quality = quality
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def point(self, i: int) -> dict:
+        lat, lon, tec = self.values[i].tolist()
+        return {
+            'latitude': lat,
+            'longitude': lon,
+            'tec': tec,
+            'index': 0.0,
+            'timestamp': self.timestamp,
+            'source': self.source,
+            'quality': self.quality
+        }
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.point(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.point(index)
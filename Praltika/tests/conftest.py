@@ -0,0 +1,5 @@
+"""Модули приложения лежат в корне Praltika, а не в пакете."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,195 @@
+"""Загрузчик против локального HTTP сервера: докачка, смена версии файла, проверки, сегменты."""
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloader
+from downloader import DownloadError, download_file
+
+DATA = bytes(range(256)) * 40  # 10240 байт
+
+
+class _FileServer(ThreadingHTTPServer):
+    """
+    Отдаёт data с поддержкой Range/If-Range; cut_after - оборвать следующий ответ после стольких байт,
+    fail_starts - начала диапазонов, на которые отвечать 404, delay - пауза между блоками по 256 байт.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _FileHandler)
+        self.data = DATA
+        self.etag = '"v1"'
+        self.ranges = True
+        self.cut_after = None
+        self.fail_starts = set()
+        self.delay = 0.0
+        self.paused = threading.Event()
+        self.requests = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/gen_file"
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', None, None))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.data)))
+        self.send_header('ETag', self.server.etag)
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        data = server.data
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        server.requests.append(('GET', range_header, if_range))
+        start, end = 0, len(data) - 1
+        partial = bool(range_header) and server.ranges and if_range in (None, server.etag)
+        if partial:
+            first, _, last = range_header.removeprefix('bytes=').partition('-')
+            start, end = int(first), int(last) if last else len(data) - 1
+        if start in server.fail_starts:
+            self.send_error(404)
+            return
+        body = data[start:end + 1]
+        self.send_response(206 if partial else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', server.etag)
+        if partial:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if server.cut_after is not None:
+            # Обрыв соединения посреди ответа
+            body, server.cut_after = body[:server.cut_after], None
+            self.close_connection = True
+        try:
+            if not server.delay:
+                self.wfile.write(body)
+                return
+            for offset in range(0, len(body), 256):
+                # time.sleep подменён фикстурой no_retry_delay
+                server.paused.wait(server.delay)
+                self.wfile.write(body[offset:offset + 256])
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент прервал загрузку
+            self.close_connection = True
+
+
+@pytest.fixture
+def server():
+    server = _FileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(downloader.time, 'sleep', lambda seconds: None)
+
+
+def test_single_segment_without_probe(server, tmp_path):
+    target = download_file(server.url, tmp_path / 'day.h5', chunk_size=1024)
+    assert target.read_bytes() == DATA
+    # Один запрос данных, без HEAD и без пробного Range bytes=0-0
+    assert server.requests == [('GET', None, None)]
+    assert not (tmp_path / 'day.h5.part').exists()
+    assert not (tmp_path / 'day.h5.part.json').exists()
+
+
+def test_resume_after_cut(server, tmp_path):
+    server.cut_after = 3000
+    with pytest.raises(DownloadError):
+        download_file(server.url, tmp_path / 'day.h5', chunk_size=1024, retries=0)
+    assert (tmp_path / 'day.h5.part.json').exists()
+
+    target = download_file(server.url, tmp_path / 'day.h5', chunk_size=1024)
+    assert target.read_bytes() == DATA
+    method, range_header, if_range = server.requests[-1]
+    assert range_header.startswith('bytes=') and range_header != 'bytes=0-'
+    assert if_range == '"v1"'
+
+
+def test_resume_within_retries(server, tmp_path):
+    server.cut_after = 5000
+    target = download_file(server.url, tmp_path / 'day.h5', chunk_size=1024, retries=2)
+    assert target.read_bytes() == DATA
+    assert len(server.requests) == 2 and server.requests[1][1] is not None
+
+
+def test_changed_validator_restarts(server, tmp_path):
+    server.cut_after = 3000
+    with pytest.raises(DownloadError):
+        download_file(server.url, tmp_path / 'day.h5', chunk_size=1024, retries=0)
+
+    # Файл на сервере изменился: If-Range не совпадает, сервер отвечает 200 целиком
+    server.data = DATA[::-1] + b'tail'
+    server.etag = '"v2"'
+    target = download_file(server.url, tmp_path / 'day.h5', chunk_size=1024)
+    assert target.read_bytes() == server.data
+
+
+def test_size_mismatch(server, tmp_path):
+    with pytest.raises(DownloadError, match='размер'):
+        download_file(server.url, tmp_path / 'day.h5', expected_size=len(DATA) + 1)
+    assert not (tmp_path / 'day.h5').exists()
+    assert not (tmp_path / 'day.h5.part').exists()
+
+
+def test_checksum(server, tmp_path):
+    with pytest.raises(DownloadError, match='контрольная сумма'):
+        download_file(server.url, tmp_path / 'day.h5', checksum='sha256:' + '0' * 64)
+    assert not (tmp_path / 'day.h5.part').exists()
+
+    digest = hashlib.sha256(DATA).hexdigest()
+    target = download_file(server.url, tmp_path / 'day.h5', checksum=f'sha256:{digest}')
+    assert target.read_bytes() == DATA
+
+
+def test_segmented(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, 'MIN_SEGMENT_SIZE', 1024)
+    progress = []
+    target = download_file(server.url, tmp_path / 'day.h5', segments=4, chunk_size=512,
+                           progress=lambda done, total: progress.append((done, total)))
+    assert target.read_bytes() == DATA
+    assert server.requests[0] == ('HEAD', None, None)
+    ranges = sorted(request[1] for request in server.requests[1:])
+    assert ranges == sorted(f"bytes={len(DATA) * i // 4}-{len(DATA) * (i + 1) // 4 - 1}" for i in range(4))
+    assert progress[-1] == (len(DATA), len(DATA))
+
+
+def test_segmented_without_range_support(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, 'MIN_SEGMENT_SIZE', 1024)
+    server.ranges = False
+    target = download_file(server.url, tmp_path / 'day.h5', segments=4)
+    assert target.read_bytes() == DATA
+    assert [request[0] for request in server.requests] == ['HEAD', 'GET']
+
+
+def test_segment_error_cancels_others(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, 'MIN_SEGMENT_SIZE', 1024)
+    # Один сегмент сразу получает 404, остальные отдаются медленно (~1 с на сегмент)
+    server.fail_starts = {len(DATA) // 4}
+    server.delay = 0.1
+    started = time.monotonic()
+    with pytest.raises(DownloadError, match='404'):
+        download_file(server.url, tmp_path / 'day.h5', segments=4, chunk_size=256)
+    # Остальные сегменты прерываются, не докачивая свои диапазоны
+    assert time.monotonic() - started < 0.6
+    assert (tmp_path / 'day.h5.part.json').exists()
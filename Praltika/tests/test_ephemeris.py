@@ -0,0 +1,118 @@
+"""Координаты по бортовым эфемеридам GPS, BeiDou GEO и ГЛОНАСС против эталона RTKLIB (satpos, EPHOPT_BRDC)."""
+import numpy as np
+import pytest
+
+from ephemeris import GPS_EPOCH, parse_nav
+
+GLO_MU = 398600.4418e9
+GLO_OMEGA = 7.292115e-5
+
+
+def _field(value: float) -> str:
+    return f"{value:19.12E}"
+
+
+def _record(sat: str, epoch: str, values: list[float]) -> list[str]:
+    """Запись RINEX 3 NAV: 'G05 yyyy mm dd hh mm ss', 3 поля в первой строке и по 4 в строках продолжения."""
+    lines = [f"{sat} {epoch}" + ''.join(_field(v) for v in values[:3])]
+    rest = values[3:]
+    for i in range(0, len(rest), 4):
+        lines.append('    ' + ''.join(_field(v) for v in rest[i:i + 4]))
+    return lines
+
+
+def _kepler(week: float, toe: float, sqrt_a: float, e: float, i0: float, omega0: float,
+            omega: float, m0: float) -> list[float]:
+    """Поля кеплеровской записи (часы, IODE..M0, Cuc..sqrtA, toe..Cis, i0..OmegaDot, IDOT..week, health, ttm)."""
+    return [1e-5, 1e-12, 0.0,
+            10.0, 30.5, 4.5e-9, m0,
+            1.5e-6, e, 8.2e-6, sqrt_a,
+            toe, 5e-8, omega0, -3e-8,
+            i0, 220.25, omega, -8.1e-9,
+            2e-10, 1.0, week, 0.0,
+            2.0, 0.0, -1e-8, 10.0,
+            toe - 30, 4.0]
+
+
+def _glonass_state() -> tuple[np.ndarray, np.ndarray]:
+    """Круговая орбита 25510 км с наклоном 64.8°: положение (км) и скорость (км/с) в ПЗ-90."""
+    radius, inc, node, u = 25510e3, np.radians(64.8), np.radians(40.0), np.radians(30.0)
+    pos = radius * np.array([
+        np.cos(node) * np.cos(u) - np.sin(node) * np.sin(u) * np.cos(inc),
+        np.sin(node) * np.cos(u) + np.cos(node) * np.sin(u) * np.cos(inc),
+        np.sin(u) * np.sin(inc),
+    ])
+    vel = np.sqrt(GLO_MU / radius) * np.array([
+        -np.cos(node) * np.sin(u) - np.sin(node) * np.cos(u) * np.cos(inc),
+        -np.sin(node) * np.sin(u) + np.cos(node) * np.cos(u) * np.cos(inc),
+        np.cos(u) * np.sin(inc),
+    ])
+    vel -= np.cross([0.0, 0.0, GLO_OMEGA], pos)
+    return pos / 1000, vel / 1000
+
+
+def _nav() -> bytes:
+    pos, vel = _glonass_state()
+    lines = [
+        f"{'     3.04           N: GNSS NAV DATA    M: MIXED':<60}RINEX VERSION / TYPE",
+        f"{'    18':<60}LEAP SECONDS",
+        f"{'':<60}END OF HEADER",
+    ]
+    # toe GPS: неделя 2348, 93600 с; BeiDou - неделя BDT 992, 93600 с BDT (= 93614 с GPS)
+    lines += _record('G05', '2025 01 06 02 00 00', _kepler(2348, 93600.0, 5153.62, 0.0112, 0.958, -1.23, 0.734, 2.1))
+    lines += _record('C01', '2025 01 06 02 00 00', _kepler(992, 93600.0, 6493.43, 3.1e-4, 0.0812, 2.95, -2.8, 1.3))
+    # ГЛОНАСС: эпоха в UTC (01:45:00 UTC = 01:45:18 GPS)
+    lines += _record('R01', '2025 01 06 01 45 00', [
+        2.5e-5, 9.1e-13, 93582.0,
+        pos[0], vel[0], 1.8e-9, 0.0,
+        pos[1], vel[1], -9.3e-10, 1.0,
+        pos[2], vel[2], -2.8e-9, 0.0,
+    ])
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+# Эталон: RTKLIB 2.4.3 satpos(EPHOPT_BRDC) по тому же файлу, м
+REFERENCE = {
+    'G05': ('2025-01-06T02:00:00', [
+        (0, [9405283.997, 24217283.645, 6215068.146]),
+        (900, [9315309.787, 24830017.782, 3459229.698]),
+        (-1800, [9565151.841, 22115341.560, 11365767.569]),
+    ]),
+    'C01': ('2025-01-06T02:00:14', [
+        (0, [25837825.236, 33312011.502, -509598.998]),
+        (900, [25843012.442, 33311163.977, -344308.372]),
+        (-1800, [25827314.373, 33311608.704, -832884.854]),
+    ]),
+    'R01': ('2025-01-06T01:45:18', [
+        (0, [13432829.313, 18360907.432, 11541069.054]),
+        (900, [12263205.223, 17277568.175, 14207711.127]),
+        (-900, [14266246.927, 19297832.155, 8650284.708]),
+    ]),
+}
+
+
+def test_parse_nav():
+    ephemeris = parse_nav(_nav())
+    assert ephemeris.satellites == ['C01', 'G05', 'R01']
+    assert ephemeris.leap_seconds == 18
+    toe = {sat: (GPS_EPOCH + np.timedelta64(int(ephemeris.toe[sat][0]), 's')).astype(str) for sat in ephemeris.toe}
+    assert toe == {sat: epoch for sat, (epoch, _) in REFERENCE.items()}
+
+
+@pytest.mark.parametrize('sat', sorted(REFERENCE))
+def test_positions_match_reference(sat):
+    ephemeris = parse_nav(_nav())
+    epoch, rows = REFERENCE[sat]
+    times = np.datetime64(epoch, 's') + np.array([dt for dt, _ in rows]).astype('timedelta64[s]')
+    xyz = ephemeris.positions([sat], times)[0]
+    np.testing.assert_allclose(xyz, [ref for _, ref in rows], rtol=0, atol=1.0)
+
+
+def test_stale_ephemeris_is_nan():
+    ephemeris = parse_nav(_nav())
+    # ГЛОНАСС действителен 1 ч от эпохи, GPS - 4 ч; неизвестный спутник - NaN
+    times = np.array(['2025-01-06T01:45:18', '2025-01-06T03:30:00'], dtype='datetime64[s]')
+    xyz = ephemeris.positions(['R01', 'G05', 'E01'], times)
+    assert not np.isnan(xyz[0, 0]).any() and np.isnan(xyz[0, 1]).all()
+    assert not np.isnan(xyz[1]).any()
+    assert np.isnan(xyz[2]).all()
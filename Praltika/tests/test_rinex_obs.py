@@ -0,0 +1,116 @@
+"""Разбор наблюдений RINEX 3 на небольшом синтетическом файле и знак TEC по коду и фазе."""
+import gzip
+
+import numpy as np
+import pytest
+
+from rinex_obs import FREQUENCIES, IONO_FACTOR, SPEED_OF_LIGHT, TECU, parse_rinex_obs, slant_tec
+
+F1, F2 = FREQUENCIES['G']['1'], FREQUENCIES['G']['2']
+RANGE = 22_000_000.0
+TEC = 20.0  # TECU
+
+
+def _header_line(content: str, label: str) -> str:
+    return f"{content:<60}{label}"
+
+
+def _obs_line(sat: str, values) -> str:
+    """Строка наблюдений: None - пустое поле."""
+    return sat + ''.join(' ' * 16 if v is None else f"{v:14.3f}  " for v in values)
+
+
+def _epoch_line(second: float, flag: int, count: int) -> str:
+    return f"> 2025 01 05 00 00{second:11.7f}  {flag}{count:3d}"
+
+
+def _delays() -> tuple[float, float]:
+    """Ионосферные задержки на L1 и L2 для TEC, м."""
+    return IONO_FACTOR * TEC * TECU / F1 ** 2, IONO_FACTOR * TEC * TECU / F2 ** 2
+
+
+def _rinex() -> bytes:
+    d1, d2 = _delays()
+    # Код задерживается, фаза опережает
+    c1, c2 = RANGE + d1, RANGE + d2
+    l1, l2 = (RANGE - d1) * F1 / SPEED_OF_LIGHT, (RANGE - d2) * F2 / SPEED_OF_LIGHT
+    lines = [
+        _header_line("     3.04           OBSERVATION DATA    M", "RINEX VERSION / TYPE"),
+        _header_line("TEST", "MARKER NAME"),
+        _header_line(f"{1113194.9:14.4f}{0.0:14.4f}{6259542.9:14.4f}", "APPROX POSITION XYZ"),
+        _header_line("G    4 C1C L1C C2W L2W", "SYS / # / OBS TYPES"),
+        _header_line("E    2 C1C C5Q", "SYS / # / OBS TYPES"),
+        _header_line("    30.000", "INTERVAL"),
+        _header_line("", "END OF HEADER"),
+        _epoch_line(0.0, 0, 2),
+        _obs_line("G05", [c1, l1, c2, l2]),
+        _obs_line("E11", [RANGE, RANGE + 1.0]),
+        # Событие (флаг 4): следующие строки - записи заголовка, не наблюдения
+        _epoch_line(15.0, 4, 2),
+        _header_line("G05 COMMENT THAT LOOKS LIKE DATA", "COMMENT"),
+        _header_line("E11 ANOTHER COMMENT", "COMMENT"),
+        _epoch_line(30.0, 0, 1),
+        # Пустое поле C2W и обрезанная строка без L2W
+        _obs_line("G05", [c1, l1, None]),
+    ]
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def test_epochs_and_header():
+    obs = parse_rinex_obs(_rinex())
+    assert obs.marker_name == 'TEST'
+    assert obs.interval == 30.0
+    assert obs.obs_types == {'G': ['C1C', 'L1C', 'C2W', 'L2W'], 'E': ['C1C', 'C5Q']}
+    # Эпоха события пропущена вместе со своими строками
+    assert obs.epochs.tolist() == [np.datetime64('2025-01-05T00:00:00.000'), np.datetime64('2025-01-05T00:00:30.000')]
+    assert obs.satellites == ['E11', 'G05']
+    assert obs.epoch_index['G05'].tolist() == [0, 1]
+    assert obs.epoch_index['E11'].tolist() == [0]
+    lat, lon, height = obs.site_latlon()
+    assert 79 < lat < 81 and abs(lon) < 1e-9
+
+
+def test_blank_fields_are_nan():
+    obs = parse_rinex_obs(_rinex())
+    g05 = obs.observations['G05']
+    assert not np.isnan(g05['C2W'][0])
+    assert np.isnan(g05['C2W'][1]) and np.isnan(g05['L2W'][1])
+    assert g05['C1C'][1] == pytest.approx(RANGE + _delays()[0], abs=1e-3)
+
+
+def test_observable_and_system_selection():
+    obs = parse_rinex_obs(_rinex(), observables=['C1C', 'C2W'], systems='G')
+    assert obs.satellites == ['G05']
+    assert set(obs.observations['G05']) == {'C1C', 'C2W'}
+
+    obs = parse_rinex_obs(_rinex(), observables={'E': ['C5Q']})
+    assert obs.observations['G05'] == {}
+    assert list(obs.observations['E11']) == ['C5Q']
+    assert obs.observations['E11']['C5Q'][0] == pytest.approx(RANGE + 1.0)
+
+
+def test_gzip_source(tmp_path):
+    path = tmp_path / 'test.rnx.gz'
+    path.write_bytes(gzip.compress(_rinex()))
+    assert parse_rinex_obs(path).satellites == ['E11', 'G05']
+
+
+def test_slant_tec_sign_code_and_phase():
+    obs = parse_rinex_obs(_rinex())
+    code = slant_tec(obs, 'G05', 'C1C', 'C2W')
+    phase = slant_tec(obs, 'G05', 'L1C', 'L2W')
+    # И по коду, и по фазе TEC положителен и равен заданному
+    assert code[0] == pytest.approx(TEC, abs=0.05)
+    assert phase[0] == pytest.approx(TEC, abs=0.05)
+    assert np.isnan(code[1]) and np.isnan(phase[1])
+
+
+def test_slant_tec_unknown_frequency():
+    obs = parse_rinex_obs(_rinex())
+    with pytest.raises(ValueError, match='ГЛОНАСС'):
+        slant_tec(obs, 'R01', 'C1C', 'C2C')
+    with pytest.raises(ValueError, match='диапазон'):
+        slant_tec(obs, 'G05', 'C1C', 'C9X')
+    # Частоты, переданные явно, используются вместо таблицы
+    tec = slant_tec(obs, 'G05', 'C1C', 'C2W', frequencies=(F1, F2))
+    assert tec[0] == pytest.approx(TEC, abs=0.05)